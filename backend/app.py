@@ -1,6 +1,63 @@
-from fastapi import FastAPI
+import asyncio
+import importlib
+import os
+import time
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from routes import predict, recipes
+from fastapi.responses import JSONResponse, PlainTextResponse
+from routes import pantry, predict, recipes
+from services import (
+    cv_service,
+    gemini_service,
+    nutrition_service,
+    recipe_service,
+    upstream_http,
+)
+from services.cache_service import analysis_cache
+from services.circuit_breaker import OPEN, breaker_states
+from services.image_pool import ImagePoolFull, image_pool
+from services.rate_limiter import limiter_states
+from services.metrics_service import (
+    HTTP_REQUEST_DURATION,
+    registry,
+    server_timing,
+    start_request_trace,
+)
+from services.upload_service import UploadLimitMiddleware
+
+# How the Gemini and Roboflow clients are built at startup: "background"
+# builds them while requests are already accepted, "blocking" before the
+# first request, "off" on first use only
+WARM_UP_CLIENTS = os.getenv("WARM_UP_CLIENTS", "background").lower()
+
+
+def warm_up_clients():
+    """Import the SDKs and NumPy and build both upstream clients (blocking)."""
+    importlib.import_module("numpy")
+    gemini_service.get_model()
+    cv_service.get_client()
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # Seed and load the nutrition and recipe caches before the first request
+    await asyncio.to_thread(nutrition_service.warm_up)
+    await asyncio.to_thread(recipe_service.warm_up)
+
+    warm_up = None
+    if WARM_UP_CLIENTS == "blocking":
+        await asyncio.to_thread(warm_up_clients)
+    elif WARM_UP_CLIENTS == "background":
+        # A request arriving first waits on the same client locks instead
+        warm_up = asyncio.create_task(asyncio.to_thread(warm_up_clients))
+    yield
+    if warm_up is not None and not warm_up.done():
+        warm_up.cancel()
+    await upstream_http.aclose()
+    image_pool.shutdown()
+
 
 app = FastAPI(
     title="FreshCam - AI-Powered Fruit Freshness & Recipe Assistant",
@@ -11,8 +68,13 @@ app = FastAPI(
         "url": "https://github.com/DhruvParashar246/FreshCam",
         "email": "krishm.imp@gmail.com",
     },
+    lifespan=lifespan,
 )
 
+app.add_middleware(
+    UploadLimitMiddleware,
+    batch_files={"/predict/batch": predict.PREDICT_BATCH_MAX_FILES},
+)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -22,6 +84,37 @@ app.add_middleware(
 )
 
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    spans = start_request_trace()
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+
+    route = request.scope.get("route")
+    HTTP_REQUEST_DURATION.observe(
+        elapsed,
+        method=request.method,
+        route=route.path if route is not None else "unmatched",
+        status=response.status_code,
+    )
+    # Streaming responses send headers before later stages finish, so their
+    # header only covers the stages completed up to that point
+    if spans:
+        response.headers["Server-Timing"] = server_timing(spans)
+    return response
+
+
+@app.exception_handler(ImagePoolFull)
+async def image_pool_full(request: Request, exc: ImagePoolFull):
+    # Shed load early: the client retries shortly instead of queueing here
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Server is busy processing images, please retry"},
+        headers={"Retry-After": "1"},
+    )
+
+
 @app.get("/")
 def test_route():
     return {
@@ -30,14 +123,55 @@ def test_route():
         "endpoints": {
             "POST /predict": "Analyze fruit ripeness",
             "POST /predict?include_recipes=true": "Analyze fruit + get recipes",
+            "POST /predict/stream": "Analyze fruit, streaming each stage as NDJSON",
+            "POST /predict/batch": "Analyze many images, streamed as NDJSON",
             "POST /recipes": "Get recipe suggestions and food safety info",
+            "POST /pantry/scan": "Analyze a fruit photo and add it to the pantry",
+            "GET /pantry": "List pantry items (POST/PATCH/DELETE to manage them)",
+            "GET /pantry/expiring": "Pantry items expiring soon, soonest first",
+            "GET /cache/stats": "Analysis cache hit/miss counters",
+            "GET /health": "Upstream circuit breaker states",
+            "GET /metrics": "Prometheus metrics (stage latencies, cache, fallbacks)",
             "GET /docs": "Interactive API documentation",
         },
     }
 
 
+@app.get("/cache/stats")
+def cache_stats():
+    return analysis_cache.stats()
+
+
+@app.get("/health")
+def health():
+    """
+    Service health and the circuit breaker state of each upstream.
+
+    "degraded" means at least one upstream circuit is open and its requests
+    are being served by the fallback path.
+    """
+    breakers = breaker_states()
+    degraded = any(breaker["state"] == OPEN for breaker in breakers.values())
+    return {
+        "status": "degraded" if degraded else "ok",
+        "roboflow_configured": cv_service.get_client() is not None,
+        "breakers": breakers,
+        "image_pool": image_pool.stats(),
+        "rate_limits": limiter_states(),
+        "upstream_pool": upstream_http.pool_stats(),
+    }
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    return PlainTextResponse(
+        registry.render(), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
+
 app.include_router(predict.router)
 app.include_router(recipes.router)
+app.include_router(pantry.router)
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,433 @@
+"""
+Benchmark harness for the prediction pipeline.
+
+Gemini and Roboflow are replaced by stand-ins that replay the recorded
+responses in benchmarks/recordings.json after a configurable latency, so runs
+need no API keys and are repeatable. Requests are driven through the ASGI app
+in-process with httpx at each requested concurrency level, using the sample
+images in backend/images/.
+
+Usage (from backend/):
+    python benchmarks/bench_predict.py
+    python benchmarks/bench_predict.py --endpoints predict recipes \\
+        --concurrency 1 8 32 --requests 64 --gemini-latency 0.8
+    python benchmarks/bench_predict.py --compare benchmarks/results/<old>.json
+
+Each run is written to benchmarks/results/ as JSON; --compare prints the
+throughput and p95 change against an earlier run.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from pathlib import Path
+
+import httpx
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from app import app
+from db import db_utils
+from services import (
+    circuit_breaker,
+    cv_service,
+    gemini_service,
+    latency_service,
+    logging_service,
+    nutrition_service,
+    rate_limiter,
+    recipe_service,
+)
+from services.cache_service import analysis_cache
+
+BENCH_DIR = Path(__file__).parent
+RECORDINGS_PATH = BENCH_DIR / "recordings.json"
+RESULTS_DIR = BENCH_DIR / "results"
+IMAGES_DIR = backend_path / "images"
+
+DEFAULT_CACHE_SIZE = analysis_cache.max_entries
+
+ENDPOINTS = {
+    "predict": "/predict",
+    "predict_recipes": "/predict?include_recipes=true",
+    "predict_safety": "/predict?include_safety=true",
+    "recipes": "/recipes",
+}
+
+
+class LatencyModel:
+    """Fixed latency with uniform +/- jitter (as a fraction of the base)."""
+
+    def __init__(self, seconds, jitter, rng):
+        self.seconds = seconds
+        self.jitter = jitter
+        self.rng = rng
+
+    def sample(self):
+        if self.seconds <= 0:
+            return 0.0
+        return self.seconds * (1 + self.jitter * self.rng.uniform(-1, 1))
+
+
+class ReplayResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class ReplayGeminiModel:
+    """Stand-in for genai.GenerativeModel answering from recorded responses."""
+
+    def __init__(self, recordings, latency):
+        self.recordings = recordings
+        self.latency = latency
+        self.calls = 0
+
+    def _answer(self, contents):
+        self.calls += 1
+        prompt = contents[0] if isinstance(contents, list) else contents
+        for entry in self.recordings:
+            if not prompt.startswith(entry["prompt_prefix"]):
+                continue
+            if "contains" in entry and entry["contains"] not in prompt:
+                continue
+            if "per_image" in entry:
+                count = len(contents) - 1
+                return ReplayResponse(json.dumps([entry["per_image"]] * count))
+            return ReplayResponse(entry["response"])
+        raise ValueError(f"No recorded response for prompt: {prompt[:60]!r}")
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.latency.sample())
+        return self._answer(contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.latency.sample())
+        return self._answer(contents)
+
+
+class ReplayRoboflowClient:
+    """Stand-in for RoboflowClient returning a recorded inference result."""
+
+    def __init__(self, recording, latency):
+        self.recording = recording
+        self.latency = latency
+        self.calls = 0
+
+    def _answer(self, inference_input):
+        self.calls += 1
+        if isinstance(inference_input, list):
+            return [json.loads(json.dumps(self.recording)) for _ in inference_input]
+        return json.loads(json.dumps(self.recording))
+
+    def infer(self, inference_input, model_id=None):
+        time.sleep(self.latency.sample())
+        return self._answer(inference_input)
+
+    async def infer_async(self, inference_input, model_id=None):
+        await asyncio.sleep(self.latency.sample())
+        return self._answer(inference_input)
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(pct / 100 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def load_images():
+    images = sorted(IMAGES_DIR.glob("*.jpg"))
+    if not images:
+        raise SystemExit(f"No sample images found in {IMAGES_DIR}")
+    return [(path.name, path.read_bytes()) for path in images]
+
+
+def reset_state(use_cache):
+    """Start every scenario from empty caches."""
+    analysis_cache.clear()
+    latency_service.reset_trackers()
+    circuit_breaker.reset_breakers()
+    rate_limiter.reset_limiters()
+    # A zero-sized cache evicts on insert, so every request runs the pipeline
+    analysis_cache.max_entries = DEFAULT_CACHE_SIZE if use_cache else 0
+    nutrition_service.clear_memory()
+    recipe_service.clear_memory()
+
+
+async def run_scenario(endpoint, concurrency, total_requests, images, warmup):
+    url = ENDPOINTS[endpoint]
+    latencies = []
+    errors = 0
+    next_index = 0
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench", timeout=None
+    ) as client:
+
+        async def send(index):
+            name, data = images[index % len(images)]
+            start = time.perf_counter()
+            response = await client.post(
+                url, files={"file": (name, data, "image/jpeg")}
+            )
+            return time.perf_counter() - start, response
+
+        for index in range(warmup):
+            await send(index)
+
+        async def worker():
+            nonlocal next_index, errors
+            while next_index < total_requests:
+                index = next_index
+                next_index += 1
+                elapsed, response = await send(index)
+                latencies.append(elapsed)
+                if response.status_code != 200 or "error" in response.json():
+                    errors += 1
+
+        cpu_start = time.process_time()
+        wall_start = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        wall = time.perf_counter() - wall_start
+        cpu = time.process_time() - cpu_start
+
+    latencies.sort()
+    return {
+        "requests": total_requests,
+        "errors": errors,
+        "wall_seconds": round(wall, 4),
+        "throughput_rps": round(total_requests / wall, 3),
+        "latency_ms": {
+            "mean": round(sum(latencies) / len(latencies) * 1000, 2),
+            "p50": round(percentile(latencies, 50) * 1000, 2),
+            "p95": round(percentile(latencies, 95) * 1000, 2),
+            "p99": round(percentile(latencies, 99) * 1000, 2),
+            "max": round(latencies[-1] * 1000, 2),
+        },
+        "cpu_ms_per_request": round(cpu / total_requests * 1000, 3),
+    }
+
+
+def peak_rss_mb():
+    # ru_maxrss is KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(peak / divisor, 2)
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=backend_path,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_benchmarks(args):
+    recordings = json.loads(Path(args.recordings).read_text(encoding="utf-8"))
+    rng = random.Random(args.seed)
+    gemini = ReplayGeminiModel(
+        recordings["gemini"], LatencyModel(args.gemini_latency, args.jitter, rng)
+    )
+    roboflow = ReplayRoboflowClient(
+        recordings["roboflow"], LatencyModel(args.roboflow_latency, args.jitter, rng)
+    )
+    gemini_service.model = gemini
+    cv_service.CLIENT = None if args.no_roboflow else roboflow
+    # Replayed responses have no quota; measure the pipeline, not the budget
+    rate_limiter.GEMINI_RATE_LIMIT_RPM = 0
+    images = load_images()
+
+    scenarios = []
+    for endpoint in args.endpoints:
+        for concurrency in args.concurrency:
+            reset_state(args.cache)
+            gemini.calls = roboflow.calls = 0
+            if args.trace_memory:
+                tracemalloc.start()
+
+            result = await run_scenario(
+                endpoint, concurrency, args.requests, images, args.warmup
+            )
+
+            result.update(
+                {
+                    "endpoint": endpoint,
+                    "concurrency": concurrency,
+                    "gemini_calls": gemini.calls,
+                    "roboflow_calls": roboflow.calls,
+                    "peak_rss_mb": peak_rss_mb(),
+                }
+            )
+            if args.trace_memory:
+                result["peak_traced_mb"] = round(
+                    tracemalloc.get_traced_memory()[1] / (1024 * 1024), 2
+                )
+                tracemalloc.stop()
+
+            scenarios.append(result)
+            print(format_result(result))
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "git_revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "images": [name for name, _ in images],
+            "settings": {
+                "requests": args.requests,
+                "warmup": args.warmup,
+                "gemini_latency": args.gemini_latency,
+                "roboflow_latency": args.roboflow_latency,
+                "jitter": args.jitter,
+                "seed": args.seed,
+                "cache": args.cache,
+                "roboflow": not args.no_roboflow,
+            },
+        },
+        "scenarios": scenarios,
+    }
+
+
+def format_result(result):
+    latency = result["latency_ms"]
+    return (
+        f"{result['endpoint']:<16} c={result['concurrency']:<3} "
+        f"{result['throughput_rps']:>8.2f} req/s  "
+        f"p50 {latency['p50']:>8.1f}ms  p95 {latency['p95']:>8.1f}ms  "
+        f"p99 {latency['p99']:>8.1f}ms  "
+        f"cpu {result['cpu_ms_per_request']:>7.2f}ms/req  "
+        f"rss {result['peak_rss_mb']:.0f}MB  errors {result['errors']}"
+    )
+
+
+def compare(baseline, current):
+    """Print throughput and p95 changes for scenarios present in both runs."""
+    previous = {
+        (scenario["endpoint"], scenario["concurrency"]): scenario
+        for scenario in baseline["scenarios"]
+    }
+    print(f"\nCompared with {baseline['meta'].get('git_revision') or 'baseline'}:")
+    for scenario in current["scenarios"]:
+        old = previous.get((scenario["endpoint"], scenario["concurrency"]))
+        if old is None:
+            continue
+        throughput = _change(old["throughput_rps"], scenario["throughput_rps"])
+        p95 = _change(old["latency_ms"]["p95"], scenario["latency_ms"]["p95"])
+        cpu = _change(old["cpu_ms_per_request"], scenario["cpu_ms_per_request"])
+        print(
+            f"{scenario['endpoint']:<16} c={scenario['concurrency']:<3} "
+            f"throughput {throughput}  p95 {p95}  cpu/req {cpu}"
+        )
+
+
+def _change(old, new):
+    if not old:
+        return "n/a"
+    return f"{(new - old) / old * 100:+.1f}%"
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--endpoints",
+        nargs="+",
+        choices=sorted(ENDPOINTS),
+        default=["predict", "recipes"],
+    )
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=48, help="per scenario")
+    parser.add_argument("--warmup", type=int, default=2, help="untimed requests")
+    parser.add_argument("--gemini-latency", type=float, default=0.6, help="seconds")
+    parser.add_argument("--roboflow-latency", type=float, default=0.25, help="seconds")
+    parser.add_argument("--jitter", type=float, default=0.2, help="fraction of latency")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--cache", action="store_true", help="keep the analysis cache enabled"
+    )
+    parser.add_argument(
+        "--no-roboflow", action="store_true", help="run without the Roboflow stand-in"
+    )
+    parser.add_argument(
+        "--trace-memory", action="store_true", help="also record tracemalloc peaks"
+    )
+    parser.add_argument(
+        "--log-level", default="WARNING", help="service log level during the run"
+    )
+    parser.add_argument("--recordings", default=str(RECORDINGS_PATH))
+    parser.add_argument(
+        "--output", help="result file (default: results/<timestamp>.json)"
+    )
+    parser.add_argument("--compare", help="earlier result file to compare against")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # The services log every request; keep that out of the timings
+    logging_service.configure_logging(level=args.log_level)
+
+    saved = (
+        gemini_service.model,
+        cv_service.CLIENT,
+        db_utils.DB_PATH,
+        nutrition_service.NUTRITION_SEED_PATH,
+        recipe_service.RECIPE_SEED_PATH,
+    )
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Keep nutrition and recipe lookups off the real database and
+            # seed files
+            db_utils.DB_PATH = os.path.join(tmp_dir, "bench.sqlite")
+            nutrition_service.NUTRITION_SEED_PATH = os.path.join(
+                tmp_dir, "no_seed.json"
+            )
+            recipe_service.RECIPE_SEED_PATH = os.path.join(tmp_dir, "no_seed.json")
+            report = asyncio.run(run_benchmarks(args))
+    finally:
+        (
+            gemini_service.model,
+            cv_service.CLIENT,
+            db_utils.DB_PATH,
+            nutrition_service.NUTRITION_SEED_PATH,
+            recipe_service.RECIPE_SEED_PATH,
+        ) = saved
+        reset_state(use_cache=True)
+        logging_service.configure_logging()
+
+    output = (
+        Path(args.output)
+        if args.output
+        else (RESULTS_DIR / f"bench-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    print(f"\n✓ Results saved to {output}")
+
+    if args.compare:
+        compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), report)
+
+
+if __name__ == "__main__":
+    main()
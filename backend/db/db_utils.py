@@ -0,0 +1,380 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DB_PATH = os.getenv(
+    "FRESHCAM_DB_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "freshcam.sqlite"),
+)
+
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS nutrition_cache (
+        fruit_name TEXT NOT NULL,
+        ripeness TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (fruit_name, ripeness)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS recipe_library (
+        fruit_name TEXT NOT NULL,
+        ripeness TEXT NOT NULL,
+        payload TEXT NOT NULL,
+        updated_at REAL NOT NULL,
+        PRIMARY KEY (fruit_name, ripeness)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS pantry_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id TEXT NOT NULL,
+        fruit_name TEXT NOT NULL,
+        ripeness TEXT NOT NULL,
+        days_until_discard INTEGER,
+        image_hash TEXT,
+        scanned_at REAL NOT NULL,
+        expires_at REAL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    # Token buckets shared by every worker process (see services.rate_limiter)
+    """
+    CREATE TABLE IF NOT EXISTS rate_buckets (
+        name TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """,
+    # Newest-first listing per user
+    """
+    CREATE INDEX IF NOT EXISTS idx_pantry_user_scanned
+    ON pantry_items (user_id, scanned_at DESC)
+    """,
+    # Expiry queue per user: "expiring soon" is a range scan over this index
+    # in expiry order, never a scan of the user's whole pantry
+    """
+    CREATE INDEX IF NOT EXISTS idx_pantry_user_expires
+    ON pantry_items (user_id, expires_at)
+    WHERE expires_at IS NOT NULL
+    """,
+]
+
+PANTRY_COLUMNS = (
+    "id",
+    "user_id",
+    "fruit_name",
+    "ripeness",
+    "days_until_discard",
+    "image_hash",
+    "scanned_at",
+    "expires_at",
+    "updated_at",
+)
+_PANTRY_SELECT = f"SELECT {', '.join(PANTRY_COLUMNS)} FROM pantry_items"
+
+SECONDS_PER_DAY = 24 * 3600
+
+# One connection per (thread, database file); sqlite3 connections must not be
+# shared across threads
+_local = threading.local()
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+
+def get_connection(db_path=None):
+    """
+    Return this thread's connection to the database, creating the schema on
+    first use of a database file.
+    """
+    path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+
+    conn = connections.get(path)
+    if conn is None:
+        conn = sqlite3.connect(path)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        connections[path] = conn
+
+    if path not in _initialized_paths:
+        with _init_lock:
+            if path not in _initialized_paths:
+                with conn:
+                    for statement in SCHEMA:
+                        conn.execute(statement)
+                _initialized_paths.add(path)
+
+    return conn
+
+
+# Tables of payloads keyed by (fruit_name, ripeness); see
+# services.library_store
+LIBRARY_TABLES = ("nutrition_cache", "recipe_library")
+
+
+def _library_table(table):
+    if table not in LIBRARY_TABLES:
+        raise ValueError(f"Unknown library table: {table}")
+    return table
+
+
+def get_library_entry(table, fruit_name, ripeness):
+    """
+    Fetch a stored payload from a library table.
+
+    Returns:
+        tuple: (payload dict, updated_at unix timestamp) or None
+    """
+    row = (
+        get_connection()
+        .execute(
+            f"SELECT payload, updated_at FROM {_library_table(table)}"
+            " WHERE fruit_name = ? AND ripeness = ?",
+            (fruit_name, ripeness),
+        )
+        .fetchone()
+    )
+    if row is None:
+        return None
+    return json.loads(row["payload"]), row["updated_at"]
+
+
+def save_library_entry(
+    table, fruit_name, ripeness, payload, updated_at=None, replace=True
+):
+    """
+    Store a payload in a library table.
+
+    Args:
+        replace: If False, an existing row is left untouched (used for seeding)
+    """
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            f"{verb} INTO {_library_table(table)}"
+            " (fruit_name, ripeness, payload, updated_at) VALUES (?, ?, ?, ?)",
+            (
+                fruit_name,
+                ripeness,
+                json.dumps(payload),
+                updated_at if updated_at is not None else time.time(),
+            ),
+        )
+
+
+def list_library(table, limit=None):
+    """Return a library table's rows, most recently updated first."""
+    query = (
+        "SELECT fruit_name, ripeness, payload, updated_at"
+        f" FROM {_library_table(table)} ORDER BY updated_at DESC"
+    )
+    params = ()
+    if limit is not None:
+        query += " LIMIT ?"
+        params = (limit,)
+    return [
+        (
+            row["fruit_name"],
+            row["ripeness"],
+            json.loads(row["payload"]),
+            row["updated_at"],
+        )
+        for row in get_connection().execute(query, params)
+    ]
+
+
+def _expires_at(scanned_at, days_until_discard):
+    if days_until_discard is None:
+        return None
+    return scanned_at + days_until_discard * SECONDS_PER_DAY
+
+
+def insert_pantry_item(
+    user_id,
+    fruit_name,
+    ripeness,
+    days_until_discard=None,
+    image_hash=None,
+    scanned_at=None,
+):
+    """
+    Store a scanned fruit in a user's pantry.
+
+    Returns:
+        dict: The stored row (see PANTRY_COLUMNS)
+    """
+    now = time.time()
+    scanned_at = scanned_at if scanned_at is not None else now
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "INSERT INTO pantry_items (user_id, fruit_name, ripeness,"
+            " days_until_discard, image_hash, scanned_at, expires_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                user_id,
+                fruit_name,
+                ripeness,
+                days_until_discard,
+                image_hash,
+                scanned_at,
+                _expires_at(scanned_at, days_until_discard),
+                now,
+            ),
+        )
+    return get_pantry_item(user_id, cursor.lastrowid)
+
+
+def get_pantry_item(user_id, item_id):
+    """Return one of a user's pantry rows as a dict, or None."""
+    row = (
+        get_connection()
+        .execute(f"{_PANTRY_SELECT} WHERE id = ? AND user_id = ?", (item_id, user_id))
+        .fetchone()
+    )
+    return dict(row) if row is not None else None
+
+
+def list_pantry_items(user_id, limit=100, offset=0):
+    """Return a user's pantry rows, most recently scanned first."""
+    return [
+        dict(row)
+        for row in get_connection().execute(
+            f"{_PANTRY_SELECT} WHERE user_id = ?"
+            " ORDER BY scanned_at DESC LIMIT ? OFFSET ?",
+            (user_id, limit, offset),
+        )
+    ]
+
+
+def list_expiring_pantry_items(user_id, before, limit=50):
+    """
+    Return a user's pantry rows expiring at or before `before` (unix time),
+    soonest first. Already expired items are included.
+    """
+    return [
+        dict(row)
+        for row in get_connection().execute(
+            f"{_PANTRY_SELECT} WHERE user_id = ? AND expires_at <= ?"
+            " ORDER BY expires_at LIMIT ?",
+            (user_id, before, limit),
+        )
+    ]
+
+
+def update_pantry_item(user_id, item_id, **fields):
+    """
+    Update fruit_name, ripeness and/or days_until_discard of a pantry row.
+
+    The expiry is recomputed from the original scan time when
+    days_until_discard changes.
+
+    Returns:
+        dict: The updated row, or None if the item does not exist
+    """
+    item = get_pantry_item(user_id, item_id)
+    if item is None:
+        return None
+
+    item.update(
+        {
+            key: value
+            for key, value in fields.items()
+            if key in ("fruit_name", "ripeness", "days_until_discard")
+        }
+    )
+    item["expires_at"] = _expires_at(item["scanned_at"], item["days_until_discard"])
+    item["updated_at"] = time.time()
+
+    conn = get_connection()
+    with conn:
+        conn.execute(
+            "UPDATE pantry_items SET fruit_name = ?, ripeness = ?,"
+            " days_until_discard = ?, expires_at = ?, updated_at = ?"
+            " WHERE id = ? AND user_id = ?",
+            (
+                item["fruit_name"],
+                item["ripeness"],
+                item["days_until_discard"],
+                item["expires_at"],
+                item["updated_at"],
+                item_id,
+                user_id,
+            ),
+        )
+    return item
+
+
+def delete_pantry_item(user_id, item_id):
+    """Delete a pantry row. Returns True if it existed."""
+    conn = get_connection()
+    with conn:
+        cursor = conn.execute(
+            "DELETE FROM pantry_items WHERE id = ? AND user_id = ?", (item_id, user_id)
+        )
+    return cursor.rowcount > 0
+
+
+def _update_rate_bucket(name, capacity, refill_per_second, update):
+    # BEGIN IMMEDIATE takes the write lock up front, so concurrent workers
+    # can't both read the same token count and spend it twice
+    now = time.time()
+    conn = get_connection()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        row = conn.execute(
+            "SELECT tokens, updated_at FROM rate_buckets WHERE name = ?", (name,)
+        ).fetchone()
+        if row is None:
+            tokens = capacity
+        else:
+            elapsed = max(0.0, now - row["updated_at"])
+            tokens = min(capacity, row["tokens"] + elapsed * refill_per_second)
+        result, tokens = update(tokens)
+        conn.execute(
+            "INSERT OR REPLACE INTO rate_buckets (name, tokens, updated_at)"
+            " VALUES (?, ?, ?)",
+            (name, tokens, now),
+        )
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    return result, tokens
+
+
+def take_rate_token(name, capacity, refill_per_second, floor=0.0, cost=1):
+    """
+    Refill a shared token bucket and take `cost` tokens from it, unless that
+    would leave fewer than `floor`.
+
+    Returns:
+        tuple: (taken, tokens left)
+    """
+
+    def take(tokens):
+        taken = tokens - cost >= floor
+        return taken, tokens - cost if taken else tokens
+
+    return _update_rate_bucket(name, capacity, refill_per_second, take)
+
+
+def drain_rate_bucket(name, capacity, refill_per_second, seconds):
+    """Empty a shared token bucket so it stays empty for about `seconds`."""
+
+    def drain(tokens):
+        return None, min(tokens, -seconds * refill_per_second)
+
+    _update_rate_bucket(name, capacity, refill_per_second, drain)
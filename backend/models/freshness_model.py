@@ -0,0 +1,153 @@
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SECONDS_PER_DAY = 24 * 3600
+
+# NumPy is imported inside the functions below, on the first estimate, to
+# keep it out of the app's import time
+
+STORAGE_CONDITIONS = ("room", "fridge")
+# Where fruit usually sits when the user doesn't say
+DEFAULT_STORAGE = "room"
+
+# The table lists, per fruit and storage condition, the days until discard
+# for fruit scanned at the start of each ripeness stage, plus one decay
+# curve shape (freshness % at 0%, 10%, ... 100% of the shelf life) shared by
+# every fruit. Fruits missing from the table use its "default" row.
+FRESHNESS_TABLE_PATH = os.getenv(
+    "FRESHNESS_TABLE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "freshness_table.json"),
+)
+
+_table = None
+
+
+def load_table(path=None):
+    """
+    Load the freshness lookup table.
+
+    Returns:
+        dict: {"stages", "fruits", "default", "decay_curve" (ndarray)}
+    """
+    import numpy as np
+
+    with open(path or FRESHNESS_TABLE_PATH, encoding="utf-8") as table_file:
+        raw = json.load(table_file)
+
+    return {
+        "stages": list(raw["stages"]),
+        "fruits": raw["fruits"],
+        "default": raw["default"],
+        "decay_curve": np.asarray(raw["decay_curve"], dtype=np.float32),
+    }
+
+
+def get_table():
+    """Return the table loaded from FRESHNESS_TABLE_PATH (cached)."""
+    global _table
+    if _table is None:
+        _table = load_table()
+    return _table
+
+
+def _fruit_row(table, fruit_name):
+    name = (fruit_name or "").strip().lower()
+    fruits = table["fruits"]
+    if name in fruits:
+        return fruits[name]
+    # "strawberries", "cherries"
+    if name.endswith("ies") and name[:-3] + "y" in fruits:
+        return fruits[name[:-3] + "y"]
+    # "bananas", "grapes"
+    if name.endswith("s") and name[:-1] in fruits:
+        return fruits[name[:-1]]
+    return table["default"]
+
+
+def _stage_position(stages, ripeness, confidence):
+    """
+    Continuous position on the ripeness axis (0 = unripe ... 2 = overripe).
+
+    An uncertain call is nudged towards the riper neighbour, so low
+    confidence errs on the side of an earlier discard date.
+    """
+    index = stages.index(ripeness) if ripeness in stages else stages.index("ripe")
+    certainty = min(max(confidence / 100.0, 0.0), 1.0)
+    return min(index + (1.0 - certainty) * 0.5, len(stages) - 1)
+
+
+def estimate_freshness(
+    fruit_name,
+    ripeness,
+    confidence=100.0,
+    storage=DEFAULT_STORAGE,
+    scanned_at=None,
+    now=None,
+):
+    """
+    Estimate shelf life and a decay curve from the lookup table, locally.
+
+    Days until discard are interpolated between the ripeness stages of the
+    fruit's row, and the remaining freshness follows the shared decay curve
+    from the point the fruit has already reached.
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: "unripe", "ripe" or "overripe"
+        confidence: Ripeness confidence in percent
+        storage: One of STORAGE_CONDITIONS
+        scanned_at: Unix timestamp of the scan (defaults to now); time since
+                    then is already used up
+        now: Unix timestamp to measure from (defaults to the current time)
+
+    Returns:
+        dict: {"storage", "days_remaining", "discard_date" (ISO date, UTC),
+               "freshness" (% now), "decay_curve": [{"day", "freshness"}, ...]}
+    """
+    import numpy as np
+
+    if storage not in STORAGE_CONDITIONS:
+        raise ValueError(f"storage must be one of {STORAGE_CONDITIONS}, not {storage}")
+
+    table = get_table()
+    stages = table["stages"]
+    days_by_stage = _fruit_row(table, fruit_name)[storage]
+
+    now = time.time() if now is None else now
+    scanned_at = now if scanned_at is None else scanned_at
+    elapsed_days = max(0.0, (now - scanned_at) / SECONDS_PER_DAY)
+
+    position = _stage_position(stages, ripeness, confidence)
+    days_at_scan = float(np.interp(position, range(len(stages)), days_by_stage))
+    days_remaining = max(0.0, days_at_scan - elapsed_days)
+
+    # Share of the whole shelf life (from unripe) already used up; the curve
+    # continues from there until the discard date
+    shelf_life = float(days_by_stage[0])
+    curve = table["decay_curve"]
+    curve_x = np.linspace(0.0, 1.0, len(curve))
+    used = 1.0 - days_remaining / shelf_life
+    days = np.arange(0, math.ceil(days_remaining) + 1, dtype=np.float32)
+    progress = np.clip(used + days / shelf_life, 0.0, 1.0)
+    freshness = np.interp(progress, curve_x, curve)
+
+    discard_at = now + days_remaining * SECONDS_PER_DAY
+    return {
+        "storage": storage,
+        "days_remaining": round(days_remaining, 1),
+        "discard_date": datetime.fromtimestamp(discard_at, timezone.utc)
+        .date()
+        .isoformat(),
+        "freshness": round(float(freshness[0]), 1),
+        "decay_curve": [
+            {"day": int(day), "freshness": round(float(value), 1)}
+            for day, value in zip(days, freshness)
+        ],
+    }
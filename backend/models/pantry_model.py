@@ -0,0 +1,55 @@
+import time
+from typing import List, Literal, Optional
+
+from db.db_utils import SECONDS_PER_DAY
+from pydantic import BaseModel, Field
+
+Ripeness = Literal["unripe", "ripe", "overripe", "unknown"]
+
+
+class PantryItemCreate(BaseModel):
+    """A scanned fruit to add to the pantry."""
+
+    fruit_name: str = Field(min_length=1, max_length=64)
+    ripeness: Ripeness = "ripe"
+    days_until_discard: Optional[int] = Field(default=None, ge=0, le=365)
+    image_hash: Optional[str] = Field(default=None, max_length=128)
+    scanned_at: Optional[float] = Field(
+        default=None, description="Unix timestamp of the scan (defaults to now)"
+    )
+
+
+class PantryItemUpdate(BaseModel):
+    """Fields a user can correct after a scan."""
+
+    fruit_name: Optional[str] = Field(default=None, min_length=1, max_length=64)
+    ripeness: Optional[Ripeness] = None
+    days_until_discard: Optional[int] = Field(default=None, ge=0, le=365)
+
+
+class PantryItem(BaseModel):
+    id: int
+    user_id: str
+    fruit_name: str
+    ripeness: str
+    days_until_discard: Optional[int]
+    image_hash: Optional[str]
+    scanned_at: float
+    expires_at: Optional[float]
+    updated_at: float
+    days_remaining: Optional[float] = Field(
+        default=None, description="Days left until expires_at (negative once expired)"
+    )
+
+    @classmethod
+    def from_row(cls, row, now=None):
+        days_remaining = None
+        if row["expires_at"] is not None:
+            now = now if now is not None else time.time()
+            days_remaining = round((row["expires_at"] - now) / SECONDS_PER_DAY, 2)
+        return cls(**row, days_remaining=days_remaining)
+
+
+class PantryList(BaseModel):
+    items: List[PantryItem]
+    count: int
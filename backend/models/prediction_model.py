@@ -0,0 +1,233 @@
+from typing import List, Literal, Optional
+
+from pydantic import BaseModel, field_validator
+
+RIPENESS_STAGES = ("unripe", "ripe", "overripe")
+# Ripeness when there is no fruit to judge (or the answer names no stage)
+UNKNOWN_RIPENESS = "unknown"
+# Confidence assumed when the model gives none (or an unreadable one)
+DEFAULT_CONFIDENCE = 70.0
+
+# Longest first so "overripe" / "unripe" win over the "ripe" inside them
+_STAGE_ORDER = ("overripe", "unripe", "ripe")
+
+
+def _as_text(value):
+    if isinstance(value, list):
+        return " ".join(str(item) for item in value)
+    return value
+
+
+def _as_number(value):
+    if isinstance(value, str):
+        value = value.strip().rstrip("%").strip()
+    return value
+
+
+# --- What Gemini returns -----------------------------------------------------
+#
+# These models validate parsed model output. They are lenient on purpose:
+# unknown keys are ignored, numbers may arrive as strings, and values out of
+# range are clamped rather than rejected, so small deviations from the prompt
+# don't cost a retry or a fallback.
+
+
+class FruitAnalysis(BaseModel):
+    """Fruit name, ripeness and confidence from one image."""
+
+    fruit_name: str = "unknown"
+    ripeness: Literal["unripe", "ripe", "overripe", "unknown"] = UNKNOWN_RIPENESS
+    confidence: float = DEFAULT_CONFIDENCE
+
+    @field_validator("fruit_name", mode="before")
+    @classmethod
+    def _clean_name(cls, value):
+        return str(value or "unknown").strip().lower() or "unknown"
+
+    @field_validator("ripeness", mode="before")
+    @classmethod
+    def _clean_ripeness(cls, value):
+        text = str(value or "").strip().lower()
+        if text in RIPENESS_STAGES:
+            return text
+        # "Overripe (brown spots)" and the like; no stage is made up when
+        # the answer names none (e.g. "unknown" for a photo without fruit)
+        return next(
+            (stage for stage in _STAGE_ORDER if stage in text), UNKNOWN_RIPENESS
+        )
+
+    @field_validator("confidence", mode="before")
+    @classmethod
+    def _clean_confidence(cls, value):
+        try:
+            return round(min(max(float(_as_number(value)), 0.0), 100.0), 2)
+        except (TypeError, ValueError):
+            return DEFAULT_CONFIDENCE
+
+
+class StorageTips(BaseModel):
+    storage_tips: Optional[str] = None
+
+    @field_validator("storage_tips", mode="before")
+    @classmethod
+    def _clean_tips(cls, value):
+        return _as_text(value) or None
+
+
+class FoodSafety(StorageTips):
+    """Image-specific safety and shelf-life fields."""
+
+    is_safe_to_eat: Optional[bool] = None
+    days_until_discard: Optional[int] = None
+
+    @field_validator("days_until_discard", mode="before")
+    @classmethod
+    def _clean_days(cls, value):
+        try:
+            return max(0, min(int(float(_as_number(value))), 14))
+        except (TypeError, ValueError):
+            return None
+
+
+class SafetyAnalysis(FruitAnalysis, FoodSafety):
+    """FruitAnalysis plus the food safety fields."""
+
+
+class Recipe(BaseModel):
+    name: str
+    difficulty: Optional[str] = None
+    prep_time: Optional[str] = None
+    cook_time: Optional[str] = None
+    why_this_ripeness: Optional[str] = None
+    ingredients: Optional[List[str]] = None
+    instructions: Optional[str] = None
+
+    @field_validator("instructions", mode="before")
+    @classmethod
+    def _join_steps(cls, value):
+        return _as_text(value)
+
+
+class RecipeSet(StorageTips):
+    """A recipe library entry for one (fruit, ripeness)."""
+
+    recipes: List[Recipe] = []
+
+    @field_validator("recipes", mode="before")
+    @classmethod
+    def _drop_unnamed(cls, value):
+        # One malformed recipe shouldn't cost the whole answer
+        if not isinstance(value, list):
+            return []
+        return [item for item in value if isinstance(item, dict) and item.get("name")]
+
+
+class RecipeAnalysis(FoodSafety, RecipeSet):
+    """Answer to the full image recipe prompt."""
+
+    fruit_name: Optional[str] = None
+    ripeness: Optional[str] = None
+
+
+class NutritionFacts(BaseModel):
+    calories: Optional[float] = None
+    carbs_g: Optional[float] = None
+    fiber_g: Optional[float] = None
+    sugar_g: Optional[float] = None
+    protein_g: Optional[float] = None
+    vitamin_c_percent: Optional[float] = None
+    potassium_mg: Optional[float] = None
+
+
+class EnvironmentalImpact(BaseModel):
+    carbon_footprint_kg: Optional[float] = None
+    water_usage_liters: Optional[float] = None
+    sustainability_rating: Optional[str] = None
+    local_season: Optional[str] = None
+
+
+class NutritionInfo(BaseModel):
+    fruit_name: Optional[str] = None
+    serving_size: Optional[str] = None
+    nutrition: Optional[NutritionFacts] = None
+    health_benefits: List[str] = []
+    environmental_impact: Optional[EnvironmentalImpact] = None
+    waste_reduction_tip: Optional[str] = None
+
+
+# --- What the API returns ----------------------------------------------------
+
+
+class BoundingBox(BaseModel):
+    """Box corners as fractions (0..1) of the upright photo's width/height."""
+
+    x_min: float
+    y_min: float
+    x_max: float
+    y_max: float
+
+
+class Detection(BaseModel):
+    """One fruit found in a multi-fruit photo."""
+
+    fruit_name: str
+    ripeness: str
+    confidence: float
+    box: BoundingBox
+
+
+class Explanation(BaseModel):
+    """Color-map summary behind a ripeness call, averaged over fruit pixels."""
+
+    ripeness_score: float
+    color_deviation: float
+    blemish_ratio: float
+    fruit_coverage: float
+    overlay_png: Optional[str] = None
+
+
+class FreshnessPoint(BaseModel):
+    day: int
+    freshness: float
+
+
+class FreshnessEstimate(BaseModel):
+    """Shelf life estimated locally from the freshness lookup table."""
+
+    storage: str
+    days_remaining: float
+    discard_date: str
+    freshness: float
+    decay_curve: List[FreshnessPoint] = []
+
+
+class PredictionResponse(BaseModel):
+    """/predict result; fields that were not requested are left out."""
+
+    fruit_name: Optional[str] = None
+    ripeness: Optional[str] = None
+    confidence: Optional[float] = None
+    source: Optional[str] = None
+    error: Optional[str] = None
+    is_safe_to_eat: Optional[bool] = None
+    days_until_discard: Optional[int] = None
+    storage_tips: Optional[str] = None
+    recipes: Optional[List[Recipe]] = None
+    nutrition: Optional[NutritionFacts] = None
+    health_benefits: Optional[List[str]] = None
+    environmental_impact: Optional[EnvironmentalImpact] = None
+    waste_reduction_tip: Optional[str] = None
+    detections: Optional[List[Detection]] = None
+    explanation: Optional[Explanation] = None
+    freshness: Optional[FreshnessEstimate] = None
+    # Requested sections left out because they couldn't be produced in time
+    degraded: Optional[List[str]] = None
+
+
+class RecipesResponse(BaseModel):
+    fruit_name: str = "unknown"
+    ripeness: str = "unknown"
+    is_safe_to_eat: Optional[bool] = None
+    days_until_discard: Optional[int] = None
+    storage_tips: Optional[str] = None
+    recipes: List[Recipe] = []
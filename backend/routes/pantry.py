@@ -1,7 +1,153 @@
-from fastapi import APIRouter, File, UploadFile
+import asyncio
+import time
 
-router = APIRouter()
+from db import db_utils
+from fastapi import APIRouter, File, HTTPException, Query, Response, UploadFile
+from models.freshness_model import estimate_freshness
+from models.pantry_model import (
+    PantryItem,
+    PantryItemCreate,
+    PantryItemUpdate,
+    PantryList,
+)
+from services.cache_service import get_or_compute_async
+from services.cv_service import analyze_image_async
+from services.image_pool import ImagePoolFull, image_pool
+from services.logging_service import get_logger
+from services.upload_service import UploadRoute, read_upload
 
-@router.post("/pantry")
-def pantry():
-    return {"message": "Pantry..."}
\ No newline at end of file
+router = APIRouter(route_class=UploadRoute)
+logger = get_logger("routes.pantry")
+
+DEFAULT_USER = "default"
+
+
+def _user_query():
+    return Query(default=DEFAULT_USER, min_length=1, max_length=64)
+
+
+def _item_or_404(row):
+    if row is None:
+        raise HTTPException(status_code=404, detail="Pantry item not found")
+    return PantryItem.from_row(row)
+
+
+@router.post("/pantry", response_model=PantryItem, status_code=201)
+async def add_pantry_item(item: PantryItemCreate, user_id: str = _user_query()):
+    """Add a scanned fruit (e.g. a /predict result) to the user's pantry."""
+    row = await asyncio.to_thread(
+        db_utils.insert_pantry_item, user_id, **item.model_dump()
+    )
+    return PantryItem.from_row(row)
+
+
+@router.post("/pantry/scan", response_model=PantryItem, status_code=201)
+async def scan_into_pantry(file: UploadFile = File(...), user_id: str = _user_query()):
+    """
+    Analyze a fruit photo and add it to the pantry in one step.
+
+    Uses the same cached analysis as /predict?include_safety=true, so the
+    stored item gets Gemini's days_until_discard estimate; without one, the
+    local freshness estimate is used, as on /predict.
+    """
+    image_bytes = await read_upload(file)
+    if len(image_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    try:
+        image = await image_pool.decode(image_bytes)
+    except ImagePoolFull:
+        raise
+    except Exception as e:
+        logger.warning("Could not decode image in /pantry/scan: %s", e)
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
+    result = await get_or_compute_async(
+        image,
+        "analysis_safety",
+        lambda: analyze_image_async(image, include_safety=True),
+    )
+    if "error" in result:
+        raise HTTPException(status_code=502, detail=result["error"])
+
+    fruit_name = result.get("fruit_name", "unknown")
+    ripeness = result.get("ripeness", "unknown")
+    days_until_discard = result.get("days_until_discard")
+    if days_until_discard is None and fruit_name != "unknown":
+        confidence = result.get("confidence")
+        if confidence is None:
+            confidence = 100.0
+        freshness = estimate_freshness(fruit_name, ripeness, confidence)
+        days_until_discard = int(freshness["days_remaining"])
+
+    row = await asyncio.to_thread(
+        db_utils.insert_pantry_item,
+        user_id,
+        fruit_name=fruit_name,
+        ripeness=ripeness,
+        days_until_discard=days_until_discard,
+        image_hash=image.sha256,
+    )
+    return PantryItem.from_row(row)
+
+
+@router.get("/pantry", response_model=PantryList)
+async def list_pantry(
+    user_id: str = _user_query(),
+    limit: int = Query(default=100, ge=1, le=500),
+    offset: int = Query(default=0, ge=0),
+):
+    """List the user's pantry, most recently scanned first."""
+    rows = await asyncio.to_thread(db_utils.list_pantry_items, user_id, limit, offset)
+    now = time.time()
+    items = [PantryItem.from_row(row, now) for row in rows]
+    return PantryList(items=items, count=len(items))
+
+
+@router.get("/pantry/expiring", response_model=PantryList)
+async def list_expiring(
+    user_id: str = _user_query(),
+    within_days: float = Query(default=2, ge=0, le=365),
+    limit: int = Query(default=50, ge=1, le=500),
+):
+    """
+    Items that expire within `within_days` (already expired ones included),
+    soonest first. Items without a days_until_discard estimate never appear.
+    """
+    now = time.time()
+    rows = await asyncio.to_thread(
+        db_utils.list_expiring_pantry_items,
+        user_id,
+        now + within_days * db_utils.SECONDS_PER_DAY,
+        limit,
+    )
+    items = [PantryItem.from_row(row, now) for row in rows]
+    return PantryList(items=items, count=len(items))
+
+
+@router.get("/pantry/{item_id}", response_model=PantryItem)
+async def get_pantry_item(item_id: int, user_id: str = _user_query()):
+    row = await asyncio.to_thread(db_utils.get_pantry_item, user_id, item_id)
+    return _item_or_404(row)
+
+
+@router.patch("/pantry/{item_id}", response_model=PantryItem)
+async def update_pantry_item(
+    item_id: int, changes: PantryItemUpdate, user_id: str = _user_query()
+):
+    """Correct a scanned item; changing days_until_discard moves its expiry."""
+    row = await asyncio.to_thread(
+        db_utils.update_pantry_item,
+        user_id,
+        item_id,
+        **changes.model_dump(exclude_unset=True),
+    )
+    return _item_or_404(row)
+
+
+@router.delete("/pantry/{item_id}", status_code=204)
+async def delete_pantry_item(item_id: int, user_id: str = _user_query()):
+    deleted = await asyncio.to_thread(db_utils.delete_pantry_item, user_id, item_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Pantry item not found")
+    return Response(status_code=204)
@@ -1,11 +1,55 @@
+import asyncio
+import json
+import os
+from typing import List, Literal
+
 from fastapi import APIRouter, File, HTTPException, Query, UploadFile
-from services.cv_service import analyze_image
-from services.gemini_service import get_nutrition_and_impact, get_recipes_and_safety
+from fastapi.responses import StreamingResponse
+from models.freshness_model import DEFAULT_STORAGE, estimate_freshness
+from models.prediction_model import PredictionResponse
+from services.cache_service import analysis_cache, get_or_compute_async
+from services.cv_service import (
+    analyze_image_async,
+    analyze_images_async,
+    detect_fruits_async,
+)
+from services.explainability_service import EXPLAIN_ENABLED, explain_async
+from services.image_pool import ImagePoolFull, image_pool
+from services.logging_service import get_logger
+from services.metrics_service import span
+from services.nutrition_service import get_nutrition_async
+from services.recipe_service import get_recipes_async
+from services.upload_service import UploadRoute, read_upload
+
+router = APIRouter(route_class=UploadRoute)
+logger = get_logger("routes.predict")
+
+PREDICT_BATCH_MAX_FILES = int(os.getenv("PREDICT_BATCH_MAX_FILES", "20"))
+
+
+def _nutrition_fields(nutrition_info):
+    return {
+        "nutrition": nutrition_info.get("nutrition"),
+        "health_benefits": nutrition_info.get("health_benefits"),
+        "environmental_impact": nutrition_info.get("environmental_impact"),
+        "waste_reduction_tip": nutrition_info.get("waste_reduction_tip"),
+    }
+
 
-router = APIRouter()
+def _recipe_fields(analysis, recipe_info):
+    # Safety and storage tips judged from the photo win over the library's
+    # generic tips for this fruit and ripeness
+    return {
+        "is_safe_to_eat": analysis.get("is_safe_to_eat"),
+        "days_until_discard": analysis.get("days_until_discard"),
+        "storage_tips": analysis.get("storage_tips") or recipe_info.get("storage_tips"),
+        "recipes": recipe_info.get("recipes", []),
+    }
 
 
-@router.post("/predict")
+@router.post(
+    "/predict", response_model=PredictionResponse, response_model_exclude_none=True
+)
 async def predict(
     file: UploadFile = File(...),
     include_recipes: bool = Query(
@@ -15,6 +59,22 @@ async def predict(
         default=True,
         description="Include nutritional information and environmental impact",
     ),
+    include_safety: bool = Query(
+        default=False,
+        description="Include food safety, shelf life and storage tips without recipes",
+    ),
+    multi: bool = Query(
+        default=False,
+        description="Detect every fruit in the photo, each with its box and ripeness",
+    ),
+    include_heatmap: bool = Query(
+        default=False,
+        description="Include a base64 PNG overlay of the per-pixel ripeness map",
+    ),
+    storage: Literal["room", "fridge"] = Query(
+        default=DEFAULT_STORAGE,
+        description="Where the fruit is kept, for the shelf-life estimate",
+    ),
 ):
     """
     Analyze fruit image for ripeness detection.
@@ -23,6 +83,27 @@ async def predict(
         file: Uploaded fruit image
         include_recipes: If true, also returns recipes, safety info, and shelf life
         include_nutrition: If true, includes nutrition facts and environmental impact
+        include_safety: If true, returns safety info and shelf life from the
+            same Gemini request that identifies the fruit (no recipe prompt)
+        multi: If true, every detected fruit is returned under "detections"
+            (best first); the top-level fields, nutrition and recipes
+            describe the most confident one. Safety fields are not judged
+            in this mode
+        include_heatmap: If true, explanation.overlay_png holds a base64 PNG
+            of the photo with its per-pixel ripeness map blended over the fruit
+        storage: "room" or "fridge"; used by the local shelf-life estimate
+
+    Unless EXPLAIN_ENABLED is off, "explanation" summarizes the color maps
+    behind the call (ripeness_score, color_deviation, blemish_ratio,
+    fruit_coverage); it is computed on the CPU alongside the analysis.
+
+    "freshness" (days_remaining, discard_date and a daily decay_curve) is
+    looked up locally for the identified fruit and storage, without another
+    model call; it also fills days_until_discard when the photo analysis
+    didn't judge it.
+
+    Recipes come from the recipe library keyed by (fruit, ripeness); only
+    the safety fields are judged from the photo, by the analysis request.
 
     Returns:
         Basic response:
@@ -54,67 +135,345 @@ async def predict(
             raise HTTPException(status_code=400, detail="No file uploaded")
 
         # Read the file safely
-        image_bytes = await file.read()
-        print("✅ File size received:", len(image_bytes), "bytes")
+        image_bytes = await read_upload(file)
+        logger.debug("File size received: %s bytes", len(image_bytes))
 
         if len(image_bytes) == 0:
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
-        # Run CV model / Gemini for basic analysis
-        result = analyze_image(image_bytes)
-        print("✅ Analysis result:", result)
+        # Decode once; every service below reuses the same decoded image
+        image = await image_pool.decode(image_bytes)
+
+        # The color maps only need the pixels, so they are computed (and
+        # cached) while the models run
+        explain_task = None
+        if EXPLAIN_ENABLED or include_heatmap:
+            explain_task = asyncio.create_task(
+                get_or_compute_async(image, "explanation", lambda: explain_async(image))
+            )
+
+        # Run CV model / Gemini for basic analysis. Recipes come from the
+        # library, so the image-specific safety info is asked for here
+        with_safety = include_safety or include_recipes
+        if multi:
+            result = await get_or_compute_async(
+                image, "detections", lambda: detect_fruits_async(image)
+            )
+        else:
+            result = await get_or_compute_async(
+                image,
+                "analysis_safety" if with_safety else "analysis",
+                lambda: analyze_image_async(image, include_safety=with_safety),
+            )
+        logger.debug("Analysis result: %s", result)
 
         # Get fruit info for additional features
         fruit_name = result.get("fruit_name", "unknown")
         ripeness = result.get("ripeness", "ripe")
 
-        # Add nutrition and environmental impact (lightweight, no additional image processing)
-        if include_nutrition and fruit_name != "unknown" and "error" not in result:
-            print(f"📊 Fetching nutrition info for {fruit_name}...")
-            nutrition_info = get_nutrition_and_impact(fruit_name, ripeness)
-
-            if "error" not in nutrition_info:
-                result.update(
-                    {
-                        "nutrition": nutrition_info.get("nutrition"),
-                        "health_benefits": nutrition_info.get("health_benefits"),
-                        "environmental_impact": nutrition_info.get(
-                            "environmental_impact"
-                        ),
-                        "waste_reduction_tip": nutrition_info.get(
-                            "waste_reduction_tip"
-                        ),
-                    }
-                )
-                print("✅ Added nutrition and impact data")
-
-        # If recipes are requested, get additional info
-        if include_recipes and "error" not in result:
-            print("🍳 Fetching recipe suggestions...")
-            recipe_info = get_recipes_and_safety(
-                image_bytes,
-                fruit_name=fruit_name,
-                ripeness=ripeness,
+        # Nutrition and recipes only depend on the analysis, not on each
+        # other, so fetch them concurrently
+        want_nutrition = (
+            include_nutrition and fruit_name != "unknown" and "error" not in result
+        )
+        want_recipes = (
+            include_recipes and fruit_name != "unknown" and "error" not in result
+        )
+
+        nutrition_task = None
+        recipe_task = None
+        if want_nutrition:
+            logger.debug("Fetching nutrition info for %s...", fruit_name)
+            nutrition_task = asyncio.create_task(
+                get_nutrition_async(fruit_name, ripeness)
             )
+        if want_recipes:
+            logger.debug("Fetching recipe suggestions...")
+            recipe_task = asyncio.create_task(get_recipes_async(fruit_name, ripeness))
 
-            if "error" not in recipe_info:
-                # Merge recipe info into result
-                result.update(
-                    {
-                        "is_safe_to_eat": recipe_info.get("is_safe_to_eat"),
-                        "days_until_discard": recipe_info.get("days_until_discard"),
-                        "storage_tips": recipe_info.get("storage_tips"),
-                        "recipes": recipe_info.get("recipes", []),
-                    }
-                )
-                print(
-                    f"✅ Added {len(recipe_info.get('recipes', []))} recipes to response"
+        nutrition_info = await nutrition_task if nutrition_task is not None else None
+        recipe_info = await recipe_task if recipe_task is not None else None
+        explanation = await explain_task if explain_task is not None else None
+
+        with span("response_assembly"):
+            if (
+                explanation is not None
+                and "error" not in explanation
+                and "error" not in result
+            ):
+                if not include_heatmap:
+                    explanation.pop("overlay_png", None)
+                result["explanation"] = explanation
+
+            if fruit_name != "unknown" and "error" not in result:
+                confidence = result.get("confidence")
+                if confidence is None:
+                    confidence = 100.0
+                freshness = estimate_freshness(
+                    fruit_name, ripeness, confidence, storage
                 )
-            else:
-                print(f"⚠️ Failed to get recipes: {recipe_info.get('error')}")
+                result["freshness"] = freshness
+                if with_safety and result.get("days_until_discard") is None:
+                    result["days_until_discard"] = int(freshness["days_remaining"])
 
+            # Optional sections that couldn't be produced (e.g. the Gemini
+            # budget was kept for the analysis) are listed, not fatal
+            degraded = []
+
+            # Add nutrition and environmental impact (lightweight, no additional image processing)
+            if nutrition_info is not None:
+                if "error" not in nutrition_info:
+                    result.update(_nutrition_fields(nutrition_info))
+                else:
+                    degraded.append("nutrition")
+
+            # If recipes are requested, merge recipe info into the result
+            if recipe_info is not None:
+                if "error" not in recipe_info:
+                    result.update(_recipe_fields(result, recipe_info))
+                else:
+                    logger.warning("Failed to get recipes: %s", recipe_info["error"])
+                    degraded.append("recipes")
+
+            if degraded:
+                result["degraded"] = degraded
+
+        logger.info(
+            "Prediction served",
+            extra={
+                "fruit": fruit_name,
+                "ripeness": ripeness,
+                "source": result.get("source"),
+                "recipes": len(result.get("recipes", [])),
+            },
+        )
         return result
 
+    except (HTTPException, ImagePoolFull):
+        raise
     except Exception as e:
-        print("❌ Error in /predict:", e)
+        logger.exception("Error in /predict: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
+
+
+async def _decode_or_none(image_bytes):
+    if not image_bytes:
+        return None
+    try:
+        return await image_pool.decode(image_bytes, admit=False)
+    except Exception as e:
+        logger.warning("Could not decode image in batch: %s", e)
+        return None
+
+
+@router.post("/predict/batch")
+async def predict_batch(
+    files: List[UploadFile] = File(...),
+    include_nutrition: bool = Query(
+        default=True,
+        description="Include nutritional information and environmental impact",
+    ),
+):
+    """
+    Analyze several fruit images in one request.
+
+    Identical uploads are analyzed once, images are decoded in the worker
+    pool, and the remote models are called with batched / multi-image
+    requests. Results are streamed back as newline-delimited JSON, one line
+    per uploaded file, as soon as each one is ready (cache hits first):
+
+        {"index": 0, "filename": "a.jpg", "fruit_name": "apple", "ripeness": "ripe", ...}
+        {"index": 2, "filename": "c.jpg", "error": "Could not decode image"}
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files uploaded")
+    if len(files) > PREDICT_BATCH_MAX_FILES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {PREDICT_BATCH_MAX_FILES} files per batch",
+        )
+
+    # Read everything before streaming starts; uploads are closed afterwards
+    filenames = [file.filename for file in files]
+    contents = [await read_upload(file) for file in files]
+    logger.debug("Batch request: %s files", len(contents))
+
+    # A full image pool rejects the whole batch with 503 before streaming
+    image_pool.check_capacity()
+    images = await asyncio.gather(
+        *(_decode_or_none(image_bytes) for image_bytes in contents)
+    )
+
+    def line(index, result):
+        return (
+            json.dumps({"index": index, "filename": filenames[index], **result}) + "\n"
+        )
+
+    async def stream():
+        # Deduplicate identical uploads: sha256 -> indices sharing it
+        groups = {}
+        for index, image in enumerate(images):
+            if image is None:
+                error = (
+                    "Uploaded file is empty"
+                    if not contents[index]
+                    else "Could not decode image"
+                )
+                yield line(index, {"error": error})
+            else:
+                groups.setdefault(image.sha256, []).append(index)
+
+        unique = {sha: images[indices[0]] for sha, indices in groups.items()}
+
+        async def finish(sha):
+            result = analyses[sha]
+            fruit_name = result.get("fruit_name", "unknown")
+            if include_nutrition and fruit_name != "unknown" and "error" not in result:
+                nutrition_info = await get_nutrition_async(
+                    fruit_name, result.get("ripeness", "ripe")
+                )
+                if "error" not in nutrition_info:
+                    result = {**result, **_nutrition_fields(nutrition_info)}
+            return sha, result
+
+        async def emit(shas):
+            for next_done in asyncio.as_completed([finish(sha) for sha in shas]):
+                sha, result = await next_done
+                for index in groups[sha]:
+                    yield line(index, result)
+
+        analyses = {}
+        for sha, image in unique.items():
+            cached = await image_pool.run(analysis_cache.get, image, "analysis")
+            if cached is not None:
+                analyses[sha] = cached
+
+        # Cache hits go out before any remote call is made
+        async for chunk in emit(list(analyses)):
+            yield chunk
+
+        misses = [sha for sha in unique if sha not in analyses]
+        if misses:
+            fresh = await analyze_images_async([unique[sha] for sha in misses])
+            for sha, result in zip(misses, fresh):
+                if "error" not in result:
+                    analysis_cache.set(unique[sha], result, "analysis")
+                analyses[sha] = result
+
+            async for chunk in emit(misses):
+                yield chunk
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def _event(name, data):
+    return json.dumps({"event": name, "data": data}) + "\n"
+
+
+@router.post("/predict/stream")
+async def predict_stream(
+    file: UploadFile = File(...),
+    include_recipes: bool = Query(
+        default=False, description="Include recipe suggestions and food safety info"
+    ),
+    include_nutrition: bool = Query(
+        default=True,
+        description="Include nutritional information and environmental impact",
+    ),
+):
+    """
+    Streaming variant of /predict.
+
+    Returns newline-delimited JSON events as each stage finishes, so clients
+    can render the fruit name and ripeness before nutrition and recipes are
+    ready:
+
+        {"event": "analysis", "data": {"fruit_name": "apple", "ripeness": "ripe", ...}}
+        {"event": "nutrition", "data": {"nutrition": {...}, ...}}
+        {"event": "recipes", "data": {"is_safe_to_eat": true, "recipes": [...], ...}}
+        {"event": "done", "data": {}}
+
+    Nutrition and recipe events may arrive in either order; failed stages
+    emit their event with an "error" key in data. A stage that raises emits
+    {"event": "error", "stage": "nutrition", "error": "..."} instead.
+    """
+    image_bytes = await read_upload(file)
+    logger.debug("Stream request - File size: %s bytes", len(image_bytes))
+
+    if len(image_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Uploaded file is empty")
+
+    try:
+        image = await image_pool.decode(image_bytes)
+    except ImagePoolFull:
+        raise
+    except Exception as e:
+        logger.warning("Could not decode image in /predict/stream: %s", e)
+        raise HTTPException(status_code=400, detail="Could not decode image")
+
+    async def stream():
+        # Safety fields ride along with the analysis; recipes come from the
+        # library, so they are ready as soon as the analysis is
+        result = await get_or_compute_async(
+            image,
+            "analysis_safety" if include_recipes else "analysis",
+            lambda: analyze_image_async(image, include_safety=include_recipes),
+        )
+        yield _event("analysis", result)
+
+        fruit_name = result.get("fruit_name", "unknown")
+        ripeness = result.get("ripeness", "ripe")
+        if "error" in result:
+            yield _event("done", {})
+            return
+
+        queue = asyncio.Queue()
+
+        async def nutrition():
+            nutrition_info = await get_nutrition_async(fruit_name, ripeness)
+            if "error" in nutrition_info:
+                await queue.put(_event("nutrition", {"error": nutrition_info["error"]}))
+            else:
+                await queue.put(_event("nutrition", _nutrition_fields(nutrition_info)))
+
+        async def recipes():
+            recipe_info = await get_recipes_async(fruit_name, ripeness)
+            if "error" in recipe_info:
+                await queue.put(_event("recipes", {"error": recipe_info["error"]}))
+            else:
+                await queue.put(_event("recipes", _recipe_fields(result, recipe_info)))
+
+        async def guarded(stage, producer):
+            # One failing stage must not end the stream silently
+            try:
+                await producer
+            except Exception as e:
+                logger.exception("Stage %s failed in /predict/stream: %s", stage, e)
+                await queue.put(
+                    json.dumps({"event": "error", "stage": stage, "error": str(e)})
+                    + "\n"
+                )
+
+        producers = []
+        if include_nutrition and fruit_name != "unknown":
+            producers.append(guarded("nutrition", nutrition()))
+        if include_recipes and fruit_name != "unknown":
+            producers.append(guarded("recipes", recipes()))
+
+        async def run_producers():
+            try:
+                await asyncio.gather(*producers)
+            finally:
+                await queue.put(None)
+
+        runner = asyncio.create_task(run_producers())
+        try:
+            while (event := await queue.get()) is not None:
+                yield event
+        finally:
+            # Client went away or streaming finished: stop any pending stage
+            runner.cancel()
+
+        yield _event("done", {})
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
@@ -1,14 +1,55 @@
 from fastapi import APIRouter, File, HTTPException, UploadFile
+from models.prediction_model import RecipesResponse
+from services.cache_service import get_or_compute_async
 from services.gemini_service import (
-    analyze_ripeness_with_gemini,
-    get_fruit_name,
-    get_recipes_and_safety,
+    analyze_fruit_with_gemini_async,
+    get_recipes_and_safety_async,
 )
+from services.image_pool import ImagePoolFull, image_pool
+from services.logging_service import get_logger
+from services.rate_limiter import CORE
+from services.recipe_service import get_recipes_async
+from services.upload_service import UploadRoute, read_upload
 
-router = APIRouter()
+router = APIRouter(route_class=UploadRoute)
+logger = get_logger("routes.recipes")
 
 
-@router.post("/recipes")
+async def _identify_and_get_recipes(image):
+    # One short image prompt covers identification and the image-specific
+    # safety fields; recipes come from the library for that fruit + ripeness
+    logger.debug("Detecting fruit, ripeness and safety first...")
+    fruit_info = await analyze_fruit_with_gemini_async(image, include_safety=True)
+
+    fruit_name = fruit_info.get("fruit_name", "unknown")
+    ripeness = fruit_info.get("ripeness", "unknown")
+
+    logger.debug("Detected: %s (%s)", fruit_name, ripeness)
+
+    if "error" in fruit_info or fruit_name == "unknown":
+        # Nothing to look up; let the full recipe prompt work from the photo
+        return await get_recipes_and_safety_async(image)
+
+    # The recipes are this endpoint's whole answer, so a library miss is a
+    # core call rather than an optional /predict section
+    recipe_info = await get_recipes_async(fruit_name, ripeness, priority=CORE)
+    if "error" in recipe_info:
+        return recipe_info
+
+    return {
+        "fruit_name": fruit_name,
+        "ripeness": ripeness,
+        "is_safe_to_eat": fruit_info.get("is_safe_to_eat"),
+        "days_until_discard": fruit_info.get("days_until_discard"),
+        "storage_tips": fruit_info.get("storage_tips")
+        or recipe_info.get("storage_tips"),
+        "recipes": recipe_info.get("recipes", []),
+    }
+
+
+@router.post(
+    "/recipes", response_model=RecipesResponse, response_model_exclude_none=True
+)
 async def get_recipes(file: UploadFile = File(...)):
     """
     Get recipe suggestions, food safety info, and shelf life for a fruit.
@@ -24,39 +65,34 @@ async def get_recipes(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="No file uploaded")
 
         # Read the file
-        image_bytes = await file.read()
-        print(f"✅ Recipe request - File size: {len(image_bytes)} bytes")
+        image_bytes = await read_upload(file)
+        logger.debug("Recipe request - File size: %s bytes", len(image_bytes))
 
         if len(image_bytes) == 0:
             raise HTTPException(status_code=400, detail="Uploaded file is empty")
 
-        # First detect fruit name and ripeness for better context
-        print("📊 Detecting fruit and ripeness first...")
-        fruit_info = get_fruit_name(image_bytes)
-        ripeness_info = analyze_ripeness_with_gemini(image_bytes)
-
-        fruit_name = fruit_info.get("fruit_name", "unknown")
-        ripeness = ripeness_info.get("ripeness", "unknown")
+        # Decode once; the Gemini prompts reuse the same decoded image
+        image = await image_pool.decode(image_bytes)
 
-        print(f"   Detected: {fruit_name} ({ripeness})")
-
-        # Get recipes and safety info
-        result = get_recipes_and_safety(
-            image_bytes, fruit_name=fruit_name, ripeness=ripeness
+        result = await get_or_compute_async(
+            image, "recipes", lambda: _identify_and_get_recipes(image)
         )
 
         if "error" in result:
-            print(f"❌ Error in recipe generation: {result['error']}")
+            logger.error("Error in recipe generation: %s", result["error"])
             raise HTTPException(status_code=500, detail=result["error"])
 
-        print("✅ Recipe suggestions generated successfully")
+        logger.info(
+            "Recipes served",
+            extra={
+                "fruit": result.get("fruit_name"),
+                "recipes": len(result.get("recipes", [])),
+            },
+        )
         return result
 
-    except HTTPException:
+    except (HTTPException, ImagePoolFull):
         raise
     except Exception as e:
-        print(f"❌ Error in /recipes endpoint: {e}")
-        import traceback
-
-        traceback.print_exc()
+        logger.exception("Error in /recipes endpoint: %s", e)
         raise HTTPException(status_code=500, detail=str(e))
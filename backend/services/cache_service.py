@@ -0,0 +1,234 @@
+import asyncio
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from dotenv import load_dotenv
+from services.image_pool import image_pool
+from services.logging_service import get_logger
+from services.metrics_service import CACHE_LOOKUPS, COALESCED_REQUESTS
+
+load_dotenv()
+
+logger = get_logger("cache")
+
+ANALYSIS_CACHE_MAX_ENTRIES = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+ANALYSIS_CACHE_TTL_SECONDS = float(os.getenv("ANALYSIS_CACHE_TTL_SECONDS", "900"))
+# Max differing bits between perceptual hashes to count as the same image
+# (0 disables perceptual matching and only exact content hits are served)
+ANALYSIS_CACHE_PHASH_DISTANCE = int(os.getenv("ANALYSIS_CACHE_PHASH_DISTANCE", "5"))
+# A perceptual match must also agree on every colour feature (hue band
+# ratios, mean saturation and brightness) within this much, since the hash
+# ignores colour and ripeness is judged on it
+ANALYSIS_CACHE_COLOR_TOLERANCE = float(
+    os.getenv("ANALYSIS_CACHE_COLOR_TOLERANCE", "0.1")
+)
+
+
+class AnalysisCache:
+    """
+    TTL + LRU cache for image analysis results.
+
+    Entries are keyed by (namespace, sha256 of the upload). On an exact miss
+    the perceptual hash is compared against the cached entries of the same
+    namespace, so a re-encoded or slightly different shot of the same fruit
+    still hits, provided its colours match too (a re-scan after the fruit
+    ripened must not be served the old ripeness). Values are deep-copied in and out because routes mutate the
+    dicts they return.
+    """
+
+    def __init__(
+        self,
+        max_entries=ANALYSIS_CACHE_MAX_ENTRIES,
+        ttl_seconds=ANALYSIS_CACHE_TTL_SECONDS,
+        phash_distance=ANALYSIS_CACHE_PHASH_DISTANCE,
+        color_tolerance=ANALYSIS_CACHE_COLOR_TOLERANCE,
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.phash_distance = phash_distance
+        self.color_tolerance = color_tolerance
+        # (namespace, sha256) -> (expires, (dhash, color signature), value)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.perceptual_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _perceptual_key(self, image):
+        if self.phash_distance <= 0:
+            return None
+        return image.dhash, image.color_signature
+
+    def _colors_match(self, colors, other_colors):
+        return all(
+            abs(value - other) <= self.color_tolerance
+            for value, other in zip(colors, other_colors)
+        )
+
+    def _find_key(self, namespace, sha256, perceptual_key, now):
+        key = (namespace, sha256)
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > now:
+            return key, False
+        if entry is not None:
+            del self._entries[key]
+
+        if perceptual_key is None:
+            return None, False
+
+        dhash, colors = perceptual_key
+        best_key = None
+        best_distance = self.phash_distance + 1
+        for other_key, (expires, other_perceptual, _) in self._entries.items():
+            if other_key[0] != namespace or expires <= now:
+                continue
+            other_hash, other_colors = other_perceptual
+            distance = (dhash ^ other_hash).bit_count()
+            if distance < best_distance and self._colors_match(colors, other_colors):
+                best_key, best_distance = other_key, distance
+        return best_key, True
+
+    def get(self, image, namespace="analysis"):
+        """
+        Look up a cached result for a DecodedImage.
+
+        Returns:
+            A copy of the cached value, or None on a miss.
+        """
+        perceptual_key = self._perceptual_key(image)
+        now = time.monotonic()
+        with self._lock:
+            key, perceptual = self._find_key(
+                namespace, image.sha256, perceptual_key, now
+            )
+            if key is None:
+                self.misses += 1
+                CACHE_LOOKUPS.inc(namespace=namespace, result="miss")
+                return None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if perceptual:
+                self.perceptual_hits += 1
+            CACHE_LOOKUPS.inc(
+                namespace=namespace, result="perceptual_hit" if perceptual else "hit"
+            )
+            value = self._entries[key][2]
+
+        return copy.deepcopy(value)
+
+    def set(self, image, value, namespace="analysis"):
+        """Store a result for a DecodedImage, evicting the least recently used entry."""
+        expires = time.monotonic() + self.ttl_seconds
+        perceptual_key = self._perceptual_key(image)
+        value = copy.deepcopy(value)
+
+        with self._lock:
+            key = (namespace, image.sha256)
+            self._entries[key] = (expires, perceptual_key, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "perceptual_hits": self.perceptual_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent async computations that share a key.
+
+    The first caller starts the computation as its own task; callers that
+    arrive while it is running await the same task instead of starting
+    another one. Every caller gets its own deep copy of the result, and a
+    caller being cancelled (e.g. a client disconnect) does not cancel the
+    shared computation for the others.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._tasks = {}
+
+    def in_flight(self):
+        return len(self._tasks)
+
+    def _forget(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+
+    async def run(self, key, compute):
+        """
+        Args:
+            key: Hashable identity of the computation
+            compute: Zero-argument coroutine function
+
+        Returns:
+            A copy of compute()'s result
+        """
+        task = self._tasks.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = asyncio.create_task(compute())
+            self._tasks[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        else:
+            COALESCED_REQUESTS.inc(kind=self.name)
+            logger.debug("Joined in-flight %s computation", self.name)
+
+        result = await asyncio.shield(task)
+        return copy.deepcopy(result)
+
+
+# Shared instances used by the routes
+analysis_cache = AnalysisCache()
+analysis_flights = SingleFlight("analysis")
+
+
+async def get_or_compute_async(image, namespace, compute):
+    """
+    Serve a result from analysis_cache, or await compute() and cache it.
+
+    Concurrent misses for the same image and namespace share a single
+    compute() call (see SingleFlight), so a retry storm of identical uploads
+    makes one set of upstream calls.
+
+    Args:
+        image: DecodedImage the result belongs to
+        namespace: Kind of result ("analysis", "recipes", ...)
+        compute: Zero-argument coroutine function producing the result dict
+
+    Returns:
+        dict: The cached or freshly computed result. Results containing an
+        "error" key are returned but never cached.
+    """
+    # Hashing touches pixel data, so keep it off the event loop
+    cached = await image_pool.run(analysis_cache.get, image, namespace)
+    if cached is not None:
+        logger.debug("Cache hit for %s", namespace)
+        return cached
+
+    async def compute_and_cache():
+        result = await compute()
+        if "error" not in result:
+            analysis_cache.set(image, result, namespace)
+        return result
+
+    return await analysis_flights.run((namespace, image.sha256), compute_and_cache)
@@ -0,0 +1,189 @@
+import os
+import threading
+import time
+from collections import deque
+
+from dotenv import load_dotenv
+from services.logging_service import get_logger
+from services.metrics_service import CIRCUIT_OPEN, CIRCUIT_TRANSITIONS
+
+load_dotenv()
+
+logger = get_logger("circuit")
+
+# Failure rate is measured over calls finished in the last window
+CIRCUIT_WINDOW_SECONDS = float(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+# Fewer calls than this in the window never open the circuit
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "5"))
+# How long an open circuit rejects calls before letting probes through
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.getenv("CIRCUIT_HALF_OPEN_PROBES", "1"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(RuntimeError):
+    """The upstream's circuit is open; the call was not attempted."""
+
+
+class CircuitBreaker:
+    """
+    Failure-rate circuit breaker for one upstream.
+
+    closed:    calls go through; once CIRCUIT_MIN_CALLS calls in the window
+               fail at CIRCUIT_FAILURE_RATE or more, the circuit opens.
+    open:      calls are rejected immediately for CIRCUIT_OPEN_SECONDS.
+    half_open: up to CIRCUIT_HALF_OPEN_PROBES calls are let through; a
+               success closes the circuit, a failure opens it again.
+    """
+
+    def __init__(
+        self,
+        name,
+        window_seconds=CIRCUIT_WINDOW_SECONDS,
+        failure_rate=CIRCUIT_FAILURE_RATE,
+        min_calls=CIRCUIT_MIN_CALLS,
+        open_seconds=CIRCUIT_OPEN_SECONDS,
+        half_open_probes=CIRCUIT_HALF_OPEN_PROBES,
+    ):
+        self.name = name
+        self.window_seconds = window_seconds
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = CLOSED
+        self._outcomes = deque()  # (finished_at, ok)
+        self._opened_at = 0.0
+        self._probes_in_flight = 0
+        self._last_error = None
+        self._lock = threading.Lock()
+
+    def _transition(self, state, now):
+        if state == self.state:
+            return
+        logger.warning(
+            "Circuit state changed",
+            extra={"breaker": self.name, "from": self.state, "to": state},
+        )
+        self.state = state
+        CIRCUIT_TRANSITIONS.inc(breaker=self.name, state=state)
+        CIRCUIT_OPEN.set(1 if state == OPEN else 0, breaker=self.name)
+        if state == OPEN:
+            self._opened_at = now
+        elif state == CLOSED:
+            self._outcomes.clear()
+        self._probes_in_flight = 0
+
+    def _trim(self, now):
+        cutoff = now - self.window_seconds
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            self._outcomes.popleft()
+
+    def acquire(self):
+        """
+        Ask to make a call.
+
+        Raises:
+            CircuitOpenError: If the circuit is open (or all half-open probe
+                slots are taken)
+        """
+        now = time.monotonic()
+        with self._lock:
+            if self.state == OPEN and now - self._opened_at >= self.open_seconds:
+                self._transition(HALF_OPEN, now)
+
+            if self.state == CLOSED:
+                return
+            if (
+                self.state == HALF_OPEN
+                and self._probes_in_flight < self.half_open_probes
+            ):
+                self._probes_in_flight += 1
+                return
+
+        raise CircuitOpenError(f"{self.name} circuit is open")
+
+    def record_success(self):
+        now = time.monotonic()
+        with self._lock:
+            if self.state == HALF_OPEN:
+                self._transition(CLOSED, now)
+                return
+            self._outcomes.append((now, True))
+            self._trim(now)
+
+    def record_failure(self, error=None):
+        now = time.monotonic()
+        with self._lock:
+            self._last_error = str(error) if error is not None else None
+            if self.state == HALF_OPEN:
+                self._transition(OPEN, now)
+                return
+            if self.state == OPEN:
+                return
+
+            self._outcomes.append((now, False))
+            self._trim(now)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            if (
+                len(self._outcomes) >= self.min_calls
+                and failures / len(self._outcomes) >= self.failure_rate
+            ):
+                self._transition(OPEN, now)
+
+    def release(self):
+        """Give back a probe slot for a call that ended without an outcome."""
+        with self._lock:
+            if self.state == HALF_OPEN and self._probes_in_flight > 0:
+                self._probes_in_flight -= 1
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            self._trim(now)
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+            state = self.state
+            if state == OPEN and now - self._opened_at >= self.open_seconds:
+                # Reported as half-open; the next call will probe
+                state = HALF_OPEN
+            return {
+                "state": state,
+                "window_calls": calls,
+                "window_failure_rate": round(failures / calls, 3) if calls else 0.0,
+                "retry_in_seconds": (
+                    round(max(0.0, self.open_seconds - (now - self._opened_at)), 1)
+                    if self.state == OPEN
+                    else None
+                ),
+                "last_error": self._last_error,
+            }
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(name):
+    """Shared breaker for an upstream (e.g. "roboflow", "gemini_analysis")."""
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
+
+
+def breaker_states():
+    with _breakers_lock:
+        breakers = dict(_breakers)
+    return {name: breaker.snapshot() for name, breaker in sorted(breakers.items())}
+
+
+def reset_breakers():
+    with _breakers_lock:
+        _breakers.clear()
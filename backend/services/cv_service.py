@@ -1,114 +1,557 @@
+import asyncio
 import os
-from io import BytesIO
+import threading
 
-import numpy as np
 from dotenv import load_dotenv
-from inference_sdk import InferenceHTTPClient
-from PIL import Image
-from services.gemini_service import analyze_ripeness_with_gemini, get_fruit_name
+from models.prediction_model import DEFAULT_CONFIDENCE
+from services.gemini_service import (
+    ANALYSIS_SAFETY_FIELDS,
+    analyze_fruit_with_gemini,
+    analyze_fruit_with_gemini_async,
+    analyze_ripeness_batch_async,
+    get_fruit_name,
+    get_fruit_name_async,
+    get_fruit_names_batch_async,
+)
+from services.circuit_breaker import CircuitOpenError
+from services.image_pool import image_pool
+from services.image_service import DecodedImage, as_decoded_image
+from services.latency_service import (
+    call_with_timeout,
+    call_with_timeout_async,
+    latency_tracker,
+)
+from services.logging_service import get_logger
+from services.metrics_service import HEDGES, PREDICTIONS, span
+from services.stage_classifier import classify_confident
 
 load_dotenv()
 
-# Initialize Roboflow client only if API key is available
-CLIENT = None
-roboflow_url = os.getenv("ROBOFLOW_URL")
-roboflow_key = os.getenv("ROBOFLOW_API_KEY")
+logger = get_logger("cv")
 
-if roboflow_url and roboflow_key:
-    try:
-        CLIENT = InferenceHTTPClient(
-            api_url=roboflow_url,
-            api_key=roboflow_key,
+_UNINITIALIZED = object()
+
+# Roboflow client, built on first use by get_client(). None means Roboflow
+# is unavailable; tests and benchmarks assign a stand-in (or None) here
+# directly.
+CLIENT = _UNINITIALIZED
+_client_lock = threading.Lock()
+
+
+def _build_client():
+    roboflow_url = os.getenv("ROBOFLOW_URL")
+    roboflow_key = os.getenv("ROBOFLOW_API_KEY")
+    if not (roboflow_url and roboflow_key):
+        logger.warning(
+            "Roboflow API key not configured - will use Gemini for all predictions"
         )
-        print("✓ Roboflow CV client initialized")
-    except Exception as e:
-        print(f"⚠️ Failed to initialize Roboflow client: {e}")
-        CLIENT = None
-else:
-    print("⚠️ Roboflow API key not configured - will use Gemini for all predictions")
+        return None
+
+    from services.roboflow_client import RoboflowClient
+
+    logger.info("Roboflow CV client initialized")
+    return RoboflowClient(roboflow_url, roboflow_key)
+
+
+def get_client():
+    """The Roboflow client (None if not configured), built on first call."""
+    global CLIENT
+    if CLIENT is _UNINITIALIZED:
+        with _client_lock:
+            if CLIENT is _UNINITIALIZED:
+                with span("roboflow_client_init"):
+                    CLIENT = _build_client()
+    return CLIENT
+
+
+async def get_client_async():
+    """get_client() that builds the client off the event loop on first use."""
+    if CLIENT is not _UNINITIALIZED:
+        return CLIENT
+    return await asyncio.to_thread(get_client)
+
+
+ROBOFLOW_MODEL_ID = "fruit-ripeness-unjex/2"
+# Multi-fruit mode: detections below this confidence are dropped, at most
+# DETECT_MAX_FRUITS are kept, and crops get DETECT_CROP_MARGIN extra context
+DETECT_MIN_CONFIDENCE = float(os.getenv("DETECT_MIN_CONFIDENCE", "0.4"))
+DETECT_MAX_FRUITS = int(os.getenv("DETECT_MAX_FRUITS", "12"))
+DETECT_CROP_MARGIN = 0.1
+# Boxes smaller than this (in decoded pixels) are too small to name
+DETECT_MIN_BOX_SIDE = 8
+# One circuit for every Roboflow call (single and batched share the endpoint)
+ROBOFLOW_BREAKER = "roboflow"
+
+
+def _log_cv_error(message, error):
+    if isinstance(error, CircuitOpenError):
+        # Expected during an outage; the breaker already logged the transition
+        logger.debug("%s: %s", message, error)
+    else:
+        logger.error("%s: %s", message, error)
+
+
+def _prepare_cv_image(image):
+    return image.roboflow_payload
+
+
+def _gemini_ripeness_result(gemini_result, source, error_message):
+    if "error" not in gemini_result:
+        PREDICTIONS.inc(source=source)
+        return _with_safety(
+            {
+                "fruit_name": gemini_result.get("fruit_name", "unknown"),
+                "ripeness": gemini_result.get("ripeness", "unknown"),
+                "confidence": gemini_result.get("confidence", DEFAULT_CONFIDENCE),
+                "source": source,
+            },
+            gemini_result,
+        )
+    PREDICTIONS.inc(source="error")
+    return {"error": error_message}
+
+
+def _with_safety(result, gemini_result):
+    # Carry over safety / shelf-life fields from a combined Gemini analysis
+    for field in ANALYSIS_SAFETY_FIELDS:
+        if field in gemini_result:
+            result[field] = gemini_result[field]
+    return result
+
+
+def _classify_locally(image):
+    with span("local_classifier"):
+        return classify_confident(image.gemini_input)
+
+
+def _local_prediction_result(fruit_name, local_result):
+    logger.debug(
+        "Local stage classifier: %s (%.2f), skipping remote ripeness models",
+        local_result["ripeness"],
+        local_result["confidence"],
+    )
+    PREDICTIONS.inc(source="local_classifier")
+    return {
+        "fruit_name": fruit_name,
+        "ripeness": local_result["ripeness"],
+        "confidence": round(local_result["confidence"] * 100, 2),
+        "source": "local_classifier",
+    }
+
+
+def _stage_from_class(raw_class):
+    # Roboflow classes look like "banana ripe"; the last word is the stage
+    return raw_class.split()[-1] if raw_class != "unknown" else "unknown"
+
 
+def _cv_prediction_result(fruit_name, preds):
+    top_pred = max(preds, key=lambda x: x.get("confidence", 0))
+    stage = _stage_from_class(top_pred.get("class", "unknown"))
 
-def analyze_image(image_bytes):
+    PREDICTIONS.inc(source="cv_model")
+    return {
+        "fruit_name": fruit_name,  # Always from Gemini
+        "ripeness": stage,
+        "confidence": round(top_pred.get("confidence", 0) * 100, 2),
+        "source": "cv_model",
+    }
+
+
+def analyze_image(image, include_safety=False):
     """
     Analyze fruit image using CV model for ripeness detection.
     Always uses Gemini for fruit name.
+    Tries the local stage classifier first and only calls remote models for
+    ripeness when it is not confident.
     Falls back to Gemini for ripeness if CV model fails or is not available.
+
+    Gemini is asked once: a name-only prompt when the local classifier is
+    confident, otherwise one combined name + ripeness prompt whose ripeness
+    doubles as the fallback.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        include_safety: Also return is_safe_to_eat, days_until_discard and
+                        storage_tips from the same Gemini request
     """
-    # ALWAYS get fruit name from Gemini (more reliable)
-    fruit_info = get_fruit_name(image_bytes)
-    fruit_name = fruit_info.get("fruit_name", "unknown")
+    image = as_decoded_image(image)
 
-    # If Roboflow client is not available, use Gemini directly
-    if CLIENT is None:
-        print("⚠️ Roboflow not available, using Gemini for ripeness detection...")
-        gemini_result = analyze_ripeness_with_gemini(image_bytes)
+    local_result = _classify_locally(image)
+    if local_result is not None and not include_safety:
+        fruit_info = get_fruit_name(image)
+        return _local_prediction_result(
+            fruit_info.get("fruit_name", "unknown"), local_result
+        )
 
-        if "error" not in gemini_result:
-            return {
-                "fruit_name": fruit_name,
-                "ripeness": gemini_result.get("ripeness", "unknown"),
-                "confidence": gemini_result.get("confidence", 70.0),
-                "source": "gemini_primary",
-            }
-        else:
-            return {"error": "Gemini analysis failed"}
+    gemini_result = analyze_fruit_with_gemini(image, include_safety=include_safety)
+    fruit_name = gemini_result.get("fruit_name", "unknown")
 
-    try:
-        image_stream = BytesIO(image_bytes)
-        image = Image.open(image_stream).convert("RGB")
-        image = image.resize((640, 640))
+    if local_result is not None:
+        return _with_safety(
+            _local_prediction_result(fruit_name, local_result), gemini_result
+        )
 
-        result = CLIENT.infer(image, model_id="fruit-ripeness-unjex/2")
+    # If Roboflow client is not available, use Gemini directly
+    client = get_client()
+    if client is None:
+        logger.debug("Roboflow not available, using Gemini for ripeness detection")
+        return _gemini_ripeness_result(
+            gemini_result, "gemini_primary", "Gemini analysis failed"
+        )
+
+    try:
+        cv_image = _prepare_cv_image(image)
+        with span("roboflow_infer"):
+            result = call_with_timeout(
+                "roboflow_infer",
+                client.infer,
+                cv_image,
+                model_id=ROBOFLOW_MODEL_ID,
+                breaker=ROBOFLOW_BREAKER,
+            )
 
         preds = result.get("predictions", [])
 
         # If CV model has no predictions, use Gemini as fallback
         if not preds:
-            print("⚠️ No predictions from CV model, falling back to Gemini...")
-            gemini_result = analyze_ripeness_with_gemini(image_bytes)
-
-            if "error" not in gemini_result:
-                return {
-                    "fruit_name": fruit_name,  # Use Gemini's fruit name
-                    "ripeness": gemini_result.get("ripeness", "unknown"),
-                    "confidence": gemini_result.get("confidence", 70.0),
-                    "source": "gemini_fallback",
-                }
-            else:
-                return {
-                    "error": "No predictions found from CV model and Gemini fallback failed"
-                }
+            logger.info("No predictions from CV model, falling back to Gemini")
+            return _gemini_ripeness_result(
+                gemini_result,
+                "gemini_fallback",
+                "No predictions found from CV model and Gemini fallback failed",
+            )
 
         # CV model has predictions - use them for ripeness
-        top_pred = max(preds, key=lambda x: x.get("confidence", 0))
-        raw_class = top_pred.get("class", "unknown")
-        stage = raw_class.split()[-1] if raw_class != "unknown" else "unknown"
-
-        return {
-            "fruit_name": fruit_name,  # Always from Gemini
-            "ripeness": stage,
-            "confidence": round(top_pred.get("confidence", 0) * 100, 2),
-            "source": "cv_model",
-        }
+        return _with_safety(_cv_prediction_result(fruit_name, preds), gemini_result)
 
     except Exception as e:
-        print(f"❌ Error in CV model, falling back to Gemini: {e}")
+        _log_cv_error("Error in CV model, falling back to Gemini", e)
         # If CV model fails entirely, use Gemini
-        gemini_result = analyze_ripeness_with_gemini(image_bytes)
+        return _gemini_ripeness_result(
+            gemini_result,
+            "gemini_fallback",
+            f"CV model error and Gemini fallback failed: {str(e)}",
+        )
 
-        if "error" not in gemini_result:
-            return {
-                "fruit_name": fruit_name,  # Use Gemini's fruit name
-                "ripeness": gemini_result.get("ripeness", "unknown"),
-                "confidence": gemini_result.get("confidence", 70.0),
-                "source": "gemini_fallback",
+
+async def _infer_ripeness_async(client, image):
+    cv_image = await image_pool.run(_prepare_cv_image, image)
+    with span("roboflow_infer"):
+        result = await call_with_timeout_async(
+            "roboflow_infer",
+            client.infer_async(cv_image, model_id=ROBOFLOW_MODEL_ID),
+            breaker=ROBOFLOW_BREAKER,
+        )
+    return result.get("predictions", [])
+
+
+async def _roboflow_or_hedge(roboflow_task, gemini_task):
+    """
+    Wait for Roboflow, hedging with the Gemini analysis once it is slow.
+
+    Until Roboflow's observed p90 it is waited for on its own. Past that,
+    whichever of Roboflow and the (already running) Gemini analysis answers
+    first is used, so a slow Roboflow call costs at most the Gemini latency
+    instead of its own tail.
+
+    Returns:
+        list: Roboflow predictions, or None if the Gemini answer won
+    """
+    hedge_delay = latency_tracker("roboflow_infer").hedge_delay()
+    done, _ = await asyncio.wait({roboflow_task}, timeout=hedge_delay)
+    if done:
+        return roboflow_task.result()
+
+    await asyncio.wait(
+        {roboflow_task, gemini_task}, return_when=asyncio.FIRST_COMPLETED
+    )
+    if roboflow_task.done():
+        HEDGES.inc(winner="roboflow")
+        return roboflow_task.result()
+
+    if "error" not in gemini_task.result():
+        roboflow_task.cancel()
+        HEDGES.inc(winner="gemini")
+        logger.info(
+            "Roboflow slower than its p90, using Gemini ripeness",
+            extra={"hedge_delay": hedge_delay},
+        )
+        return None
+
+    # Gemini finished first but failed, so nobody won the race; Roboflow is
+    # still the only answer
+    HEDGES.inc(winner="hedge_failed")
+    return await roboflow_task
+
+
+async def analyze_image_async(image, include_safety=False):
+    """
+    Async variant of analyze_image.
+
+    After the local stage classifier, the single Gemini request and the
+    Roboflow inference run concurrently, so the request waits for the slower
+    of the two instead of their sum, and a Roboflow miss needs no extra
+    Gemini call.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        include_safety: Also return is_safe_to_eat, days_until_discard and
+                        storage_tips from the same Gemini request
+    """
+    image = as_decoded_image(image)
+
+    local_result = await image_pool.run(_classify_locally, image)
+    if local_result is not None and not include_safety:
+        fruit_info = await get_fruit_name_async(image)
+        return _local_prediction_result(
+            fruit_info.get("fruit_name", "unknown"), local_result
+        )
+
+    gemini_task = asyncio.create_task(
+        analyze_fruit_with_gemini_async(image, include_safety=include_safety)
+    )
+
+    if local_result is not None:
+        gemini_result = await gemini_task
+        return _with_safety(
+            _local_prediction_result(
+                gemini_result.get("fruit_name", "unknown"), local_result
+            ),
+            gemini_result,
+        )
+
+    client = await get_client_async()
+    if client is None:
+        logger.debug("Roboflow not available, using Gemini for ripeness detection")
+        return _gemini_ripeness_result(
+            await gemini_task, "gemini_primary", "Gemini analysis failed"
+        )
+
+    roboflow_task = asyncio.create_task(_infer_ripeness_async(client, image))
+    try:
+        preds = await _roboflow_or_hedge(roboflow_task, gemini_task)
+    except Exception as e:
+        _log_cv_error("Error in CV model, falling back to Gemini", e)
+        return _gemini_ripeness_result(
+            await gemini_task,
+            "gemini_fallback",
+            f"CV model error and Gemini fallback failed: {str(e)}",
+        )
+
+    gemini_result = await gemini_task
+    if preds is None:
+        return _gemini_ripeness_result(
+            gemini_result,
+            "gemini_fallback",
+            "CV model too slow and Gemini fallback failed",
+        )
+    if not preds:
+        logger.info("No predictions from CV model, falling back to Gemini")
+        return _gemini_ripeness_result(
+            gemini_result,
+            "gemini_fallback",
+            "No predictions found from CV model and Gemini fallback failed",
+        )
+
+    return _with_safety(
+        _cv_prediction_result(gemini_result.get("fruit_name", "unknown"), preds),
+        gemini_result,
+    )
+
+
+def _detections(image, preds):
+    """
+    Roboflow predictions -> detections with boxes in rgb pixels, best first.
+
+    Boxes are also returned normalized to 0..1 of the upright photo, so
+    clients can draw them at any display size.
+    """
+    width, height = image.rgb.size
+    detections = []
+    for pred in sorted(preds, key=lambda p: p.get("confidence", 0), reverse=True):
+        if pred.get("confidence", 0) < DETECT_MIN_CONFIDENCE:
+            continue
+        try:
+            box = image.box_from_letterbox(
+                pred["x"], pred["y"], pred["width"], pred["height"]
+            )
+        except (KeyError, TypeError):
+            continue
+        left, top, right, bottom = box
+        if min(right - left, bottom - top) < DETECT_MIN_BOX_SIDE:
+            continue
+        detections.append(
+            {
+                "fruit_name": "unknown",
+                "ripeness": _stage_from_class(pred.get("class", "unknown")),
+                "confidence": round(pred.get("confidence", 0) * 100, 2),
+                "box": {
+                    "x_min": round(left / width, 4),
+                    "y_min": round(top / height, 4),
+                    "x_max": round(right / width, 4),
+                    "y_max": round(bottom / height, 4),
+                },
+                "_pixels": box,
             }
+        )
+        if len(detections) == DETECT_MAX_FRUITS:
+            break
+    return detections
+
+
+def _whole_image_detection(result):
+    detection = {
+        field: result[field]
+        for field in ("fruit_name", "ripeness", "confidence")
+        if field in result
+    }
+    detection["box"] = {"x_min": 0.0, "y_min": 0.0, "x_max": 1.0, "y_max": 1.0}
+    return {**result, "detections": [detection]}
+
+
+async def detect_fruits_async(image):
+    """
+    Multi-fruit variant of analyze_image_async for photos of several fruits.
+
+    Every Roboflow detection is kept (not just the most confident one), each
+    with its box and ripeness stage. The detected fruits are then cropped
+    and named by one batched multi-image Gemini prompt rather than a prompt
+    per crop.
+
+    Without Roboflow, or when it finds nothing, the whole photo is analyzed
+    as a single fruit and reported as one detection covering the image.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: The most confident detection's fruit_name, ripeness, confidence
+              and source at the top level (as analyze_image returns), plus
+              "detections": [{"fruit_name", "ripeness", "confidence",
+              "box": {"x_min", "y_min", "x_max", "y_max"}}, ...] best first,
+              with box coordinates as fractions of the image size
+    """
+    image = as_decoded_image(image)
+
+    preds = []
+    client = await get_client_async()
+    if client is not None:
+        try:
+            preds = await _infer_ripeness_async(client, image)
+        except Exception as e:
+            _log_cv_error("Error in CV model, analyzing the whole image instead", e)
+
+    detections = _detections(image, preds)
+    if not detections:
+        logger.info("No fruits detected, analyzing the whole image")
+        result = await analyze_image_async(image)
+        if "error" in result:
+            return result
+        return _whole_image_detection(result)
+
+    crops = await asyncio.gather(
+        *(
+            image_pool.run(image.crop, detection.pop("_pixels"), DETECT_CROP_MARGIN)
+            for detection in detections
+        )
+    )
+    names = await get_fruit_names_batch_async(crops)
+    for detection, name in zip(detections, names):
+        detection["fruit_name"] = name.get("fruit_name", "unknown")
+
+    PREDICTIONS.inc(source="cv_model")
+    top = detections[0]
+    return {
+        "fruit_name": top["fruit_name"],
+        "ripeness": top["ripeness"],
+        "confidence": top["confidence"],
+        "source": "cv_model",
+        "detections": detections,
+    }
+
+
+async def analyze_images_async(images):
+    """
+    Batch variant of analyze_image_async for several images.
+
+    Images the local classifier is confident about only need a name, which
+    they get from one multi-image Gemini prompt. The others go to Roboflow in
+    a single batched call while a batched Gemini name + ripeness prompt runs
+    alongside as the fallback.
+
+    Args:
+        images: List of DecodedImage (or raw image bytes)
+
+    Returns:
+        list: One analyze_image-shaped result per image, in order
+    """
+    images = [as_decoded_image(image) for image in images]
+
+    local_results = await asyncio.gather(
+        *(image_pool.run(_classify_locally, image) for image in images)
+    )
+    confident = [i for i, local in enumerate(local_results) if local is not None]
+    pending = [i for i, local in enumerate(local_results) if local is None]
+
+    names_task = None
+    if confident:
+        names_task = asyncio.create_task(
+            get_fruit_names_batch_async([images[i] for i in confident])
+        )
+    gemini_task = None
+    if pending:
+        gemini_task = asyncio.create_task(
+            analyze_ripeness_batch_async([images[i] for i in pending])
+        )
+
+    cv_preds = {}
+    gemini_source = "gemini_primary"
+    error_message = "Gemini analysis failed"
+
+    client = await get_client_async() if pending else None
+    if client is not None:
+        gemini_source = "gemini_fallback"
+        error_message = "No predictions found from CV model and Gemini fallback failed"
+        try:
+            cv_images = await asyncio.gather(
+                *(image_pool.run(_prepare_cv_image, images[i]) for i in pending)
+            )
+            with span("roboflow_infer_batch"):
+                responses = await call_with_timeout_async(
+                    "roboflow_infer_batch",
+                    client.infer_async(cv_images, model_id=ROBOFLOW_MODEL_ID),
+                    breaker=ROBOFLOW_BREAKER,
+                )
+            if isinstance(responses, dict):
+                responses = [responses]
+            for i, response in zip(pending, responses):
+                preds = response.get("predictions", [])
+                if preds:
+                    cv_preds[i] = preds
+        except Exception as e:
+            _log_cv_error("Error in batched CV model call, falling back to Gemini", e)
+            error_message = f"CV model error and Gemini fallback failed: {str(e)}"
+
+    names = dict(zip(confident, await names_task)) if names_task else {}
+    gemini_results = dict(zip(pending, await gemini_task)) if gemini_task else {}
+
+    results = []
+    for i, local_result in enumerate(local_results):
+        if local_result is not None:
+            fruit_name = names[i].get("fruit_name", "unknown")
+            results.append(_local_prediction_result(fruit_name, local_result))
+        elif i in cv_preds:
+            fruit_name = gemini_results[i].get("fruit_name", "unknown")
+            results.append(_cv_prediction_result(fruit_name, cv_preds[i]))
         else:
-            return {"error": f"CV model error and Gemini fallback failed: {str(e)}"}
+            results.append(
+                _gemini_ripeness_result(gemini_results[i], gemini_source, error_message)
+            )
+    return results
 
 
 if __name__ == "__main__":
     with open("../images/ripe_mango.jpg", "rb") as image_file:
-        image_bytes = image_file.read()
-    output = analyze_image(image_bytes)
+        image = DecodedImage.from_bytes(image_file.read())
+    output = analyze_image(image)
     print(output)
@@ -0,0 +1,154 @@
+import base64
+import os
+from io import BytesIO
+
+from dotenv import load_dotenv
+from PIL import Image
+from services.image_pool import image_pool
+from services.image_service import as_decoded_image
+from services.logging_service import get_logger
+from services.metrics_service import span
+from services.stage_classifier import fruit_mask
+
+load_dotenv()
+
+logger = get_logger("explainability")
+
+# As in stage_classifier, NumPy is imported by the functions that use it
+
+EXPLAIN_ENABLED = os.getenv("EXPLAIN_ENABLED", "true").lower() in ("1", "true", "yes")
+# Longest side the maps (and the overlay PNG) are computed at
+EXPLAIN_MAX_SIDE = int(os.getenv("EXPLAIN_MAX_SIDE", "160"))
+
+# Pixels deviating from the fruit's dominant color by more than this count
+# as blemishes (spots, bruises, mould)
+BLEMISH_DEVIATION = 0.5
+# How strongly the heat colors cover the fruit in the overlay
+OVERLAY_ALPHA = 0.55
+
+# Heat colors for ripeness scores 0 (unripe) .. 0.5 (ripe) .. 1 (overripe)
+_COLORMAP_STOPS = (0.0, 0.5, 1.0)
+_COLORMAP_COLORS = ((46, 160, 67), (250, 204, 21), (120, 53, 15))
+
+
+def _hsv(image):
+    import numpy as np
+
+    hsv = np.asarray(image.convert("HSV"), dtype=np.float32) / 255.0
+    return hsv[..., 0] * 360.0, hsv[..., 1], hsv[..., 2]
+
+
+def ripeness_map(hue, val):
+    """
+    Per-pixel ripeness score in [0, 1]: 0 unripe, ~0.5 ripe, 1 overripe.
+
+    Green hues score 0 and rise through yellow-green towards the ripe
+    plateau; any warm hue counts as ripe. Darkening (browning) then pushes
+    the score towards 1.
+    """
+    import numpy as np
+
+    # Purples/magentas (>= 170 degrees) are treated like the warm end
+    hue_score = np.where(hue < 170, np.clip((120.0 - hue) / 120.0, 0.0, 0.6), 0.6)
+    darkness = np.clip((0.55 - val) / 0.35, 0.0, 1.0)
+    return hue_score + (1.0 - hue_score) * darkness
+
+
+def deviation_map(hue, sat, val, mask):
+    """
+    Per-pixel color distance from the fruit's dominant color, in [0, 1].
+
+    The dominant hue is a circular mean (reds straddle 0/360 degrees), and
+    hue distance is weighted by saturation so grey-ish pixels don't produce
+    large hue jumps.
+    """
+    import numpy as np
+
+    angles = np.radians(hue[mask])
+    dominant_hue = np.degrees(np.arctan2(np.sin(angles).mean(), np.cos(angles).mean()))
+    dominant_hue %= 360.0
+    median_sat = np.median(sat[mask])
+    median_val = np.median(val[mask])
+
+    hue_delta = np.abs(hue - dominant_hue)
+    hue_delta = np.minimum(hue_delta, 360.0 - hue_delta) / 180.0
+    distance = np.sqrt(
+        (hue_delta * np.minimum(sat, median_sat)) ** 2
+        + (sat - median_sat) ** 2
+        + (val - median_val) ** 2
+    )
+    return np.clip(distance / 0.5, 0.0, 1.0)
+
+
+def _colorize(scores):
+    import numpy as np
+
+    channels = [
+        np.interp(
+            scores, _COLORMAP_STOPS, [color[channel] for color in _COLORMAP_COLORS]
+        )
+        for channel in range(3)
+    ]
+    return np.stack(channels, axis=-1)
+
+
+def overlay_png(image, scores, mask):
+    """
+    PNG of the image with the ripeness heat colors blended over the fruit.
+
+    Background pixels are shown in dimmed greyscale so the fruit stands out.
+    """
+    import numpy as np
+
+    pixels = np.asarray(image, dtype=np.float32)
+    grey = pixels.mean(axis=-1, keepdims=True) * 0.6
+    blended = pixels * (1 - OVERLAY_ALPHA) + _colorize(scores) * OVERLAY_ALPHA
+    composite = np.where(mask[..., None], blended, grey)
+
+    buffer = BytesIO()
+    Image.fromarray(composite.astype(np.uint8), "RGB").save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def explain(image):
+    """
+    Explain a ripeness call with color maps computed on the CPU.
+
+    Everything is vectorized NumPy over HSV at EXPLAIN_MAX_SIDE, which keeps
+    it to a few milliseconds per image (call off the event loop).
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: {"ripeness_score", "color_deviation", "blemish_ratio",
+               "fruit_coverage", "overlay_png" (base64)}, where the scores
+              are averages over the fruit pixels
+    """
+    image = as_decoded_image(image)
+    with span("explain"):
+        small = image.gemini_input.copy()
+        small.thumbnail((EXPLAIN_MAX_SIDE, EXPLAIN_MAX_SIDE))
+
+        hue, sat, val = _hsv(small)
+        mask = fruit_mask(sat, val)
+        scores = ripeness_map(hue, val)
+        deviation = deviation_map(hue, sat, val, mask)
+        png = overlay_png(small, scores, mask)
+
+    return {
+        "ripeness_score": round(float(scores[mask].mean()), 4),
+        "color_deviation": round(float(deviation[mask].mean()), 4),
+        "blemish_ratio": round(float((deviation[mask] > BLEMISH_DEVIATION).mean()), 4),
+        "fruit_coverage": round(float(mask.mean()), 4),
+        "overlay_png": base64.b64encode(png).decode("ascii"),
+    }
+
+
+async def explain_async(image):
+    """explain() on the image pool; errors are returned, not raised."""
+    try:
+        return await image_pool.run(explain, image)
+    except Exception as e:
+        logger.error("Error explaining image: %s", e)
+        return {"error": str(e)}
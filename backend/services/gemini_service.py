@@ -1,96 +1,193 @@
+import asyncio
 import json
 import os
 import re
-from io import BytesIO
+import threading
+from typing import List
 
-import google.generativeai as genai
 from dotenv import load_dotenv
-from PIL import Image
+from models.prediction_model import (
+    DEFAULT_CONFIDENCE,
+    RIPENESS_STAGES,
+    FruitAnalysis,
+    NutritionInfo,
+    RecipeAnalysis,
+    RecipeSet,
+    SafetyAnalysis,
+)
+from pydantic import TypeAdapter
+from services.image_pool import image_pool
+from services.image_service import DecodedImage, as_decoded_image
+from services.latency_service import call_with_timeout, call_with_timeout_async
+from services.logging_service import get_logger
+from services.metrics_service import PARSE_FAILURES, span
+from services.rate_limiter import CORE, OPTIONAL, get_limiter
 
 load_dotenv()
 
-# Configure Gemini API
-genai.configure(api_key=os.getenv("GEMINI_API_KEY"))
+logger = get_logger("gemini")
 
-# Initialize the model with vision capabilities - using Gemini 2.0 Flash
-# Configure safety settings to be more permissive for food images
-from google.generativeai.types import HarmBlockThreshold, HarmCategory
+GEMINI_MODEL_NAME = "gemini-2.0-flash-exp"
 
-safety_settings = {
-    HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-    HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-}
+# Built on first use by get_model(): importing google.generativeai takes
+# most of a second, which cold starts shouldn't pay before serving anything.
+# Tests and benchmarks assign a stand-in here directly.
+model = None
+_model_lock = threading.Lock()
 
-model = genai.GenerativeModel("gemini-2.0-flash-exp", safety_settings=safety_settings)
 
+def _build_model():
+    import google.generativeai as genai
+    from google.generativeai.types import HarmBlockThreshold, HarmCategory
 
-def get_fruit_name(image_bytes):
-    """
-    Get the name of the fruit from the image using Gemini Vision API.
+    # gRPC keeps one long-lived HTTP/2 channel per client that every call
+    # (and thread) multiplexes over, so calls don't pay a TLS handshake
+    genai.configure(api_key=os.getenv("GEMINI_API_KEY"), transport="grpc")
 
-    Args:
-        image_bytes: Raw image bytes
+    # Configure safety settings to be more permissive for food images
+    safety_settings = {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+    return genai.GenerativeModel(GEMINI_MODEL_NAME, safety_settings=safety_settings)
+
+
+def get_model():
+    """The Gemini model, configured on first call (thread-safe)."""
+    global model
+    if model is None:
+        with _model_lock:
+            if model is None:
+                with span("gemini_client_init"):
+                    model = _build_model()
+                logger.info("Gemini client initialized (%s)", GEMINI_MODEL_NAME)
+    return model
 
-    Returns:
-        dict: {"fruit_name": "apple"} or {"error": "..."}
-    """
-    try:
-        print("🍎 Getting fruit name from Gemini...")
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
 
-        prompt = """Identify the fruit in this image. Return ONLY the fruit name in lowercase, nothing else.
+async def get_model_async():
+    """get_model() that builds the client off the event loop on first use."""
+    if model is not None:
+        return model
+    return await asyncio.to_thread(get_model)
+
+
+FRUIT_NAME_PROMPT = """Identify the fruit in this image. Return ONLY the fruit name in lowercase, nothing else.
 Examples: apple, banana, mango, strawberry, orange, etc.
 If you cannot identify a fruit, return 'unknown'."""
 
-        response = model.generate_content([prompt, image])
+RIPENESS_PROMPT = """Analyze this fruit image and determine:
+1. The fruit name (e.g., apple, banana, mango, strawberry)
+2. Its ripeness stage: must be one of these exact values: "unripe", "ripe", or "overripe"
 
-        print(
-            f"Fruit name response: {response.text if hasattr(response, 'text') else 'No text'}"
-        )
+Criteria:
+- unripe: green, hard, not ready to eat
+- ripe: perfect for eating, good color, firm
+- overripe: brown spots, very soft, past prime
 
-        if not response or not hasattr(response, "text") or not response.text:
-            print("❌ No fruit name response from Gemini")
-            return {"fruit_name": "unknown"}
+Respond in EXACTLY this JSON format with no additional text:
+{
+  "fruit_name": "name of fruit in lowercase",
+  "ripeness": "unripe/ripe/overripe",
+  "confidence": 85.0
+}"""
 
-        # Clean up the response - remove extra whitespace and convert to lowercase
-        fruit_name = response.text.strip().lower()
+# Extra fields returned by the combined analysis prompt when safety is requested
+ANALYSIS_SAFETY_FIELDS = ("is_safe_to_eat", "days_until_discard", "storage_tips")
 
-        # Remove any punctuation or extra words - just get the fruit name
-        fruit_name = re.sub(r"[^a-z\s]", "", fruit_name)
-        fruit_name = fruit_name.split()[0] if fruit_name.split() else "unknown"
 
-        print(f"✓ Fruit identified: {fruit_name}")
-        return {"fruit_name": fruit_name}
+def _response_schema(schema_type):
+    """
+    Gemini response schema (an OpenAPI subset) for a Pydantic model or type.
 
-    except Exception as e:
-        print(f"❌ Error in get_fruit_name: {e}")
-        import traceback
+    Every property is listed as required so Gemini always emits it; Optional
+    fields become nullable instead.
+    """
+    schema = TypeAdapter(schema_type).json_schema()
+    definitions = schema.pop("$defs", {})
+
+    def convert(node):
+        if "$ref" in node:
+            node = definitions[node["$ref"].rsplit("/", 1)[-1]]
+        if "anyOf" in node:
+            options = [
+                option for option in node["anyOf"] if option.get("type") != "null"
+            ]
+            converted = convert(options[0])
+            if len(options) < len(node["anyOf"]):
+                converted["nullable"] = True
+            return converted
+
+        converted = {"type": node.get("type", "string")}
+        if "enum" in node:
+            converted["enum"] = list(node["enum"])
+        if converted["type"] == "object":
+            properties = node.get("properties", {})
+            converted["properties"] = {
+                name: convert(value) for name, value in properties.items()
+            }
+            converted["required"] = list(properties)
+        elif converted["type"] == "array":
+            converted["items"] = convert(node.get("items", {}))
+        return converted
 
-        traceback.print_exc()
-        return {"fruit_name": "unknown"}
+    return convert(schema)
 
 
-def analyze_ripeness_with_gemini(image_bytes):
+def _json_config(schema_type):
     """
-    Analyze fruit ripeness using Gemini Vision API as a fallback.
-
-    Args:
-        image_bytes: Raw image bytes
+    Ask Gemini for a bare JSON document matching schema_type.
 
-    Returns:
-        dict: {"fruit_name": "apple", "ripeness": "ripe", "confidence": 85.0}
-              or {"error": "..."}
+    A plain dict, which the SDK accepts wherever a GenerationConfig is, so
+    building it doesn't import the SDK.
     """
-    try:
-        print("🔍 Starting Gemini ripeness analysis...")
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
-        print(f"✓ Image loaded: {image.size}")
+    return {
+        "response_mime_type": "application/json",
+        "response_schema": _response_schema(schema_type),
+    }
+
+
+ANALYSIS_CONFIG = _json_config(FruitAnalysis)
+SAFETY_ANALYSIS_CONFIG = _json_config(SafetyAnalysis)
+RECIPES_CONFIG = _json_config(RecipeAnalysis)
+RECIPE_LIBRARY_CONFIG = _json_config(RecipeSet)
+NUTRITION_CONFIG = _json_config(NutritionInfo)
+BATCH_NAMES_CONFIG = _json_config(List[str])
+BATCH_RIPENESS_CONFIG = _json_config(List[FruitAnalysis])
+
+# Parsing helpers, compiled once
+_JSON_DECODER = json.JSONDecoder()
+_NON_LETTERS = re.compile(r"[^a-z\s]")
+# Salvages fields from JSON that was cut off or otherwise malformed
+_JSON_STRING_FIELD = re.compile(r'"(fruit_name|ripeness)"\s*:\s*"([^"]*)"')
+_RIPENESS_WORD = re.compile(r"\b(unripe|overripe|ripe)\b")
+_KNOWN_FRUIT = re.compile(
+    r"\b(apple|banana|mango|strawberry|orange|grape|pear|peach|plum|cherry)\b"
+)
+
+# Max images sent in a single multi-image prompt
+GEMINI_BATCH_SIZE = int(os.getenv("GEMINI_BATCH_SIZE", "8"))
+
+
+def _build_analysis_prompt(include_safety=False):
+    safety_steps = ""
+    safety_fields = ""
+    if include_safety:
+        safety_steps = """
+4. Food safety: is it safe to eat? Mark moldy or rotten fruit as unsafe
+5. Estimated days until it should be discarded (0-14, conservative and safe)
+6. Storage tips: best way to store it to maximize freshness"""
+        safety_fields = (
+            ',\n  "is_safe_to_eat": true,'
+            '\n  "days_until_discard": 3,'
+            '\n  "storage_tips": "one or two sentences"'
+        )
 
-        prompt = """Analyze this fruit image and determine:
-1. The fruit name (e.g., apple, banana, mango, strawberry)
-2. Its ripeness stage: must be one of these exact values: "unripe", "ripe", or "overripe"
+    return f"""Analyze this fruit image and identify the fruit and its ripeness:
+1. The fruit name (e.g., apple, banana, mango, strawberry), or "unknown" if there is no fruit
+2. Its ripeness stage: must be one of these exact values: "unripe", "ripe", or "overripe" ("unknown" if there is no fruit)
+3. Your confidence in the ripeness stage, from 0 to 100{safety_steps}
 
 Criteria:
 - unripe: green, hard, not ready to eat
@@ -98,138 +195,128 @@ Criteria:
 - overripe: brown spots, very soft, past prime
 
 Respond in EXACTLY this JSON format with no additional text:
-{
+{{
   "fruit_name": "name of fruit in lowercase",
   "ripeness": "unripe/ripe/overripe",
-  "confidence": 85.0
-}"""
+  "confidence": 85.0{safety_fields}
+}}"""
 
-        print("📤 Sending to Gemini API...")
-        response = model.generate_content([prompt, image])
 
-        print(f"📥 Response received: {response}")
+def _build_batch_names_prompt(count):
+    return f"""You are given {count} images, in order. Identify the fruit in each image.
+Return ONLY a JSON array of {count} fruit names in lowercase, in the same order as the images.
+Example for 3 images: ["apple", "banana", "unknown"]
+Use "unknown" for any image where you cannot identify a fruit."""
 
-        # Check if response was blocked
-        if hasattr(response, "prompt_feedback"):
-            print(f"Prompt feedback: {response.prompt_feedback}")
 
-        if not response or not hasattr(response, "text") or not response.text:
-            print("❌ No text in response")
-            return {"error": "No response from Gemini"}
+def _build_batch_ripeness_prompt(count):
+    return f"""You are given {count} fruit images, in order. For each image determine:
+1. The fruit name (e.g., apple, banana, mango, strawberry)
+2. Its ripeness stage: must be one of these exact values: "unripe", "ripe", or "overripe" ("unknown" if there is no fruit)
 
-        # Try to parse JSON from response
-        text = response.text.strip()
-        print(f"📝 Response text: {text}")
+Criteria:
+- unripe: green, hard, not ready to eat
+- ripe: perfect for eating, good color, firm
+- overripe: brown spots, very soft, past prime
 
-        # Remove markdown code blocks if present
-        text = re.sub(r"```json\s*", "", text)
-        text = re.sub(r"```\s*", "", text)
+Respond with ONLY a JSON array of {count} objects, in the same order as the images:
+[
+  {{"fruit_name": "name of fruit in lowercase", "ripeness": "unripe/ripe/overripe", "confidence": 85.0}}
+]"""
 
-        try:
-            result = json.loads(text)
-            print(f"✓ JSON parsed successfully: {result}")
-
-            # Validate and clean the response
-            fruit_name = result.get("fruit_name", "unknown").lower()
-            ripeness = result.get("ripeness", "unknown").lower()
-            confidence = float(result.get("confidence", 75.0))
-
-            # Ensure ripeness is one of the valid values
-            if ripeness not in ["unripe", "ripe", "overripe"]:
-                ripeness = "ripe"  # Default to ripe if unclear
-
-            final_result = {
-                "fruit_name": fruit_name,
-                "ripeness": ripeness,
-                "confidence": round(confidence, 2),
-                "source": "gemini",
-            }
-            print(f"✅ Final result: {final_result}")
-            return final_result
-
-        except json.JSONDecodeError as je:
-            print(f"⚠️ JSON decode failed: {je}")
-            # If JSON parsing fails, try to extract info manually
-            text_lower = text.lower()
-
-            # Extract ripeness
-            ripeness = "unknown"
-            if "unripe" in text_lower:
-                ripeness = "unripe"
-            elif "overripe" in text_lower:
-                ripeness = "overripe"
-            elif "ripe" in text_lower:
-                ripeness = "ripe"
-
-            # Try to extract fruit name
-            fruit_name = "unknown"
-            common_fruits = [
-                "apple",
-                "banana",
-                "mango",
-                "strawberry",
-                "orange",
-                "grape",
-                "pear",
-                "peach",
-                "plum",
-                "cherry",
-            ]
-            for fruit in common_fruits:
-                if fruit in text_lower:
-                    fruit_name = fruit
-                    break
-
-            return {
-                "fruit_name": fruit_name,
-                "ripeness": ripeness,
-                "confidence": 70.0,
-                "source": "gemini",
-            }
 
-    except Exception as e:
-        print(f"❌ Error in analyze_ripeness_with_gemini: {e}")
-        return {"error": str(e)}
+def _gemini_image(image):
+    return as_decoded_image(image).gemini_payload
+
+
+# Nutrition and library recipes are optional sections of a /predict
+# response; when the request budget runs low they give way to name and
+# ripeness calls. Callers for whom they are the whole answer (/recipes)
+# pass priority=CORE.
+OPTIONAL_STAGES = frozenset(
+    {
+        "gemini_nutrition",
+        "gemini_recipe_library",
+    }
+)
+
+
+def _priority(stage, priority=None):
+    if priority is not None:
+        return priority
+    return OPTIONAL if stage in OPTIONAL_STAGES else CORE
 
 
-def get_recipes_and_safety(image_bytes, fruit_name=None, ripeness=None):
+def _check_quota_error(error):
+    # google.api_core's ResourceExhausted (HTTP 429): our budget is too high
+    # for the real quota, so let the bucket run dry for a while
+    if getattr(error, "code", None) == 429 or type(error).__name__ == (
+        "ResourceExhausted"
+    ):
+        get_limiter(GEMINI_MODEL_NAME).backoff()
+
+
+def _generate(stage, contents, priority=None, **kwargs):
+    limiter = get_limiter(GEMINI_MODEL_NAME)
+    with span(stage):
+        # The token is taken only once the circuit breaker admits the call,
+        # so an open circuit doesn't spend the budget
+        try:
+            return call_with_timeout(
+                stage,
+                get_model().generate_content,
+                contents,
+                admit=lambda: limiter.acquire(_priority(stage, priority)),
+                **kwargs,
+            )
+        except Exception as e:
+            _check_quota_error(e)
+            raise
+
+
+async def _generate_async(stage, contents, priority=None, **kwargs):
+    limiter = get_limiter(GEMINI_MODEL_NAME)
+    with span(stage):
+        try:
+            return await call_with_timeout_async(
+                stage,
+                (await get_model_async()).generate_content_async(contents, **kwargs),
+                admit=lambda: limiter.acquire_async(_priority(stage, priority)),
+            )
+        except Exception as e:
+            _check_quota_error(e)
+            raise
+
+
+def _extract_json(text, opener="{"):
     """
-    Get recipe suggestions, food safety information, and estimated shelf life
-    based on fruit image and ripeness level.
+    Decode the JSON document embedded in model output.
 
-    Args:
-        image_bytes: Raw image bytes
-        fruit_name: Optional fruit name (if already detected)
-        ripeness: Optional ripeness level (if already detected)
+    Decoding starts at the first `opener` ("{" or "[") and stops at the end
+    of that document, so code fences and prose around it are skipped in a
+    single pass without rewriting the text.
 
-    Returns:
-        dict: {
-            "fruit_name": "banana",
-            "ripeness": "ripe",
-            "is_safe_to_eat": true,
-            "days_until_discard": 3,
-            "storage_tips": "...",
-            "recipes": [
-                {
-                    "name": "Banana Smoothie",
-                    "difficulty": "easy",
-                    "prep_time": "5 minutes",
-                    "ingredients": [...],
-                    "instructions": "..."
-                }
-            ]
-        }
+    Raises:
+        ValueError: If no complete JSON document starts there
     """
-    try:
-        print("🍳 Getting recipes and safety info from Gemini...")
-        image = Image.open(BytesIO(image_bytes)).convert("RGB")
+    start = text.find(opener)
+    if start < 0:
+        raise ValueError("No JSON document in model response")
+    return _JSON_DECODER.raw_decode(text, start)[0]
 
-        # Build context from provided info
-        context = ""
-        if fruit_name and ripeness:
-            context = f"\nThe fruit has been identified as: {fruit_name}\nCurrent ripeness: {ripeness}"
 
-        prompt = f"""Analyze this fruit image and provide comprehensive information to reduce food waste.{context}
+def _validated(model, data):
+    """Validate parsed output against a response model, dropping unset fields."""
+    return model.model_validate(data).model_dump(exclude_none=True)
+
+
+def _build_recipe_prompt(fruit_name=None, ripeness=None):
+    # Build context from provided info
+    context = ""
+    if fruit_name and ripeness:
+        context = f"\nThe fruit has been identified as: {fruit_name}\nCurrent ripeness: {ripeness}"
+
+    return f"""Analyze this fruit image and provide comprehensive information to reduce food waste.{context}
 
 Please provide:
 1. **Fruit identification** (if not already provided)
@@ -306,67 +393,33 @@ Important:
 - Days until discard should be conservative and safe
 - Recipes must be practical and use the fruit at its current ripeness"""
 
-        print("📤 Sending recipe request to Gemini...")
-        response = model.generate_content([prompt, image])
-
-        if hasattr(response, "prompt_feedback"):
-            print(f"Prompt feedback: {response.prompt_feedback}")
-
-        if not response or not hasattr(response, "text") or not response.text:
-            print("❌ No response from Gemini for recipes")
-            return {"error": "No response from Gemini"}
 
-        text = response.text.strip()
-        print(f"📝 Recipe response length: {len(text)} chars")
+def _build_recipe_library_prompt(fruit_name, ripeness):
+    return f"""Suggest storage tips and 3 recipes for a {ripeness} {fruit_name}, chosen to use the fruit at this ripeness and reduce food waste.
 
-        # Remove markdown code blocks if present
-        text = re.sub(r"```json\s*", "", text)
-        text = re.sub(r"```\s*", "", text)
+- unripe: recipes that work with firm, tart fruit, or how to ripen it
+- ripe: best-use recipes for peak freshness
+- overripe: recipes that use very soft or spotted fruit (smoothies, baking, etc.)
 
-        try:
-            result = json.loads(text)
-            print(f"✅ Recipe data parsed successfully")
-            print(f"   - Fruit: {result.get('fruit_name')}")
-            print(f"   - Safe to eat: {result.get('is_safe_to_eat')}")
-            print(f"   - Days remaining: {result.get('days_until_discard')}")
-            print(f"   - Recipes: {len(result.get('recipes', []))}")
-
-            return result
-
-        except json.JSONDecodeError as je:
-            print(f"⚠️ Failed to parse recipe JSON: {je}")
-            print(f"Response text: {text[:500]}...")
-
-            # Return a minimal response if parsing fails
-            return {
-                "error": "Failed to parse recipe response",
-                "raw_response": text[:1000],
-            }
-
-    except Exception as e:
-        print(f"❌ Error in get_recipes_and_safety: {e}")
-        import traceback
-
-        traceback.print_exc()
-        return {"error": str(e)}
-
-
-def get_nutrition_and_impact(fruit_name, ripeness="ripe"):
-    """
-    Get nutritional information and environmental impact for a fruit.
-    This doesn't require an image - just uses the fruit name.
-
-    Args:
-        fruit_name: Name of the fruit
-        ripeness: Ripeness level (affects nutrition slightly)
+Respond in EXACTLY this JSON format with no additional text:
+{{
+  "storage_tips": "one or two sentences",
+  "recipes": [
+    {{
+      "name": "Banana Bread",
+      "difficulty": "easy",
+      "prep_time": "15 minutes",
+      "cook_time": "60 minutes",
+      "why_this_ripeness": "one sentence",
+      "ingredients": ["3 overripe bananas, mashed", "..."],
+      "instructions": "1. ... 2. ..."
+    }}
+  ]
+}}"""
 
-    Returns:
-        dict: Nutrition facts and environmental impact
-    """
-    try:
-        print(f"📊 Getting nutrition info for {fruit_name} ({ripeness})...")
 
-        prompt = f"""Provide nutritional information and environmental impact for a {ripeness} {fruit_name}.
+def _build_nutrition_prompt(fruit_name, ripeness):
+    return f"""Provide nutritional information and environmental impact for a {ripeness} {fruit_name}.
 
 Return data in this EXACT JSON format:
 {{
@@ -397,42 +450,595 @@ Return data in this EXACT JSON format:
 
 Be accurate with nutritional data. Environmental data should be realistic estimates."""
 
-        response = model.generate_content(prompt)
 
-        if not response or not hasattr(response, "text") or not response.text:
-            return {"error": "No response from Gemini"}
+def _clean_fruit_name(text):
+    # Lowercase, drop punctuation and extra words - just get the fruit name
+    words = _NON_LETTERS.sub("", text.strip().lower()).split()
+    return words[0] if words else "unknown"
+
+
+def _parse_fruit_name_response(response):
+    logger.debug(
+        "Fruit name response: %s", getattr(response, "text", None) or "No text"
+    )
+
+    if not response or not hasattr(response, "text") or not response.text:
+        logger.error("No fruit name response from Gemini")
+        return {"fruit_name": "unknown"}
+
+    fruit_name = _clean_fruit_name(response.text)
+
+    logger.debug("Fruit identified: %s", fruit_name)
+    return {"fruit_name": fruit_name}
+
+
+def _clean_ripeness_result(result, model=FruitAnalysis):
+    return {**_validated(model, result), "source": "gemini"}
+
+
+def _salvage_ripeness_result(text):
+    """Best-effort fruit and ripeness from output that is not valid JSON."""
+    fields = dict(_JSON_STRING_FIELD.findall(text))
+    text_lower = text.lower()
+
+    fruit_name = fields.get("fruit_name")
+    if not fruit_name:
+        match = _KNOWN_FRUIT.search(text_lower)
+        fruit_name = match.group(1) if match else "unknown"
+
+    ripeness = fields.get("ripeness", "").lower()
+    if ripeness not in RIPENESS_STAGES:
+        match = _RIPENESS_WORD.search(text_lower)
+        ripeness = match.group(1) if match else "unknown"
+
+    return {
+        "fruit_name": _clean_fruit_name(fruit_name),
+        "ripeness": ripeness,
+        "confidence": DEFAULT_CONFIDENCE,
+        "source": "gemini",
+    }
+
+
+def _parse_analysis_response(response, include_safety=False):
+    logger.debug("Response received: %s", response)
+
+    # Check if response was blocked
+    if hasattr(response, "prompt_feedback"):
+        logger.debug("Prompt feedback: %s", response.prompt_feedback)
+
+    if not response or not hasattr(response, "text") or not response.text:
+        logger.error("No text in response")
+        return {"error": "No response from Gemini"}
+
+    text = response.text
+    logger.debug("Response text: %s", text)
+
+    try:
+        result = _clean_ripeness_result(
+            _extract_json(text), SafetyAnalysis if include_safety else FruitAnalysis
+        )
+    except ValueError as e:
+        PARSE_FAILURES.inc(kind="ripeness")
+        logger.warning("Could not parse ripeness JSON: %s", e)
+        # The salvaged result has no safety info
+        return _salvage_ripeness_result(text)
+
+    logger.debug("Ripeness result: %s", result)
+    return result
+
+
+def _parse_json_array(response, count):
+    """Parse a JSON array of exactly `count` items, or return None."""
+    if not response or not hasattr(response, "text") or not response.text:
+        return None
+    try:
+        items = _extract_json(response.text, "[")
+    except ValueError:
+        PARSE_FAILURES.inc(kind="batch")
+        return None
+    if not isinstance(items, list) or len(items) != count:
+        return None
+    return items
+
+
+def _parse_recipes_response(response, model=RecipeAnalysis):
+    if hasattr(response, "prompt_feedback"):
+        logger.debug("Prompt feedback: %s", response.prompt_feedback)
+
+    if not response or not hasattr(response, "text") or not response.text:
+        logger.error("No response from Gemini for recipes")
+        return {"error": "No response from Gemini"}
+
+    return _parse_recipes_text(response.text, model)
+
+
+def _parse_recipes_text(text, model=RecipeAnalysis):
+    if not text or not text.strip():
+        logger.error("No response from Gemini for recipes")
+        return {"error": "No response from Gemini"}
+
+    logger.debug("Recipe response length: %s chars", len(text))
+
+    try:
+        result = _validated(model, _extract_json(text))
+    except ValueError as e:
+        PARSE_FAILURES.inc(kind="recipes")
+        logger.warning("Failed to parse recipe JSON: %s", e)
+        logger.debug("Response text: %s...", text[:500])
+
+        # Return a minimal response if parsing fails
+        return {
+            "error": "Failed to parse recipe response",
+            "raw_response": text[:1000],
+        }
+
+    logger.debug(
+        "Recipe data parsed",
+        extra={
+            "fruit": result.get("fruit_name"),
+            "safe_to_eat": result.get("is_safe_to_eat"),
+            "days_remaining": result.get("days_until_discard"),
+            "recipes": len(result["recipes"]),
+        },
+    )
+    return result
+
+
+def _parse_nutrition_response(response, fruit_name):
+    if not response or not hasattr(response, "text") or not response.text:
+        return {"error": "No response from Gemini"}
+
+    try:
+        result = _validated(NutritionInfo, _extract_json(response.text))
+    except ValueError:
+        PARSE_FAILURES.inc(kind="nutrition")
+        raise
+    logger.debug("Nutrition data retrieved for %s", fruit_name)
+    return result
+
+
+def get_fruit_name(image):
+    """
+    Get the name of the fruit from the image using Gemini Vision API.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: {"fruit_name": "apple"} or {"error": "..."}
+    """
+    try:
+        logger.debug("Getting fruit name from Gemini...")
+        image_part = _gemini_image(image)
+
+        response = _generate("gemini_fruit_name", [FRUIT_NAME_PROMPT, image_part])
+        with span("parse_fruit_name"):
+            return _parse_fruit_name_response(response)
+
+    except Exception as e:
+        logger.exception("Error in get_fruit_name: %s", e)
+        return {"fruit_name": "unknown"}
+
+
+async def get_fruit_name_async(image):
+    """
+    Async variant of get_fruit_name that does not block the event loop.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: {"fruit_name": "apple"}
+    """
+    try:
+        logger.debug("Getting fruit name from Gemini (async)...")
+        image_part = await image_pool.run(_gemini_image, image)
+
+        response = await _generate_async(
+            "gemini_fruit_name", [FRUIT_NAME_PROMPT, image_part]
+        )
+        with span("parse_fruit_name"):
+            return _parse_fruit_name_response(response)
+
+    except Exception as e:
+        logger.error("Error in get_fruit_name_async: %s", e)
+        return {"fruit_name": "unknown"}
+
+
+def analyze_ripeness_with_gemini(image):
+    """
+    Analyze fruit ripeness using Gemini Vision API as a fallback.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: {"fruit_name": "apple", "ripeness": "ripe", "confidence": 85.0}
+              or {"error": "..."}
+    """
+    try:
+        logger.debug("Starting Gemini ripeness analysis...")
+        image_part = _gemini_image(image)
+        logger.debug("Image prepared: %s bytes", len(image_part["data"]))
+
+        response = _generate(
+            "gemini_ripeness",
+            [RIPENESS_PROMPT, image_part],
+            generation_config=ANALYSIS_CONFIG,
+        )
+        with span("parse_ripeness"):
+            return _parse_analysis_response(response)
+
+    except Exception as e:
+        logger.error("Error in analyze_ripeness_with_gemini: %s", e)
+        return {"error": str(e)}
+
+
+async def analyze_ripeness_with_gemini_async(image):
+    """
+    Async variant of analyze_ripeness_with_gemini.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+
+    Returns:
+        dict: {"fruit_name": "apple", "ripeness": "ripe", "confidence": 85.0}
+              or {"error": "..."}
+    """
+    try:
+        logger.debug("Starting Gemini ripeness analysis (async)...")
+        image_part = await image_pool.run(_gemini_image, image)
+
+        response = await _generate_async(
+            "gemini_ripeness",
+            [RIPENESS_PROMPT, image_part],
+            generation_config=ANALYSIS_CONFIG,
+        )
+        with span("parse_ripeness"):
+            return _parse_analysis_response(response)
+
+    except Exception as e:
+        logger.error("Error in analyze_ripeness_with_gemini_async: %s", e)
+        return {"error": str(e)}
+
+
+def analyze_fruit_with_gemini(image, include_safety=False):
+    """
+    Identify the fruit and its ripeness with a single Gemini request.
+
+    Replaces a get_fruit_name + analyze_ripeness_with_gemini pair, and can
+    also return food safety and shelf life without the full recipe prompt.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        include_safety: Also return is_safe_to_eat, days_until_discard and
+                        storage_tips
+
+    Returns:
+        dict: {"fruit_name": "apple", "ripeness": "ripe", "confidence": 85.0,
+               "source": "gemini", ...safety fields} or {"error": "..."}
+    """
+    try:
+        logger.debug("Starting combined Gemini analysis...")
+        image_part = _gemini_image(image)
+
+        response = _generate(
+            "gemini_analysis",
+            [_build_analysis_prompt(include_safety), image_part],
+            generation_config=(
+                SAFETY_ANALYSIS_CONFIG if include_safety else ANALYSIS_CONFIG
+            ),
+        )
+        with span("parse_analysis"):
+            return _parse_analysis_response(response, include_safety)
+
+    except Exception as e:
+        logger.error("Error in analyze_fruit_with_gemini: %s", e)
+        return {"error": str(e)}
+
+
+async def analyze_fruit_with_gemini_async(image, include_safety=False):
+    """
+    Async variant of analyze_fruit_with_gemini.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        include_safety: Also return is_safe_to_eat, days_until_discard and
+                        storage_tips
+
+    Returns:
+        dict: Same shape as analyze_fruit_with_gemini
+    """
+    try:
+        logger.debug("Starting combined Gemini analysis (async)...")
+        image_part = await image_pool.run(_gemini_image, image)
+
+        response = await _generate_async(
+            "gemini_analysis",
+            [_build_analysis_prompt(include_safety), image_part],
+            generation_config=(
+                SAFETY_ANALYSIS_CONFIG if include_safety else ANALYSIS_CONFIG
+            ),
+        )
+        with span("parse_analysis"):
+            return _parse_analysis_response(response, include_safety)
+
+    except Exception as e:
+        logger.error("Error in analyze_fruit_with_gemini_async: %s", e)
+        return {"error": str(e)}
+
+
+def get_recipes_and_safety(image, fruit_name=None, ripeness=None):
+    """
+    Get recipe suggestions, food safety information, and estimated shelf life
+    based on fruit image and ripeness level.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        fruit_name: Optional fruit name (if already detected)
+        ripeness: Optional ripeness level (if already detected)
+
+    Returns:
+        dict: {
+            "fruit_name": "banana",
+            "ripeness": "ripe",
+            "is_safe_to_eat": true,
+            "days_until_discard": 3,
+            "storage_tips": "...",
+            "recipes": [
+                {
+                    "name": "Banana Smoothie",
+                    "difficulty": "easy",
+                    "prep_time": "5 minutes",
+                    "ingredients": [...],
+                    "instructions": "..."
+                }
+            ]
+        }
+    """
+    try:
+        logger.debug("Getting recipes and safety info from Gemini...")
+        image_part = _gemini_image(image)
+        prompt = _build_recipe_prompt(fruit_name, ripeness)
+
+        response = _generate(
+            "gemini_recipes", [prompt, image_part], generation_config=RECIPES_CONFIG
+        )
+        with span("parse_recipes"):
+            return _parse_recipes_response(response)
+
+    except Exception as e:
+        logger.exception("Error in get_recipes_and_safety: %s", e)
+        return {"error": str(e)}
+
+
+async def get_recipes_and_safety_async(image, fruit_name=None, ripeness=None):
+    """
+    Async variant of get_recipes_and_safety.
+
+    Args:
+        image: DecodedImage (or raw image bytes)
+        fruit_name: Optional fruit name (if already detected)
+        ripeness: Optional ripeness level (if already detected)
 
-        text = response.text.strip()
-        text = re.sub(r"```json\s*", "", text)
-        text = re.sub(r"```\s*", "", text)
+    Returns:
+        dict: Same shape as get_recipes_and_safety
+    """
+    try:
+        logger.debug("Getting recipes and safety info from Gemini (async)...")
+        image_part = await image_pool.run(_gemini_image, image)
+        prompt = _build_recipe_prompt(fruit_name, ripeness)
 
-        result = json.loads(text)
-        print(f"✅ Nutrition data retrieved for {fruit_name}")
-        return result
+        response = await _generate_async(
+            "gemini_recipes", [prompt, image_part], generation_config=RECIPES_CONFIG
+        )
+        with span("parse_recipes"):
+            return _parse_recipes_response(response)
 
     except Exception as e:
-        print(f"❌ Error in get_nutrition_and_impact: {e}")
+        logger.error("Error in get_recipes_and_safety_async: %s", e)
         return {"error": str(e)}
 
 
+async def get_recipe_library_entry_async(fruit_name, ripeness="ripe", priority=None):
+    """
+    Generate storage tips and recipes for (fruit, ripeness) without an image.
+
+    Used to fill gaps in the recipe library; image-specific fields
+    (is_safe_to_eat, days_until_discard) come from the analysis prompt.
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: Ripeness level
+        priority: Rate-limit priority (defaults to optional)
+
+    Returns:
+        dict: {"storage_tips": "...", "recipes": [...]}
+    """
+    try:
+        logger.debug("Generating recipes for %s (%s) (async)...", fruit_name, ripeness)
+
+        prompt = _build_recipe_library_prompt(fruit_name, ripeness)
+        response = await _generate_async(
+            "gemini_recipe_library",
+            prompt,
+            priority=priority,
+            generation_config=RECIPE_LIBRARY_CONFIG,
+        )
+        with span("parse_recipes"):
+            return _parse_recipes_response(response, RecipeSet)
+
+    except Exception as e:
+        logger.error("Error in get_recipe_library_entry_async: %s", e)
+        return {"error": str(e)}
+
+
+def get_nutrition_and_impact(fruit_name, ripeness="ripe"):
+    """
+    Get nutritional information and environmental impact for a fruit.
+    This doesn't require an image - just uses the fruit name.
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: Ripeness level (affects nutrition slightly)
+
+    Returns:
+        dict: Nutrition facts and environmental impact
+    """
+    try:
+        logger.debug("Getting nutrition info for %s (%s)...", fruit_name, ripeness)
+
+        prompt = _build_nutrition_prompt(fruit_name, ripeness)
+        response = _generate(
+            "gemini_nutrition", prompt, generation_config=NUTRITION_CONFIG
+        )
+        with span("parse_nutrition"):
+            return _parse_nutrition_response(response, fruit_name)
+
+    except Exception as e:
+        logger.error("Error in get_nutrition_and_impact: %s", e)
+        return {"error": str(e)}
+
+
+async def get_nutrition_and_impact_async(fruit_name, ripeness="ripe"):
+    """
+    Async variant of get_nutrition_and_impact.
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: Ripeness level (affects nutrition slightly)
+
+    Returns:
+        dict: Nutrition facts and environmental impact
+    """
+    try:
+        logger.debug(
+            "Getting nutrition info for %s (%s) (async)...", fruit_name, ripeness
+        )
+
+        prompt = _build_nutrition_prompt(fruit_name, ripeness)
+        response = await _generate_async(
+            "gemini_nutrition", prompt, generation_config=NUTRITION_CONFIG
+        )
+        with span("parse_nutrition"):
+            return _parse_nutrition_response(response, fruit_name)
+
+    except Exception as e:
+        logger.error("Error in get_nutrition_and_impact_async: %s", e)
+        return {"error": str(e)}
+
+
+async def _batched(images, handle_chunk):
+    chunks = [
+        images[start : start + GEMINI_BATCH_SIZE]
+        for start in range(0, len(images), GEMINI_BATCH_SIZE)
+    ]
+    results = await asyncio.gather(*(handle_chunk(chunk) for chunk in chunks))
+    return [item for chunk_result in results for item in chunk_result]
+
+
+async def get_fruit_names_batch_async(images):
+    """
+    Identify the fruit in several images with one multi-image Gemini prompt
+    per GEMINI_BATCH_SIZE images.
+
+    Falls back to one get_fruit_name_async call per image for any chunk
+    whose answer cannot be parsed.
+
+    Args:
+        images: List of DecodedImage
+
+    Returns:
+        list: [{"fruit_name": "apple"}, ...] in the same order as images
+    """
+
+    async def handle_chunk(chunk):
+        if len(chunk) == 1:
+            return [await get_fruit_name_async(chunk[0])]
+        try:
+            logger.debug(
+                "Getting %s fruit names from Gemini in one request...", len(chunk)
+            )
+            image_parts = await asyncio.gather(
+                *(image_pool.run(_gemini_image, image) for image in chunk)
+            )
+            response = await _generate_async(
+                "gemini_batch_names",
+                [_build_batch_names_prompt(len(chunk)), *image_parts],
+                generation_config=BATCH_NAMES_CONFIG,
+            )
+            with span("parse_batch"):
+                names = _parse_json_array(response, len(chunk))
+            if names is not None:
+                return [{"fruit_name": _clean_fruit_name(str(name))} for name in names]
+            logger.warning("Could not parse batched fruit names, asking per image")
+        except Exception as e:
+            logger.error("Error in get_fruit_names_batch_async: %s", e)
+        return list(await asyncio.gather(*(get_fruit_name_async(i) for i in chunk)))
+
+    return await _batched(images, handle_chunk)
+
+
+async def analyze_ripeness_batch_async(images):
+    """
+    Batched variant of analyze_ripeness_with_gemini_async.
+
+    Args:
+        images: List of DecodedImage
+
+    Returns:
+        list: One analyze_ripeness_with_gemini result per image, in order
+    """
+
+    async def handle_chunk(chunk):
+        if len(chunk) == 1:
+            return [await analyze_ripeness_with_gemini_async(chunk[0])]
+        try:
+            logger.debug(
+                "Analyzing ripeness of %s images in one request...", len(chunk)
+            )
+            image_parts = await asyncio.gather(
+                *(image_pool.run(_gemini_image, image) for image in chunk)
+            )
+            response = await _generate_async(
+                "gemini_batch_ripeness",
+                [_build_batch_ripeness_prompt(len(chunk)), *image_parts],
+                generation_config=BATCH_RIPENESS_CONFIG,
+            )
+            with span("parse_batch"):
+                items = _parse_json_array(response, len(chunk))
+            if items is not None and all(isinstance(item, dict) for item in items):
+                return [_clean_ripeness_result(item) for item in items]
+            logger.warning("Could not parse batched ripeness, asking per image")
+        except Exception as e:
+            logger.error("Error in analyze_ripeness_batch_async: %s", e)
+        return list(
+            await asyncio.gather(
+                *(analyze_ripeness_with_gemini_async(i) for i in chunk)
+            )
+        )
+
+    return await _batched(images, handle_chunk)
+
+
 if __name__ == "__main__":
     # Test the service
     test_image_path = "../images/ripe_mango.jpg"
     if os.path.exists(test_image_path):
         with open(test_image_path, "rb") as image_file:
-            image_bytes = image_file.read()
+            image = DecodedImage.from_bytes(image_file.read())
 
         print("Testing fruit name detection:")
-        name_result = get_fruit_name(image_bytes)
+        name_result = get_fruit_name(image)
         print(name_result)
 
         print("\nTesting ripeness analysis:")
-        ripeness_result = analyze_ripeness_with_gemini(image_bytes)
+        ripeness_result = analyze_ripeness_with_gemini(image)
         print(ripeness_result)
 
         print("\nTesting recipe suggestions:")
         recipe_result = get_recipes_and_safety(
-            image_bytes,
+            image,
             fruit_name=name_result.get("fruit_name"),
             ripeness=ripeness_result.get("ripeness"),
         )
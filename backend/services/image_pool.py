@@ -0,0 +1,221 @@
+import asyncio
+import contextvars
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import shared_memory
+
+from dotenv import load_dotenv
+from PIL import Image
+from services.image_service import DecodedImage, decode_rgb
+from services.logging_service import get_logger
+from services.metrics_service import IMAGE_POOL_PENDING, IMAGE_POOL_REJECTIONS, span
+
+load_dotenv()
+
+logger = get_logger("image_pool")
+
+# NumPy is only needed by the process-mode decode, so it is imported there
+# rather than at startup
+
+# "thread": every image stage runs on a thread pool. PIL releases the GIL
+#           while decoding, resizing and encoding, so this already spreads
+#           over several cores.
+# "process": uploads are additionally decoded in worker processes and the
+#            pixels come back through shared memory instead of being pickled.
+IMAGE_POOL_MODE = os.getenv("IMAGE_POOL_MODE", "thread").lower()
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(os.cpu_count() or 1)))
+# New uploads are turned away with a 503 once this many image tasks are
+# queued or running; stages of requests already admitted always queue
+IMAGE_POOL_MAX_PENDING = int(
+    os.getenv("IMAGE_POOL_MAX_PENDING", str(max(16, IMAGE_POOL_WORKERS * 8)))
+)
+
+
+class ImagePoolFull(RuntimeError):
+    """Too much image work is queued; the upload should be retried later."""
+
+
+def _decode_to_shared_memory(image_bytes):
+    """Worker-process side of ImagePool.decode: decode into a shared block."""
+    import numpy as np
+
+    pixels = np.asarray(decode_rgb(image_bytes))
+    block = shared_memory.SharedMemory(create=True, size=max(1, pixels.nbytes))
+    try:
+        np.ndarray(pixels.shape, dtype=np.uint8, buffer=block.buf)[...] = pixels
+    except BaseException:
+        block.close()
+        block.unlink()
+        raise
+    block.close()
+    return block.name, pixels.shape
+
+
+def _adopt_shared_pixels(name, shape):
+    """Copy pixels out of a worker's shared block into an RGB image and free it."""
+    import numpy as np
+
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        pixels = np.ndarray(shape, dtype=np.uint8, buffer=block.buf)
+        return Image.fromarray(pixels.copy(), "RGB")
+    finally:
+        block.close()
+        block.unlink()
+
+
+def _discard_shared_pixels(future):
+    # The caller stopped waiting; free the block the worker still created
+    if not future.cancelled() and future.exception() is None:
+        name, _ = future.result()
+        block = shared_memory.SharedMemory(name=name)
+        block.close()
+        block.unlink()
+
+
+class ImagePool:
+    """
+    Bounded pool for CPU-bound image work (decode, resize, encode, features).
+
+    decode() is the admission point: it raises ImagePoolFull instead of
+    queueing when IMAGE_POOL_MAX_PENDING tasks are already waiting, so an
+    overloaded instance answers 503 quickly rather than letting latency grow
+    without bound. run() is for the later stages of admitted requests and
+    never rejects.
+    """
+
+    def __init__(
+        self,
+        mode=IMAGE_POOL_MODE,
+        workers=IMAGE_POOL_WORKERS,
+        max_pending=IMAGE_POOL_MAX_PENDING,
+    ):
+        if mode not in ("thread", "process"):
+            raise ValueError(f"IMAGE_POOL_MODE must be thread or process, not {mode}")
+        self.mode = mode
+        self.workers = workers
+        self.max_pending = max_pending
+        self.pending = 0
+        self.rejected = 0
+        self._threads = None
+        self._processes = None
+        self._lock = threading.Lock()
+
+    def _thread_executor(self):
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="image"
+                )
+            return self._threads
+
+    def _process_executor(self):
+        with self._lock:
+            if self._processes is None:
+                # spawn: forking a process that already runs threads is unsafe
+                self._processes = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info("Started %s image worker processes", self.workers)
+            return self._processes
+
+    def _enter(self, admit):
+        with self._lock:
+            full = admit and self.pending >= self.max_pending
+            if not full:
+                self.pending += 1
+                IMAGE_POOL_PENDING.set(self.pending)
+        if full:
+            self._reject()
+
+    def _leave(self):
+        with self._lock:
+            self.pending -= 1
+            IMAGE_POOL_PENDING.set(self.pending)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) on the image threads (keeps the request's trace)."""
+        return await self._run(False, fn, *args)
+
+    async def _run(self, admit, fn, *args):
+        self._enter(admit)
+        try:
+            context = contextvars.copy_context()
+            return await asyncio.get_running_loop().run_in_executor(
+                self._thread_executor(), context.run, fn, *args
+            )
+        finally:
+            self._leave()
+
+    def check_capacity(self):
+        """
+        Raise ImagePoolFull if a new request should be turned away now.
+
+        For requests that decode several uploads: check once, then decode
+        each with admit=False so a batch is accepted or rejected as a whole.
+        """
+        with self._lock:
+            full = self.pending >= self.max_pending
+        if full:
+            self._reject()
+
+    def _reject(self):
+        with self._lock:
+            self.rejected += 1
+            pending = self.pending
+        IMAGE_POOL_REJECTIONS.inc()
+        raise ImagePoolFull(f"Image pool is full ({pending} tasks pending)")
+
+    async def decode(self, image_bytes, admit=True):
+        """
+        Decode an upload into a DecodedImage off the event loop.
+
+        Args:
+            admit: Reject instead of queueing when the pool is full
+
+        Raises:
+            ImagePoolFull: If admit is set and the pool is saturated; nothing
+                was queued
+        """
+        if self.mode == "thread":
+            return await self._run(admit, DecodedImage.from_bytes, image_bytes)
+
+        self._enter(admit)
+        try:
+            with span("image_decode"):
+                future = self._process_executor().submit(
+                    _decode_to_shared_memory, image_bytes
+                )
+                try:
+                    name, shape = await asyncio.wrap_future(future)
+                except asyncio.CancelledError:
+                    future.add_done_callback(_discard_shared_pixels)
+                    raise
+                rgb = await self.run(_adopt_shared_pixels, name, shape)
+            return DecodedImage.from_decoded(image_bytes, rgb)
+        finally:
+            self._leave()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers,
+                "pending": self.pending,
+                "max_pending": self.max_pending,
+                "rejected": self.rejected,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executors = (self._threads, self._processes)
+            self._threads = self._processes = None
+        for executor in executors:
+            if executor is not None:
+                executor.shutdown(wait=False, cancel_futures=True)
+
+
+image_pool = ImagePool()
@@ -0,0 +1,303 @@
+import hashlib
+import os
+import threading
+from io import BytesIO
+
+from dotenv import load_dotenv
+from PIL import Image, ImageOps
+from services.metrics_service import span
+from services.stage_classifier import extract_features
+
+load_dotenv()
+
+# Input size expected by the Roboflow ripeness model
+ROBOFLOW_INPUT_SIZE = (640, 640)
+# Padding color for letterboxing (the usual YOLO grey)
+LETTERBOX_COLOR = (114, 114, 114)
+ROBOFLOW_IMAGE_QUALITY = 90
+
+# Longest side of the image sent to Gemini; larger photos only add upload time
+GEMINI_MAX_SIDE = int(os.getenv("GEMINI_MAX_IMAGE_SIDE", "1024"))
+# Encoding of the Gemini payload: "jpeg" or "webp"
+GEMINI_IMAGE_FORMAT = os.getenv("GEMINI_IMAGE_FORMAT", "jpeg").lower()
+GEMINI_IMAGE_QUALITY = int(os.getenv("GEMINI_IMAGE_QUALITY", "85"))
+
+# Nothing downstream needs more pixels than this, so JPEGs are decoded at a
+# reduced scale via PIL's draft mode (DCT scaling) instead of full resolution
+DECODE_MAX_SIDE = max(GEMINI_MAX_SIDE, *ROBOFLOW_INPUT_SIZE)
+
+# Grid size of the perceptual hash (DHASH_SIZE**2 bits)
+DHASH_SIZE = 8
+
+# Uploads with more pixels than this are refused from the header alone
+# (decompression bomb guard); PIL's own check enforces it again on decode
+MAX_IMAGE_PIXELS = int(os.getenv("MAX_IMAGE_PIXELS", "64000000"))
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS
+
+
+def image_dimensions(image_bytes):
+    """
+    (width, height) read from the image header without decoding any pixels.
+
+    Returns:
+        tuple or None: None if the header can't be parsed
+    """
+    try:
+        with Image.open(BytesIO(image_bytes)) as image:
+            return image.size
+    except Exception:
+        return None
+
+
+def decode_rgb(image_bytes):
+    """
+    Decode uploaded bytes into an upright RGB image.
+
+    Module-level so image worker processes can run it; see DecodedImage.rgb.
+    """
+    image = Image.open(BytesIO(image_bytes))
+    if image.format == "JPEG":
+        image.draft("RGB", (DECODE_MAX_SIDE, DECODE_MAX_SIDE))
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB")
+
+
+class DecodedImage:
+    """
+    An uploaded image decoded once and shared across the whole pipeline.
+
+    The RGB decode and every derived variant (Roboflow input, Gemini payload,
+    content and perceptual hashes) are computed on first access and memoized,
+    so passing the same object to several services never decodes the JPEG
+    twice.
+    """
+
+    def __init__(self, image_bytes):
+        self.raw_bytes = image_bytes
+        self._variants = {}
+        self._lock = threading.RLock()
+
+    @classmethod
+    def from_bytes(cls, image_bytes):
+        """Create a DecodedImage and decode it eagerly (call off the event loop)."""
+        image = cls(image_bytes)
+        image.rgb
+        return image
+
+    @classmethod
+    def from_decoded(cls, image_bytes, rgb):
+        """Wrap an RGB image decoded elsewhere (e.g. in an image worker process)."""
+        image = cls(image_bytes)
+        image._variants["decode"] = rgb
+        return image
+
+    def _variant(self, name, build):
+        with self._lock:
+            if name not in self._variants:
+                with span(f"image_{name}"):
+                    self._variants[name] = build()
+            return self._variants[name]
+
+    @property
+    def size_bytes(self):
+        return len(self.raw_bytes)
+
+    @property
+    def rgb(self):
+        """
+        Upright RGB image, decoded at no more than ~2x DECODE_MAX_SIDE.
+
+        JPEG draft mode lets libjpeg skip most of the work for large phone
+        photos; EXIF orientation is applied so every backend sees the fruit
+        the right way up.
+        """
+
+        return self._variant("decode", lambda: decode_rgb(self.raw_bytes))
+
+    @property
+    def roboflow_letterbox(self):
+        """
+        Aspect-preserving 640x640 Roboflow input.
+
+        Returns:
+            tuple: (image, scale, pad_x, pad_y) so that a point (x, y) in the
+                   letterboxed image maps back to ((x - pad_x) / scale,
+                   (y - pad_y) / scale) in rgb coordinates
+        """
+
+        def build():
+            target_w, target_h = ROBOFLOW_INPUT_SIZE
+            width, height = self.rgb.size
+            scale = min(target_w / width, target_h / height)
+            new_size = (max(1, round(width * scale)), max(1, round(height * scale)))
+            resized = self.rgb.resize(new_size, Image.Resampling.BILINEAR)
+
+            canvas = Image.new("RGB", ROBOFLOW_INPUT_SIZE, LETTERBOX_COLOR)
+            pad_x = (target_w - new_size[0]) // 2
+            pad_y = (target_h - new_size[1]) // 2
+            canvas.paste(resized, (pad_x, pad_y))
+            return canvas, scale, pad_x, pad_y
+
+        return self._variant("roboflow_letterbox", build)
+
+    @property
+    def roboflow_input(self):
+        """640x640 letterboxed image for the Roboflow ripeness model."""
+        return self.roboflow_letterbox[0]
+
+    @property
+    def roboflow_payload(self):
+        """roboflow_input encoded as the JPEG bytes posted to Roboflow."""
+
+        def build():
+            buffer = BytesIO()
+            self.roboflow_input.save(
+                buffer, format="JPEG", quality=ROBOFLOW_IMAGE_QUALITY
+            )
+            return buffer.getvalue()
+
+        return self._variant("roboflow_payload", build)
+
+    def box_from_letterbox(self, x, y, width, height):
+        """
+        Map a Roboflow box (center and size in letterboxed pixels) to rgb.
+
+        Returns:
+            tuple: (left, top, right, bottom) in rgb pixels, clamped to the
+                   image
+        """
+        _, scale, pad_x, pad_y = self.roboflow_letterbox
+        image_w, image_h = self.rgb.size
+        left = (x - width / 2 - pad_x) / scale
+        top = (y - height / 2 - pad_y) / scale
+        right = (x + width / 2 - pad_x) / scale
+        bottom = (y + height / 2 - pad_y) / scale
+        return (
+            min(max(left, 0), image_w),
+            min(max(top, 0), image_h),
+            min(max(right, 0), image_w),
+            min(max(bottom, 0), image_h),
+        )
+
+    def crop(self, box, margin=0.0):
+        """
+        A DecodedImage of one region of rgb (e.g. a single detected fruit).
+
+        Args:
+            box: (left, top, right, bottom) in rgb pixels
+            margin: Extra context around the box, as a fraction of its size
+
+        The crop keeps this upload's raw bytes, so its sha256 still names the
+        source photo; it is meant for prompts, not for cache keys.
+        """
+        left, top, right, bottom = box
+        pad_w = (right - left) * margin
+        pad_h = (bottom - top) * margin
+        image_w, image_h = self.rgb.size
+        region = (
+            max(0, int(left - pad_w)),
+            max(0, int(top - pad_h)),
+            min(image_w, int(round(right + pad_w))),
+            min(image_h, int(round(bottom + pad_h))),
+        )
+        return DecodedImage.from_decoded(self.raw_bytes, self.rgb.crop(region))
+
+    @property
+    def gemini_input(self):
+        """Downscaled copy for Gemini prompts (longest side <= GEMINI_MAX_SIDE)."""
+
+        def build():
+            image = self.rgb.copy()
+            image.thumbnail((GEMINI_MAX_SIDE, GEMINI_MAX_SIDE))
+            return image
+
+        return self._variant("gemini_input", build)
+
+    @property
+    def gemini_payload(self):
+        """
+        gemini_input re-encoded as a compact JPEG/WebP blob without metadata.
+
+        Passing a ready blob stops the Gemini SDK from encoding the PIL image
+        itself (as lossless WebP, which is both slow and large).
+        """
+
+        def build():
+            buffer = BytesIO()
+            if GEMINI_IMAGE_FORMAT == "webp":
+                self.gemini_input.save(
+                    buffer, format="WEBP", quality=GEMINI_IMAGE_QUALITY, method=4
+                )
+                mime_type = "image/webp"
+            else:
+                self.gemini_input.save(
+                    buffer,
+                    format="JPEG",
+                    quality=GEMINI_IMAGE_QUALITY,
+                    optimize=True,
+                )
+                mime_type = "image/jpeg"
+            # Re-encoding from pixels drops EXIF (GPS, device info) entirely
+            return {"mime_type": mime_type, "data": buffer.getvalue()}
+
+        return self._variant("gemini_payload", build)
+
+    @property
+    def sha256(self):
+        """Hex digest of the uploaded bytes."""
+        return self._variant(
+            "sha256", lambda: hashlib.sha256(self.raw_bytes).hexdigest()
+        )
+
+    @property
+    def dhash(self):
+        """
+        64-bit perceptual difference hash.
+
+        Re-encoded or slightly different shots of the same scene land within a
+        few bits of each other, unlike the exact sha256.
+        """
+
+        def build():
+            gray = self.gemini_input.convert("L").resize(
+                (DHASH_SIZE + 1, DHASH_SIZE), Image.Resampling.BILINEAR
+            )
+            pixels = gray.tobytes()
+            value = 0
+            for row in range(DHASH_SIZE):
+                offset = row * (DHASH_SIZE + 1)
+                for col in range(DHASH_SIZE):
+                    left = pixels[offset + col]
+                    right = pixels[offset + col + 1]
+                    value = (value << 1) | (left > right)
+            return value
+
+        return self._variant("dhash", build)
+
+    @property
+    def color_signature(self):
+        """
+        Colour features of the fruit region (see stage_classifier.FEATURE_NAMES).
+
+        The dhash is computed on grayscale and so is blind to the colour
+        changes ripeness is judged on; this tells a greener or browner shot
+        of the same fruit apart.
+        """
+        return self._variant(
+            "color_signature",
+            lambda: tuple(
+                float(value) for value in extract_features(self.gemini_input)
+            ),
+        )
+
+
+def as_decoded_image(image):
+    """
+    Accept either a DecodedImage or raw image bytes and return a DecodedImage.
+
+    Lets service functions keep working for callers (scripts, tests) that
+    still pass raw bytes.
+    """
+    if isinstance(image, DecodedImage):
+        return image
+    return DecodedImage(image)
@@ -0,0 +1,226 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+
+from dotenv import load_dotenv
+from services.circuit_breaker import get_breaker
+from services.logging_service import get_logger
+from services.metrics_service import UPSTREAM_TIMEOUTS
+
+load_dotenv()
+
+logger = get_logger("latency")
+
+# Recent samples kept per stage; old samples age out so the timeouts follow
+# the upstream's current behaviour
+LATENCY_WINDOW = int(os.getenv("LATENCY_WINDOW", "200"))
+# Until this many samples exist the backend's initial timeout is used
+LATENCY_MIN_SAMPLES = int(os.getenv("LATENCY_MIN_SAMPLES", "20"))
+# Timeout = p99 of recent latency times this factor, clamped per backend
+TIMEOUT_P99_MULTIPLIER = float(os.getenv("TIMEOUT_P99_MULTIPLIER", "1.5"))
+
+
+def _backend_setting(backend, name, default):
+    return float(os.getenv(f"{backend.upper()}_TIMEOUT_{name}_SECONDS", default))
+
+
+# backend -> (initial, min, max) timeout in seconds
+BACKEND_TIMEOUTS = {
+    "gemini": (
+        _backend_setting("gemini", "INITIAL", "30"),
+        _backend_setting("gemini", "MIN", "3"),
+        _backend_setting("gemini", "MAX", "60"),
+    ),
+    "roboflow": (
+        _backend_setting("roboflow", "INITIAL", "10"),
+        _backend_setting("roboflow", "MIN", "1"),
+        _backend_setting("roboflow", "MAX", "20"),
+    ),
+}
+
+
+class UpstreamTimeout(TimeoutError):
+    """An upstream call exceeded its adaptive timeout."""
+
+
+class LatencyTracker:
+    """
+    Sliding window of call latencies for one stage (e.g. "gemini_analysis").
+
+    timeout() follows the observed p99 and hedge_delay() the observed p90, so
+    both adapt to how the upstream behaves right now instead of a fixed guess.
+    Timed-out calls are recorded at their timeout, which lets the timeout grow
+    (up to the backend maximum) if the upstream becomes slower for good.
+    """
+
+    def __init__(self, stage, backend):
+        self.stage = stage
+        self.backend = backend
+        self.initial_timeout, self.min_timeout, self.max_timeout = BACKEND_TIMEOUTS[
+            backend
+        ]
+        self._samples = deque(maxlen=LATENCY_WINDOW)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct):
+        """Nearest-rank percentile of the window, or None with too few samples."""
+        with self._lock:
+            if len(self._samples) < LATENCY_MIN_SAMPLES:
+                return None
+            ordered = sorted(self._samples)
+        rank = max(1, round(pct / 100 * len(ordered)))
+        return ordered[min(rank, len(ordered)) - 1]
+
+    def timeout(self):
+        p99 = self.percentile(99)
+        if p99 is None:
+            return self.initial_timeout
+        return min(
+            self.max_timeout, max(self.min_timeout, p99 * TIMEOUT_P99_MULTIPLIER)
+        )
+
+    def hedge_delay(self):
+        """How long to wait before treating a call as slow (its p90)."""
+        p90 = self.percentile(90)
+        if p90 is None:
+            return self.initial_timeout / 2
+        return min(p90, self.timeout())
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+
+
+_trackers = {}
+_trackers_lock = threading.Lock()
+
+
+def latency_tracker(stage, backend=None):
+    """Shared tracker for a stage; the backend defaults to the stage prefix."""
+    with _trackers_lock:
+        tracker = _trackers.get(stage)
+        if tracker is None:
+            tracker = _trackers[stage] = LatencyTracker(
+                stage, backend or stage.split("_", 1)[0]
+            )
+        return tracker
+
+
+def reset_trackers():
+    with _trackers_lock:
+        _trackers.clear()
+
+
+def _timed_out(tracker, timeout):
+    tracker.record(timeout)
+    UPSTREAM_TIMEOUTS.inc(stage=tracker.stage)
+    logger.warning(
+        "Upstream call timed out", extra={"stage": tracker.stage, "timeout": timeout}
+    )
+    return UpstreamTimeout(f"{tracker.stage} timed out after {timeout:.1f}s")
+
+
+async def call_with_timeout_async(stage, awaitable, breaker=None, admit=None):
+    """
+    Await an upstream call under its stage's adaptive timeout and circuit
+    breaker.
+
+    Args:
+        stage: Latency tracker name, e.g. "gemini_analysis"
+        awaitable: The upstream call (closed unused if the circuit is open)
+        breaker: Circuit breaker name (defaults to the stage)
+        admit: Coroutine function awaited once the breaker lets the call
+               through (e.g. to take a rate-limit token); if it raises,
+               nothing is sent upstream
+
+    Raises:
+        CircuitOpenError: If the circuit is open; nothing is sent upstream
+        UpstreamTimeout: If the call did not finish in time (it is cancelled)
+    """
+    circuit = get_breaker(breaker or stage)
+    try:
+        circuit.acquire()
+        try:
+            if admit is not None:
+                await admit()
+        except BaseException:
+            circuit.release()
+            raise
+    except BaseException:
+        if asyncio.iscoroutine(awaitable):
+            awaitable.close()
+        raise
+
+    tracker = latency_tracker(stage)
+    timeout = tracker.timeout()
+    start = time.perf_counter()
+    try:
+        result = await asyncio.wait_for(awaitable, timeout)
+    except asyncio.TimeoutError:
+        error = _timed_out(tracker, timeout)
+        circuit.record_failure(error)
+        raise error from None
+    except asyncio.CancelledError:
+        # Abandoned (e.g. a lost hedge race): the call took at least this
+        # long, and dropping it would bias the percentiles towards fast calls
+        tracker.record(time.perf_counter() - start)
+        circuit.release()
+        raise
+    except Exception as e:
+        circuit.record_failure(e)
+        raise
+    tracker.record(time.perf_counter() - start)
+    circuit.record_success()
+    return result
+
+
+# Blocking SDK calls without a timeout option run here so the caller can stop
+# waiting; a call that times out finishes in the background and is discarded
+_blocking_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPSTREAM_BLOCKING_WORKERS", "8")),
+    thread_name_prefix="upstream",
+)
+
+
+def call_with_timeout(stage, fn, *args, breaker=None, admit=None, **kwargs):
+    """
+    Blocking variant of call_with_timeout_async (admit is a plain function).
+
+    Raises:
+        CircuitOpenError: If the circuit is open; fn is not called
+        UpstreamTimeout: If fn did not return in time
+    """
+    circuit = get_breaker(breaker or stage)
+    circuit.acquire()
+    if admit is not None:
+        try:
+            admit()
+        except BaseException:
+            circuit.release()
+            raise
+
+    tracker = latency_tracker(stage)
+    timeout = tracker.timeout()
+    start = time.perf_counter()
+    future = _blocking_executor.submit(fn, *args, **kwargs)
+    try:
+        result = future.result(timeout=timeout)
+    except FutureTimeoutError:
+        future.cancel()
+        error = _timed_out(tracker, timeout)
+        circuit.record_failure(error)
+        raise error from None
+    except Exception as e:
+        circuit.record_failure(e)
+        raise
+    tracker.record(time.perf_counter() - start)
+    circuit.record_success()
+    return result
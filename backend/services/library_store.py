@@ -0,0 +1,176 @@
+import asyncio
+import copy
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+from db import db_utils
+from models.prediction_model import RIPENESS_STAGES
+from services.cache_service import SingleFlight
+from services.logging_service import get_logger
+from services.metrics_service import span
+
+logger = get_logger("library")
+
+
+def library_key(fruit_name, ripeness):
+    return fruit_name.strip().lower(), (ripeness or "ripe").strip().lower()
+
+
+class LibraryStore:
+    """
+    Payloads keyed by (fruit, ripeness): an in-process LRU over a SQLite table.
+
+    Lookups go to the LRU, then the database, and only then to a generator
+    (Gemini), whose result is written back to both; concurrent misses for the
+    same key share one generation. With a ttl, stale entries are served
+    while a single background task regenerates them.
+    """
+
+    def __init__(self, name, table, lru_size, lookups, ttl=None):
+        """
+        Args:
+            name: Short name used for spans, logs and request coalescing
+            table: db_utils library table holding the entries
+            lru_size: Entries kept in memory
+            lookups: Counter labelled by the tier that answered a lookup
+            ttl: Seconds after which an entry is refreshed (None: never)
+        """
+        self.name = name
+        self.table = table
+        self.lru_size = lru_size
+        self.lookups = lookups
+        self.ttl = ttl
+        self.ready = False
+        # (fruit_name, ripeness) -> (payload, updated_at)
+        self._memory = OrderedDict()
+        self._memory_lock = threading.Lock()
+        self._refreshing = set()
+        self._background_tasks = set()
+        self._flights = SingleFlight(name)
+
+    def __len__(self):
+        return len(self._memory)
+
+    def _remember(self, key, payload, updated_at):
+        with self._memory_lock:
+            self._memory[key] = (payload, updated_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.lru_size:
+                self._memory.popitem(last=False)
+
+    def load_seed(self, path, entries):
+        """
+        Insert seed entries for any (fruit, ripeness) pair not yet stored.
+
+        Args:
+            path: JSON seed file (a missing file seeds nothing)
+            entries: Function mapping the parsed seed to
+                     (fruit_name, ripeness, payload) tuples
+
+        Returns:
+            int: Number of fruits read from the seed file
+        """
+        if not os.path.exists(path):
+            return 0
+
+        with open(path, encoding="utf-8") as seed_file:
+            seed = json.load(seed_file)
+
+        for fruit_name, ripeness, payload in entries(seed):
+            db_utils.save_library_entry(
+                self.table, fruit_name, ripeness, payload, replace=False
+            )
+        return len(seed)
+
+    def warm_up(self):
+        """Load the most recently updated entries into memory."""
+        for fruit_name, ripeness, payload, updated_at in db_utils.list_library(
+            self.table, limit=self.lru_size
+        ):
+            self._remember((fruit_name, ripeness), payload, updated_at)
+        self.ready = True
+
+    def clear_memory(self):
+        """Drop the in-process LRU (the database is untouched)."""
+        with self._memory_lock:
+            self._memory.clear()
+            self._refreshing.clear()
+        self.ready = False
+
+    async def _lookup_async(self, key):
+        with self._memory_lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.lookups.inc(tier="memory")
+                return entry
+
+        # SQLite I/O stays off the event loop
+        with span(f"{self.name}_db"):
+            entry = await asyncio.to_thread(
+                db_utils.get_library_entry, self.table, *key
+            )
+        if entry is not None:
+            self.lookups.inc(tier="database")
+            self._remember(key, *entry)
+        return entry
+
+    async def _store_async(self, key, payload):
+        updated_at = time.time()
+        self._remember(key, payload, updated_at)
+        await asyncio.to_thread(
+            db_utils.save_library_entry,
+            self.table,
+            *key,
+            payload,
+            updated_at=updated_at,
+        )
+
+    async def _refresh(self, key, generate):
+        try:
+            payload = await generate(key)
+            if "error" not in payload:
+                await self._store_async(key, payload)
+                logger.info("Refreshed stale %s entry for %s (%s)", self.name, *key)
+        finally:
+            self._refreshing.discard(key)
+
+    async def get_async(self, key, generate):
+        """
+        The payload for key, generating (and storing) it on a miss.
+
+        Args:
+            key: (fruit_name, ripeness) from library_key()
+            generate: Coroutine function key -> payload, or {"error": ...}
+                      (errors are returned but never stored)
+
+        Returns:
+            dict: A copy of the payload, or {"error": ...} for a ripeness
+            outside RIPENESS_STAGES (e.g. "unknown"), which is never looked
+            up or generated
+        """
+        if key[1] not in RIPENESS_STAGES:
+            return {"error": f"No {self.name} entry for ripeness '{key[1]}'"}
+
+        entry = await self._lookup_async(key)
+        if entry is not None:
+            payload, updated_at = entry
+            stale = self.ttl is not None and time.time() - updated_at > self.ttl
+            if stale and key not in self._refreshing:
+                self._refreshing.add(key)
+                task = asyncio.create_task(self._refresh(key, generate))
+                self._background_tasks.add(task)
+                task.add_done_callback(self._background_tasks.discard)
+            return copy.deepcopy(payload)
+
+        async def fetch():
+            self.lookups.inc(tier="gemini")
+            payload = await generate(key)
+            if "error" not in payload:
+                await self._store_async(key, payload)
+            return payload
+
+        return await self._flights.run(key, fetch)
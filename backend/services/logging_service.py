@@ -0,0 +1,119 @@
+import atexit
+import json
+import logging
+import os
+import queue
+import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# "text" for key=value lines, "json" for one JSON object per line
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()
+
+ROOT_LOGGER_NAME = "freshcam"
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_STANDARD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+_listener = None
+
+
+def _extra_fields(record):
+    return {
+        key: value
+        for key, value in vars(record).items()
+        if key not in _STANDARD_ATTRIBUTES
+    }
+
+
+def _format_field(value):
+    if isinstance(value, float):
+        return f"{value:.2f}"
+    text = str(value)
+    return json.dumps(text) if (" " in text or not text) else text
+
+
+class KeyValueFormatter(logging.Formatter):
+    """`time level logger message key=value ...` lines."""
+
+    def format(self, record):
+        line = (
+            f"{time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(record.created))}"
+            f" {record.levelname:<7} {record.name} {record.getMessage()}"
+        )
+        fields = _extra_fields(record)
+        if fields:
+            line += " " + " ".join(
+                f"{key}={_format_field(value)}" for key, value in fields.items()
+            )
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, for log shippers."""
+
+    def format(self, record):
+        entry = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **_extra_fields(record),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+def configure_logging(level=None, log_format=None, stream=None):
+    """
+    Route the "freshcam" loggers through a queue to a background writer.
+
+    Request handlers only enqueue records; formatting and the blocking write
+    to stderr happen on the QueueListener thread. Safe to call again (e.g.
+    to change the level); the previous listener is stopped first.
+    """
+    global _listener
+
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(
+        JsonFormatter() if (log_format or LOG_FORMAT) == "json" else KeyValueFormatter()
+    )
+
+    records = queue.SimpleQueue()
+    root.addHandler(QueueHandler(records))
+    root.setLevel(level or LOG_LEVEL)
+
+    _listener = QueueListener(records, output)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Flush queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name):
+    """Logger under the "freshcam" hierarchy, e.g. get_logger("gemini")."""
+    return logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+
+
+configure_logging()
+atexit.register(shutdown_logging)
@@ -0,0 +1,335 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+from services.logging_service import get_logger
+
+logger = get_logger("metrics")
+
+# Upper bounds (seconds) chosen to resolve both local CPU stages (a few ms)
+# and remote model calls (hundreds of ms to seconds)
+DEFAULT_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs.extend(f'{name}="{_escape(value)}"' for name, value in extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels, rendered in Prometheus format."""
+
+    kind = "counter"
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+    def reset(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        return [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in values
+        ]
+
+
+class Gauge(Counter):
+    """Labelled value that can go up and down."""
+
+    kind = "gauge"
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels (Prometheus semantics)."""
+
+    kind = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        self._series = {}  # labels -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels):
+        with self._lock:
+            series = self._series.get(self._key(labels))
+            return series[-1] if series else 0
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def render(self):
+        with self._lock:
+            series = sorted((key, list(values)) for key, values in self._series.items())
+        lines = []
+        for key, values in series:
+            for bound, bucket_count in zip(self.buckets, values):
+                labels = _format_labels(
+                    self.labelnames, key, extra=(("le", _format_value(float(bound))),)
+                )
+                lines.append(f"{self.name}_bucket{labels} {bucket_count}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(values[-2])}")
+            lines.append(f"{self.name}_count{labels} {values[-1]}")
+        return lines
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for the /metrics endpoint."""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(name, documentation, labelnames))
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram(name, documentation, labelnames, buckets))
+
+    def reset(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            metric.reset()
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            metrics = sorted(self._metrics.values(), key=lambda metric: metric.name)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_DURATION = registry.histogram(
+    "freshcam_stage_duration_seconds",
+    "Time spent in each pipeline stage",
+    ("stage",),
+)
+STAGE_ERRORS = registry.counter(
+    "freshcam_stage_errors_total",
+    "Pipeline stages that raised an exception",
+    ("stage",),
+)
+HTTP_REQUEST_DURATION = registry.histogram(
+    "freshcam_http_request_duration_seconds",
+    "Time to produce a response, per route",
+    ("method", "route", "status"),
+)
+CACHE_LOOKUPS = registry.counter(
+    "freshcam_cache_lookups_total",
+    "Analysis cache lookups by namespace and result (hit, perceptual_hit, miss)",
+    ("namespace", "result"),
+)
+NUTRITION_LOOKUPS = registry.counter(
+    "freshcam_nutrition_lookups_total",
+    "Nutrition lookups by the tier that answered (memory, database, gemini)",
+    ("tier",),
+)
+RECIPE_LOOKUPS = registry.counter(
+    "freshcam_recipe_lookups_total",
+    "Recipe library lookups by the tier that answered (memory, database, gemini)",
+    ("tier",),
+)
+PREDICTIONS = registry.counter(
+    "freshcam_predictions_total",
+    "Ripeness predictions by the model that produced them",
+    ("source",),
+)
+PARSE_FAILURES = registry.counter(
+    "freshcam_parse_failures_total",
+    "Model responses that could not be parsed",
+    ("kind",),
+)
+UPSTREAM_TIMEOUTS = registry.counter(
+    "freshcam_upstream_timeouts_total",
+    "Upstream calls abandoned after their adaptive timeout",
+    ("stage",),
+)
+HEDGES = registry.counter(
+    "freshcam_hedges_total",
+    "Slow Roboflow calls raced against Gemini, by which answered first "
+    "(hedge_failed: Gemini failed and Roboflow was awaited)",
+    ("winner",),
+)
+COALESCED_REQUESTS = registry.counter(
+    "freshcam_coalesced_requests_total",
+    "Requests that joined an identical in-flight computation",
+    ("kind",),
+)
+CIRCUIT_OPEN = registry.gauge(
+    "freshcam_circuit_open",
+    "1 while an upstream's circuit breaker is open",
+    ("breaker",),
+)
+CIRCUIT_TRANSITIONS = registry.counter(
+    "freshcam_circuit_transitions_total",
+    "Circuit breaker state changes by the state entered",
+    ("breaker", "state"),
+)
+IMAGE_POOL_PENDING = registry.gauge(
+    "freshcam_image_pool_pending",
+    "Image tasks queued or running in the image pool",
+)
+IMAGE_POOL_REJECTIONS = registry.counter(
+    "freshcam_image_pool_rejections_total",
+    "Uploads turned away with 503 because the image pool was full",
+)
+RATE_LIMIT_DECISIONS = registry.counter(
+    "freshcam_rate_limit_decisions_total",
+    "Client-side rate limiter decisions (allowed, waited, rejected) by priority",
+    ("limiter", "priority", "outcome"),
+)
+UPLOAD_REJECTIONS = registry.counter(
+    "freshcam_upload_rejections_total",
+    "Uploads refused with 413 by the limit they broke (bytes, pixels)",
+    ("reason",),
+)
+UPSTREAM_REQUESTS = registry.counter(
+    "freshcam_upstream_requests_total",
+    "Upstream HTTP requests by whether they opened a new connection",
+    ("upstream", "connection", "http_version"),
+)
+UPSTREAM_CONNECTIONS = registry.gauge(
+    "freshcam_upstream_connections",
+    "Connections held by the shared upstream HTTP pool, idle or active",
+    ("state",),
+)
+
+# Spans finished during the current request: list of (stage, seconds)
+_request_spans = contextvars.ContextVar("request_spans", default=None)
+
+
+def start_request_trace():
+    """
+    Begin collecting spans for the current request.
+
+    Tasks and threads started afterwards inherit the same list through the
+    copied context, so spans from concurrent stages are collected too.
+    """
+    spans = []
+    _request_spans.set(spans)
+    return spans
+
+
+@contextmanager
+def span(stage):
+    """
+    Time a pipeline stage.
+
+    Records the duration in freshcam_stage_duration_seconds, counts
+    exceptions in freshcam_stage_errors_total, and adds the span to the
+    current request trace (see start_request_trace).
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_DURATION.observe(elapsed, stage=stage)
+        spans = _request_spans.get()
+        if spans is not None:
+            spans.append((stage, elapsed))
+        logger.debug("span finished", extra={"stage": stage, "ms": elapsed * 1000})
+
+
+def server_timing(spans):
+    """Format spans as a Server-Timing header value, summing repeated stages."""
+    totals = {}
+    for stage, elapsed in spans:
+        totals[stage] = totals.get(stage, 0.0) + elapsed
+    return ", ".join(
+        f"{stage};dur={elapsed * 1000:.1f}" for stage, elapsed in totals.items()
+    )
@@ -0,0 +1,91 @@
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from services.gemini_service import get_nutrition_and_impact_async
+from services.library_store import LibraryStore, library_key
+from services.logging_service import get_logger
+from services.metrics_service import NUTRITION_LOOKUPS
+
+load_dotenv()
+
+logger = get_logger("nutrition")
+
+# Nutrition facts barely change, so entries stay fresh for a long time; once
+# stale they are still served while a background refresh runs
+NUTRITION_TTL_SECONDS = float(os.getenv("NUTRITION_TTL_SECONDS", str(30 * 24 * 3600)))
+NUTRITION_LRU_SIZE = int(os.getenv("NUTRITION_LRU_SIZE", "2048"))
+NUTRITION_SEED_PATH = os.getenv(
+    "NUTRITION_SEED_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "db",
+        "nutrition_seed.json",
+    ),
+)
+
+RIPENESS_STAGES = ("unripe", "ripe", "overripe")
+
+_store = LibraryStore(
+    "nutrition",
+    "nutrition_cache",
+    NUTRITION_LRU_SIZE,
+    NUTRITION_LOOKUPS,
+    ttl=NUTRITION_TTL_SECONDS,
+)
+
+
+def _seed_entries(seed):
+    # fruit name -> payload, used for every ripeness stage
+    for fruit_name, payload in seed.items():
+        for ripeness in RIPENESS_STAGES:
+            yield fruit_name, ripeness, payload
+
+
+def load_seed(path=None):
+    """
+    Insert seed nutrition data for any (fruit, ripeness) pair not yet stored.
+
+    Returns:
+        int: Number of fruits read from the seed file
+    """
+    return _store.load_seed(path or NUTRITION_SEED_PATH, _seed_entries)
+
+
+def warm_up():
+    """Seed the database and load the most recent entries into memory."""
+    seeded = load_seed()
+    _store.warm_up()
+    logger.info(
+        "Nutrition cache warmed (%s seeded fruits, %s entries)", seeded, len(_store)
+    )
+
+
+def clear_memory():
+    """Drop the in-process LRU (the database is untouched)."""
+    _store.clear_memory()
+
+
+async def _generate(key):
+    return await get_nutrition_and_impact_async(*key)
+
+
+async def get_nutrition_async(fruit_name, ripeness="ripe"):
+    """
+    Nutrition facts and environmental impact for (fruit, ripeness).
+
+    Served from the in-process LRU, then SQLite, and only then from Gemini
+    (the result is written back to both; concurrent misses for the same key
+    share one request). Stale entries are returned immediately while a
+    single background task refreshes them.
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: Ripeness level
+
+    Returns:
+        dict: Same shape as gemini_service.get_nutrition_and_impact
+    """
+    if not _store.ready:
+        await asyncio.to_thread(warm_up)
+    return await _store.get_async(library_key(fruit_name, ripeness), _generate)
@@ -0,0 +1,277 @@
+import asyncio
+import os
+import threading
+import time
+
+from db import db_utils
+from dotenv import load_dotenv
+from services.logging_service import get_logger
+from services.metrics_service import RATE_LIMIT_DECISIONS
+
+load_dotenv()
+
+logger = get_logger("rate_limit")
+
+CORE = "core"
+OPTIONAL = "optional"
+
+# Client-side budget per Gemini model, as a token bucket: RPM tokens refill
+# per minute up to BURST (0 RPM disables limiting)
+GEMINI_RATE_LIMIT_RPM = float(os.getenv("GEMINI_RATE_LIMIT_RPM", "60"))
+GEMINI_RATE_LIMIT_BURST = float(os.getenv("GEMINI_RATE_LIMIT_BURST", "10"))
+# Share of the burst that optional calls (nutrition, recipes) may not use,
+# so name/ripeness calls still get through when the budget runs low
+GEMINI_OPTIONAL_RESERVE = float(os.getenv("GEMINI_OPTIONAL_RESERVE", "0.3"))
+# Core calls wait up to this long for a token; optional calls never wait
+RATE_LIMIT_MAX_WAIT_SECONDS = float(os.getenv("RATE_LIMIT_MAX_WAIT_SECONDS", "2"))
+# After an upstream 429 the bucket is emptied for this long
+RATE_LIMIT_BACKOFF_SECONDS = float(os.getenv("RATE_LIMIT_BACKOFF_SECONDS", "5"))
+# Keep the buckets in the SQLite database so every worker process on the
+# host draws from the same budget
+RATE_LIMIT_SHARED = os.getenv("RATE_LIMIT_SHARED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+
+class RateLimited(RuntimeError):
+    """The client-side budget is exhausted; the call was not attempted."""
+
+
+class LocalBucket:
+    """In-process token bucket."""
+
+    def __init__(self, name, capacity, refill_per_second):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = max(0.0, now - self._updated_at)
+        self._tokens = min(
+            self.capacity, self._tokens + elapsed * self.refill_per_second
+        )
+        self._updated_at = now
+
+    def take(self, floor=0.0):
+        """
+        Take one token unless that would leave fewer than floor.
+
+        Returns:
+            tuple: (taken, tokens left)
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            taken = self._tokens - 1 >= floor
+            if taken:
+                self._tokens -= 1
+            return taken, self._tokens
+
+    def drain(self, seconds):
+        """Empty the bucket so it stays empty for about `seconds`."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens = min(self._tokens, -seconds * self.refill_per_second)
+
+    def tokens(self):
+        with self._lock:
+            self._refill(time.monotonic())
+            return self._tokens
+
+
+class SharedBucket:
+    """Token bucket stored in SQLite, shared by every process using the file."""
+
+    def __init__(self, name, capacity, refill_per_second):
+        self.name = name
+        self.capacity = capacity
+        self.refill_per_second = refill_per_second
+
+    def take(self, floor=0.0):
+        return db_utils.take_rate_token(
+            self.name, self.capacity, self.refill_per_second, floor=floor
+        )
+
+    def drain(self, seconds):
+        db_utils.drain_rate_bucket(
+            self.name, self.capacity, self.refill_per_second, seconds
+        )
+
+    def tokens(self):
+        return db_utils.take_rate_token(
+            self.name, self.capacity, self.refill_per_second, cost=0
+        )[1]
+
+
+class RateLimiter:
+    """
+    Token-bucket budget for one upstream model, with two priorities.
+
+    Core calls (fruit name, ripeness) may use the whole bucket and wait up
+    to max_wait for a token. Optional calls (nutrition, recipes) may not dip
+    into the reserve, never wait, and are refused while any core call is
+    waiting, so when the budget runs low the optional sections are dropped
+    first instead of the answer itself.
+    """
+
+    def __init__(
+        self,
+        name,
+        rpm=GEMINI_RATE_LIMIT_RPM,
+        burst=GEMINI_RATE_LIMIT_BURST,
+        optional_reserve=GEMINI_OPTIONAL_RESERVE,
+        max_wait=RATE_LIMIT_MAX_WAIT_SECONDS,
+        shared=RATE_LIMIT_SHARED,
+    ):
+        self.name = name
+        self.enabled = rpm > 0
+        self.refill_per_second = rpm / 60.0
+        self.reserve = burst * optional_reserve
+        self.max_wait = max_wait
+        bucket_type = SharedBucket if shared else LocalBucket
+        self.bucket = bucket_type(name, burst, self.refill_per_second)
+        self.rejected = {CORE: 0, OPTIONAL: 0}
+        self._core_waiting = 0
+        self._lock = threading.Lock()
+
+    def _try_take(self, priority):
+        if priority == OPTIONAL:
+            with self._lock:
+                if self._core_waiting:
+                    return False, 0.0
+            return self.bucket.take(floor=self.reserve)
+        return self.bucket.take()
+
+    async def _try_take_async(self, priority):
+        if isinstance(self.bucket, SharedBucket):
+            # A SQLite transaction; keep it off the event loop
+            return await asyncio.to_thread(self._try_take, priority)
+        return self._try_take(priority)
+
+    def _wait_for(self, tokens):
+        # Time until the bucket holds one token again
+        return max(0.01, (1 - tokens) / self.refill_per_second)
+
+    def _reject(self, priority):
+        with self._lock:
+            self.rejected[priority] += 1
+        RATE_LIMIT_DECISIONS.inc(
+            limiter=self.name, priority=priority, outcome="rejected"
+        )
+        raise RateLimited(f"{self.name} {priority} budget exhausted")
+
+    def _admitted(self, priority, waited):
+        RATE_LIMIT_DECISIONS.inc(
+            limiter=self.name,
+            priority=priority,
+            outcome="waited" if waited else "allowed",
+        )
+
+    async def acquire_async(self, priority=CORE):
+        """
+        Take a token for one call.
+
+        Raises:
+            RateLimited: If an optional call finds no spare budget, or a core
+                call could not get a token within max_wait
+        """
+        if not self.enabled:
+            return
+        taken, tokens = await self._try_take_async(priority)
+        if taken:
+            self._admitted(priority, waited=False)
+            return
+        if priority == OPTIONAL:
+            self._reject(priority)
+
+        deadline = time.monotonic() + self.max_wait
+        with self._lock:
+            self._core_waiting += 1
+        try:
+            while not taken:
+                delay = min(self._wait_for(tokens), deadline - time.monotonic())
+                if delay <= 0:
+                    self._reject(priority)
+                await asyncio.sleep(delay)
+                taken, tokens = await self._try_take_async(priority)
+        finally:
+            with self._lock:
+                self._core_waiting -= 1
+        self._admitted(priority, waited=True)
+
+    def acquire(self, priority=CORE):
+        """Blocking variant of acquire_async."""
+        if not self.enabled:
+            return
+        deadline = time.monotonic() + (self.max_wait if priority == CORE else 0)
+        taken, tokens = self._try_take(priority)
+        waited = False
+        while not taken:
+            delay = min(self._wait_for(tokens), deadline - time.monotonic())
+            if delay <= 0:
+                self._reject(priority)
+            time.sleep(delay)
+            waited = True
+            taken, tokens = self._try_take(priority)
+        self._admitted(priority, waited)
+
+    def backoff(self, seconds=None):
+        """The upstream answered 429: stop sending for a while."""
+        if not self.enabled:
+            return
+        seconds = RATE_LIMIT_BACKOFF_SECONDS if seconds is None else seconds
+        self.bucket.drain(seconds)
+        logger.warning(
+            "Upstream rate limited us, backing off",
+            extra={"limiter": self.name, "seconds": seconds},
+        )
+
+    def snapshot(self):
+        if not self.enabled:
+            return {"enabled": False}
+        with self._lock:
+            rejected = dict(self.rejected)
+            core_waiting = self._core_waiting
+        return {
+            "enabled": True,
+            "tokens": round(self.bucket.tokens(), 2),
+            "capacity": self.bucket.capacity,
+            "per_minute": round(self.refill_per_second * 60, 2),
+            "core_waiting": core_waiting,
+            "rejected": rejected,
+        }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(name):
+    """Shared limiter for an upstream model (e.g. "gemini-2.0-flash-exp")."""
+    with _limiters_lock:
+        limiter = _limiters.get(name)
+        if limiter is None:
+            limiter = _limiters[name] = RateLimiter(
+                name,
+                rpm=GEMINI_RATE_LIMIT_RPM,
+                burst=GEMINI_RATE_LIMIT_BURST,
+                optional_reserve=GEMINI_OPTIONAL_RESERVE,
+                max_wait=RATE_LIMIT_MAX_WAIT_SECONDS,
+                shared=RATE_LIMIT_SHARED,
+            )
+        return limiter
+
+
+def limiter_states():
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: limiter.snapshot() for name, limiter in sorted(limiters.items())}
+
+
+def reset_limiters():
+    with _limiters_lock:
+        _limiters.clear()
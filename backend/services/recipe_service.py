@@ -0,0 +1,96 @@
+import asyncio
+import functools
+import os
+
+from dotenv import load_dotenv
+from services.gemini_service import get_recipe_library_entry_async
+from services.library_store import LibraryStore, library_key
+from services.logging_service import get_logger
+from services.metrics_service import RECIPE_LOOKUPS
+
+load_dotenv()
+
+logger = get_logger("recipes")
+
+RECIPE_LRU_SIZE = int(os.getenv("RECIPE_LRU_SIZE", "512"))
+RECIPE_SEED_PATH = os.getenv(
+    "RECIPE_SEED_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "db",
+        "recipe_seed.json",
+    ),
+)
+
+# Entries are {"storage_tips": "...", "recipes": [...]} and never expire
+_store = LibraryStore("recipes", "recipe_library", RECIPE_LRU_SIZE, RECIPE_LOOKUPS)
+
+
+def _seed_entries(seed):
+    # fruit name -> ripeness -> {"storage_tips", "recipes"}
+    for fruit_name, stages in seed.items():
+        for ripeness, payload in stages.items():
+            yield fruit_name, ripeness, payload
+
+
+def load_seed(path=None):
+    """
+    Insert seed library entries for any (fruit, ripeness) pair not yet stored.
+
+    Returns:
+        int: Number of fruits read from the seed file
+    """
+    return _store.load_seed(path or RECIPE_SEED_PATH, _seed_entries)
+
+
+def warm_up():
+    """Seed the database and load the most recent entries into memory."""
+    seeded = load_seed()
+    _store.warm_up()
+    logger.info(
+        "Recipe library warmed (%s seeded fruits, %s entries)", seeded, len(_store)
+    )
+
+
+def clear_memory():
+    """Drop the in-process LRU (the database is untouched)."""
+    _store.clear_memory()
+
+
+async def _generate(key, priority=None):
+    result = await get_recipe_library_entry_async(*key, priority=priority)
+    if "error" in result:
+        return result
+    if not result.get("recipes"):
+        return {"error": f"No recipes generated for {key[0]} ({key[1]})"}
+    logger.info("Adding %s (%s) to the recipe library", *key)
+    return {
+        "storage_tips": result.get("storage_tips"),
+        "recipes": result.get("recipes", []),
+    }
+
+
+async def get_recipes_async(fruit_name, ripeness="ripe", priority=None):
+    """
+    Storage tips and recipes for (fruit, ripeness) from the recipe library.
+
+    Served from the in-process LRU, then SQLite, and only then generated by
+    Gemini from the fruit name alone; generated entries are written back so
+    the next request for the same pair never reaches Gemini (concurrent
+    misses share one request).
+
+    Args:
+        fruit_name: Name of the fruit
+        ripeness: Ripeness level
+        priority: Rate-limit priority of a Gemini generation (defaults to
+                  optional; CORE where the recipes are the whole response)
+
+    Returns:
+        dict: {"storage_tips": "...", "recipes": [...]} or {"error": "..."}
+    """
+    if not _store.ready:
+        await asyncio.to_thread(warm_up)
+    return await _store.get_async(
+        library_key(fruit_name, ripeness),
+        functools.partial(_generate, priority=priority),
+    )
@@ -0,0 +1,77 @@
+import asyncio
+import base64
+
+from services import upstream_http
+
+UPSTREAM = "roboflow"
+
+
+class RoboflowError(RuntimeError):
+    """Roboflow answered with an error status."""
+
+
+class RoboflowClient:
+    """
+    Roboflow hosted inference API over the shared upstream connection pool.
+
+    Covers the part of inference_sdk's InferenceHTTPClient this service uses
+    (infer / infer_async on JPEG bytes), but every call reuses pooled
+    keep-alive connections instead of opening a new session per call.
+
+    Only the hosted API is spoken: images are posted to
+    {api_url}/{project}/{version}?api_key=... (e.g. on
+    https://detect.roboflow.com). Self-hosted inference servers, which
+    inference_sdk reached through their /infer/... endpoints, are no longer
+    supported.
+    """
+
+    def __init__(self, api_url, api_key):
+        self.api_url = api_url.rstrip("/")
+        self.api_key = api_key
+
+    def _request(self, image, model_id):
+        project, version = model_id.split("/")
+        return {
+            "url": f"{self.api_url}/{project}/{version}",
+            "params": {"api_key": self.api_key},
+            "content": base64.b64encode(image),
+            "headers": {"Content-Type": "application/x-www-form-urlencoded"},
+        }
+
+    @staticmethod
+    def _parse(response):
+        if response.status_code != 200:
+            # Not raise_for_status(): its message would carry the API key
+            raise RoboflowError(f"Roboflow returned HTTP {response.status_code}")
+        return response.json()
+
+    def infer(self, image, model_id):
+        """
+        Run the model on one image or a list of images (blocking).
+
+        Args:
+            image: JPEG bytes, or a list of them
+            model_id: "project/version"
+
+        Returns:
+            dict (or list of dicts): Roboflow's response, with "predictions"
+        """
+        if isinstance(image, list):
+            return [self.infer(item, model_id) for item in image]
+        response = upstream_http.request(
+            UPSTREAM, "POST", **self._request(image, model_id)
+        )
+        return self._parse(response)
+
+    async def infer_async(self, image, model_id):
+        """infer() without blocking; a list is sent as concurrent requests."""
+        if isinstance(image, list):
+            return list(
+                await asyncio.gather(
+                    *(self.infer_async(item, model_id) for item in image)
+                )
+            )
+        response = await upstream_http.request_async(
+            UPSTREAM, "POST", **self._request(image, model_id)
+        )
+        return self._parse(response)
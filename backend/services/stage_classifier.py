@@ -0,0 +1,291 @@
+import json
+import os
+
+from dotenv import load_dotenv
+from services.logging_service import get_logger
+
+load_dotenv()
+
+logger = get_logger("stage_classifier")
+
+# NumPy is imported inside the functions that use it so importing the app
+# (and with it this module) doesn't pay for it; see tests/test_startup.py
+
+RIPENESS_STAGES = ("unripe", "ripe", "overripe")
+
+FEATURE_NAMES = (
+    "green_ratio",
+    "yellow_ratio",
+    "red_ratio",
+    "brown_ratio",
+    "dark_ratio",
+    "mean_saturation",
+    "mean_value",
+)
+
+# Longest side the features are computed on; hue ratios are stable well below this
+FEATURE_MAX_SIDE = 128
+
+STAGE_CLASSIFIER_MODEL_PATH = os.getenv(
+    "STAGE_CLASSIFIER_MODEL_PATH",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "models",
+        "stage_classifier.json",
+    ),
+)
+# Below this probability the caller should escalate to a remote model
+STAGE_CLASSIFIER_MIN_CONFIDENCE = float(
+    os.getenv("STAGE_CLASSIFIER_MIN_CONFIDENCE", "0.85")
+)
+# Off by default: the shipped centroids come from six sample photos and a
+# hand-set overripe centroid (brown, dimmed fruit), which is not enough to
+# skip the remote models. Enable after retraining on real labelled photos
+# (python -m services.stage_classifier <image dir>)
+STAGE_CLASSIFIER_ENABLED = os.getenv("STAGE_CLASSIFIER_ENABLED", "false").lower() in (
+    "1",
+    "true",
+    "yes",
+)
+
+_model = None
+_model_loaded = False
+
+
+def fruit_mask(sat, val):
+    """
+    Boolean mask of fruit pixels: saturated and not dark.
+
+    This drops white/grey backgrounds and shadows. If nothing qualifies
+    (e.g. a grey photo) every pixel is used.
+
+    Args:
+        sat, val: HSV saturation and value arrays in [0, 1]
+    """
+    import numpy as np
+
+    mask = (sat > 0.25) & (val > 0.12)
+    if not mask.any():
+        return np.ones_like(sat, dtype=bool)
+    return mask
+
+
+def extract_features(image):
+    """
+    Color features over the fruit region of an image.
+
+    The fruit region is approximated as the saturated, non-dark pixels, which
+    drops white/grey backgrounds and shadows. Hue bands are measured in
+    degrees on the 0-360 wheel.
+
+    Args:
+        image: PIL RGB image (any size; it is downscaled internally)
+
+    Returns:
+        np.ndarray: Feature vector ordered like FEATURE_NAMES
+    """
+    import numpy as np
+
+    if max(image.size) > FEATURE_MAX_SIDE:
+        image = image.copy()
+        image.thumbnail((FEATURE_MAX_SIDE, FEATURE_MAX_SIDE))
+
+    hsv = np.asarray(image.convert("HSV"), dtype=np.float32) / 255.0
+    hue = hsv[..., 0] * 360.0
+    sat = hsv[..., 1]
+    val = hsv[..., 2]
+
+    mask = fruit_mask(sat, val)
+    hue = hue[mask]
+    sat = sat[mask]
+    val = val[mask]
+
+    warm = (hue < 45) | (hue >= 330)
+    # Brown is dark orange: any dark warm pixel, or a dimmed orange one
+    # (red skins stay red until they are really dark)
+    brown = warm & ((val < 0.45) | ((hue >= 15) & (val < 0.6)))
+    return np.array(
+        [
+            np.mean((hue >= 70) & (hue < 170)),
+            np.mean((hue >= 45) & (hue < 70)),
+            np.mean(warm),
+            np.mean(brown),
+            np.mean(val < 0.3),
+            sat.mean(),
+            val.mean(),
+        ],
+        dtype=np.float32,
+    )
+
+
+def load_model(path=None):
+    """
+    Load a nearest-centroid model from JSON.
+
+    Returns:
+        dict: {"classes", "centroids" (ndarray), "scale" (ndarray), "temperature"}
+              or None if the file does not exist
+    """
+    import numpy as np
+
+    path = path or STAGE_CLASSIFIER_MODEL_PATH
+    if not os.path.exists(path):
+        return None
+
+    with open(path, encoding="utf-8") as model_file:
+        raw = json.load(model_file)
+
+    return {
+        "classes": list(raw["classes"]),
+        "centroids": np.asarray(raw["centroids"], dtype=np.float32),
+        "scale": np.asarray(raw["scale"], dtype=np.float32),
+        "temperature": float(raw.get("temperature", 1.0)),
+    }
+
+
+def save_model(model, path=None):
+    import numpy as np
+
+    path = path or STAGE_CLASSIFIER_MODEL_PATH
+    with open(path, "w", encoding="utf-8") as model_file:
+        json.dump(
+            {
+                "features": list(FEATURE_NAMES),
+                "classes": model["classes"],
+                "centroids": np.round(model["centroids"].astype(float), 4).tolist(),
+                "scale": np.round(model["scale"].astype(float), 4).tolist(),
+                "temperature": model["temperature"],
+            },
+            model_file,
+            indent=2,
+        )
+        model_file.write("\n")
+
+
+def get_model():
+    """Return the model loaded from STAGE_CLASSIFIER_MODEL_PATH (cached)."""
+    global _model, _model_loaded
+    if not _model_loaded:
+        _model = load_model()
+        _model_loaded = True
+        if _model is None:
+            logger.warning(
+                "No local stage classifier model found - using remote models only"
+            )
+    return _model
+
+
+def train(samples, base_model=None, temperature=4.0):
+    """
+    Fit class centroids from labelled feature vectors.
+
+    Args:
+        samples: Iterable of (feature_vector, ripeness_label)
+        base_model: Optional model whose centroids are kept for classes that
+                    have no samples
+        temperature: Softmax temperature used to turn distances into
+                     probabilities
+
+    Returns:
+        dict: Model usable by classify()
+    """
+    import numpy as np
+
+    features = {}
+    for vector, label in samples:
+        features.setdefault(label, []).append(np.asarray(vector, dtype=np.float32))
+
+    all_vectors = np.stack([v for vectors in features.values() for v in vectors])
+    scale = all_vectors.std(axis=0)
+    scale[scale < 0.05] = 0.05
+
+    centroids = []
+    for label in RIPENESS_STAGES:
+        if label in features:
+            centroids.append(np.mean(features[label], axis=0))
+        elif base_model is not None and label in base_model["classes"]:
+            centroids.append(
+                base_model["centroids"][base_model["classes"].index(label)]
+            )
+        else:
+            raise ValueError(f"No samples or base centroid for stage '{label}'")
+
+    return {
+        "classes": list(RIPENESS_STAGES),
+        "centroids": np.stack(centroids),
+        "scale": scale,
+        "temperature": temperature,
+    }
+
+
+def classify(image, model=None):
+    """
+    Classify the ripeness stage of a fruit image on the CPU.
+
+    Args:
+        image: PIL RGB image
+        model: Optional model (defaults to get_model())
+
+    Returns:
+        dict: {"ripeness": "ripe", "confidence": 0.91, "probabilities": {...}}
+              or None if no model is available
+    """
+    import numpy as np
+
+    model = model or get_model()
+    if model is None:
+        return None
+
+    features = extract_features(image)
+    distances = (((model["centroids"] - features) / model["scale"]) ** 2).sum(axis=1)
+    logits = -distances / model["temperature"]
+    probabilities = np.exp(logits - logits.max())
+    probabilities /= probabilities.sum()
+
+    best = int(np.argmax(probabilities))
+    return {
+        "ripeness": model["classes"][best],
+        "confidence": float(probabilities[best]),
+        "probabilities": {
+            label: round(float(p), 4)
+            for label, p in zip(model["classes"], probabilities)
+        },
+    }
+
+
+def classify_confident(image):
+    """
+    Run the local classifier and return its result only when it is confident.
+
+    Returns:
+        dict: classify() result, or None if the classifier is disabled,
+              unavailable, or below STAGE_CLASSIFIER_MIN_CONFIDENCE
+    """
+    if not STAGE_CLASSIFIER_ENABLED:
+        return None
+
+    result = classify(image)
+    if result is None or result["confidence"] < STAGE_CLASSIFIER_MIN_CONFIDENCE:
+        return None
+    return result
+
+
+if __name__ == "__main__":
+    # Retrain from a folder of images named "<stage>_<fruit>.jpg", keeping the
+    # current centroids for stages without examples
+    import sys
+
+    from PIL import Image
+
+    image_dir = sys.argv[1] if len(sys.argv) > 1 else "../images"
+    samples = []
+    for name in sorted(os.listdir(image_dir)):
+        label = name.split("_", 1)[0]
+        if label not in RIPENESS_STAGES:
+            continue
+        with Image.open(os.path.join(image_dir, name)) as image:
+            samples.append((extract_features(image.convert("RGB")), label))
+
+    model = train(samples, base_model=load_model())
+    save_model(model)
+    print(f"✓ Trained on {len(samples)} images, saved to {STAGE_CLASSIFIER_MODEL_PATH}")
@@ -0,0 +1,169 @@
+import json
+import os
+
+from dotenv import load_dotenv
+from fastapi import HTTPException, Request
+from fastapi.routing import APIRoute
+from services import image_service
+from services.logging_service import get_logger
+from services.metrics_service import UPLOAD_REJECTIONS
+from starlette.formparsers import MultiPartException, MultiPartParser
+
+load_dotenv()
+
+logger = get_logger("uploads")
+
+# Largest single image upload accepted
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(10 * 1024 * 1024)))
+# Multipart uploads larger than this are spooled to a temp file while the
+# request body is parsed instead of being buffered in memory
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+# Room for multipart boundaries, headers and form fields around the files
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+
+class SpooledMultiPartParser(MultiPartParser):
+    """Multipart parser spooling files past UPLOAD_SPOOL_BYTES to disk."""
+
+    max_file_size = UPLOAD_SPOOL_BYTES
+
+
+class UploadRequest(Request):
+    """Request whose multipart body is parsed by SpooledMultiPartParser."""
+
+    async def _get_form(self, *, max_files=1000, max_fields=1000):
+        content_type = self.headers.get("content-type", "")
+        if self._form is None and content_type.startswith("multipart/form-data"):
+            parser = SpooledMultiPartParser(
+                self.headers,
+                self.stream(),
+                max_files=max_files,
+                max_fields=max_fields,
+            )
+            try:
+                self._form = await parser.parse()
+            except MultiPartException as exc:
+                raise HTTPException(status_code=400, detail=exc.message)
+        return await super()._get_form(max_files=max_files, max_fields=max_fields)
+
+
+class UploadRoute(APIRoute):
+    """
+    Route class for upload endpoints (APIRouter(route_class=UploadRoute)).
+
+    Only these routes get the spool size; Starlette's MultiPartParser class
+    itself is left untouched for every other app in the process.
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def upload_route_handler(request):
+            return await handler(UploadRequest(request.scope, request.receive))
+
+        return upload_route_handler
+
+
+def _too_large(reason, detail):
+    UPLOAD_REJECTIONS.inc(reason=reason)
+    return HTTPException(status_code=413, detail=detail)
+
+
+def _upload_limit_detail():
+    return f"Upload exceeds the {MAX_UPLOAD_BYTES // (1024 * 1024)} MB limit"
+
+
+async def read_upload(file):
+    """
+    Read an uploaded image, enforcing the size and pixel limits.
+
+    The size is checked before anything is read, and the image dimensions
+    are checked from the header before the image is ever decoded, so an
+    oversized upload or a decompression bomb costs no decode work.
+
+    Returns:
+        bytes: The upload (b"" if it was empty)
+
+    Raises:
+        HTTPException: 413 if the file or its pixel count is over the limit
+    """
+    if file.size is not None and file.size > MAX_UPLOAD_BYTES:
+        raise _too_large("bytes", _upload_limit_detail())
+
+    image_bytes = await file.read(MAX_UPLOAD_BYTES + 1)
+    if len(image_bytes) > MAX_UPLOAD_BYTES:
+        raise _too_large("bytes", _upload_limit_detail())
+
+    # Unreadable headers are left to the decoder, which reports them as 400
+    dimensions = image_service.image_dimensions(image_bytes) if image_bytes else None
+    if dimensions is not None:
+        width, height = dimensions
+        if width * height > image_service.MAX_IMAGE_PIXELS:
+            logger.warning("Refused %sx%s upload before decoding", width, height)
+            raise _too_large(
+                "pixels",
+                f"Image is {width}x{height}; at most "
+                f"{image_service.MAX_IMAGE_PIXELS} pixels are accepted",
+            )
+    return image_bytes
+
+
+class UploadLimitMiddleware:
+    """
+    Cap request bodies while they stream in, before multipart parsing.
+
+    A declared Content-Length over the limit is refused before any of the
+    body is read; chunked bodies are counted as they arrive and cut off as
+    soon as they pass it. Paths in batch_files allow that many uploads.
+    """
+
+    def __init__(self, app, batch_files=None):
+        self.app = app
+        self.batch_files = batch_files or {}
+
+    def limit_for(self, path):
+        files = self.batch_files.get(path, 1)
+        return MAX_UPLOAD_BYTES * files + MULTIPART_OVERHEAD_BYTES
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        limit = self.limit_for(scope["path"])
+        headers = dict(scope["headers"])
+        declared = headers.get(b"content-length")
+        if declared is not None and declared.isdigit() and int(declared) > limit:
+            UPLOAD_REJECTIONS.inc(reason="bytes")
+            await _send_too_large(send)
+            return
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # Raised inside body parsing; FastAPI re-raises it as is
+                    raise _too_large("bytes", _upload_limit_detail())
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+
+async def _send_too_large(send):
+    body = json.dumps({"detail": _upload_limit_detail()}).encode()
+    await send(
+        {
+            "type": "http.response.start",
+            "status": 413,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"connection", b"close"),
+            ],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,207 @@
+import asyncio
+import importlib.util
+import os
+import threading
+import weakref
+
+from dotenv import load_dotenv
+from services.logging_service import get_logger
+from services.metrics_service import UPSTREAM_CONNECTIONS, UPSTREAM_REQUESTS
+
+load_dotenv()
+
+logger = get_logger("upstream_http")
+
+# One connection pool shared by every upstream HTTP call, so concurrent
+# requests reuse warm (already TLS-negotiated) connections instead of
+# opening new ones per call
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "20"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "10"))
+# Idle connections are closed after this long
+UPSTREAM_KEEPALIVE_SECONDS = float(os.getenv("UPSTREAM_KEEPALIVE_SECONDS", "60"))
+UPSTREAM_CONNECT_TIMEOUT_SECONDS = float(
+    os.getenv("UPSTREAM_CONNECT_TIMEOUT_SECONDS", "5")
+)
+# Per-call deadlines come from the adaptive timeouts; this only bounds
+# reads and waits for a pooled connection
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "30"))
+# Negotiated through ALPN where the server supports it; needs the h2 package
+# (httpx[http2]), otherwise HTTP/1.1 keep-alive is used
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "true").lower() in ("1", "true", "yes")
+
+HTTP2_AVAILABLE = importlib.util.find_spec("h2") is not None
+
+NEW = "new"
+REUSED = "reused"
+
+_sync_client = None
+# httpx async connections belong to the event loop that opened them
+_async_clients = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+_counts = {}
+_counts_lock = threading.Lock()
+
+
+def _new_client(asynchronous):
+    # httpx is imported here, on the first upstream call, to keep it out of
+    # the app's import time
+    import httpx
+
+    if UPSTREAM_HTTP2 and not HTTP2_AVAILABLE:
+        logger.info("h2 is not installed; upstream calls use HTTP/1.1 keep-alive")
+    client_type = httpx.AsyncClient if asynchronous else httpx.Client
+    return client_type(
+        http2=UPSTREAM_HTTP2 and HTTP2_AVAILABLE,
+        limits=httpx.Limits(
+            max_connections=UPSTREAM_MAX_CONNECTIONS,
+            max_keepalive_connections=UPSTREAM_MAX_KEEPALIVE,
+            keepalive_expiry=UPSTREAM_KEEPALIVE_SECONDS,
+        ),
+        timeout=httpx.Timeout(
+            UPSTREAM_TIMEOUT_SECONDS, connect=UPSTREAM_CONNECT_TIMEOUT_SECONDS
+        ),
+    )
+
+
+def get_client():
+    """The shared blocking client (thread-safe)."""
+    global _sync_client
+    if _sync_client is None:
+        with _clients_lock:
+            if _sync_client is None:
+                _sync_client = _new_client(asynchronous=False)
+    return _sync_client
+
+
+def get_async_client():
+    """The shared async client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        with _clients_lock:
+            client = _async_clients.get(loop)
+            if client is None:
+                client = _async_clients[loop] = _new_client(asynchronous=True)
+    return client
+
+
+class _ConnectionTrace:
+    """httpcore trace hook noting whether a request opened a new connection."""
+
+    def __init__(self):
+        self.connection = REUSED
+
+    def __call__(self, event_name, info):
+        if event_name == "connection.connect_tcp.complete":
+            self.connection = NEW
+
+    async def async_hook(self, event_name, info):
+        self(event_name, info)
+
+
+def _record(upstream, trace, response):
+    with _counts_lock:
+        counts = _counts.setdefault(upstream, {NEW: 0, REUSED: 0})
+        counts[trace.connection] += 1
+    UPSTREAM_REQUESTS.inc(
+        upstream=upstream,
+        connection=trace.connection,
+        http_version=response.http_version,
+    )
+
+
+def _update_pool_gauges():
+    connections = _pool_connections()
+    idle = sum(1 for connection in connections if connection.is_idle())
+    UPSTREAM_CONNECTIONS.set(idle, state="idle")
+    UPSTREAM_CONNECTIONS.set(len(connections) - idle, state="active")
+
+
+def _pool_connections():
+    with _clients_lock:
+        clients = list(_async_clients.values())
+        if _sync_client is not None:
+            clients.append(_sync_client)
+    connections = []
+    for client in clients:
+        pool = getattr(getattr(client, "_transport", None), "_pool", None)
+        connections.extend(getattr(pool, "connections", []))
+    return connections
+
+
+async def request_async(upstream, method, url, **kwargs):
+    """
+    Send a request through the shared async pool.
+
+    Args:
+        upstream: Name the pool statistics are kept under (e.g. "roboflow")
+        method, url, **kwargs: As for httpx.AsyncClient.request
+
+    Returns:
+        httpx.Response
+    """
+    trace = _ConnectionTrace()
+    response = await get_async_client().request(
+        method, url, extensions={"trace": trace.async_hook}, **kwargs
+    )
+    _record(upstream, trace, response)
+    _update_pool_gauges()
+    return response
+
+
+def request(upstream, method, url, **kwargs):
+    """Blocking variant of request_async."""
+    trace = _ConnectionTrace()
+    response = get_client().request(method, url, extensions={"trace": trace}, **kwargs)
+    _record(upstream, trace, response)
+    _update_pool_gauges()
+    return response
+
+
+def pool_stats():
+    """
+    Pool settings, open connections and connection reuse per upstream.
+
+    Returns:
+        dict: {"http2", "limits", "connections": {"idle", "active"},
+               "requests": {upstream: {"new", "reused", "reuse_ratio"}}}
+    """
+    connections = _pool_connections()
+    idle = sum(1 for connection in connections if connection.is_idle())
+    with _counts_lock:
+        counts = {upstream: dict(values) for upstream, values in _counts.items()}
+    for values in counts.values():
+        total = values[NEW] + values[REUSED]
+        values["reuse_ratio"] = round(values[REUSED] / total, 3) if total else 0.0
+    return {
+        "http2": UPSTREAM_HTTP2 and HTTP2_AVAILABLE,
+        "limits": {
+            "max_connections": UPSTREAM_MAX_CONNECTIONS,
+            "max_keepalive": UPSTREAM_MAX_KEEPALIVE,
+            "keepalive_seconds": UPSTREAM_KEEPALIVE_SECONDS,
+        },
+        "connections": {"idle": idle, "active": len(connections) - idle},
+        "requests": counts,
+    }
+
+
+async def aclose():
+    """Close the pools (at shutdown); they are rebuilt on next use."""
+    global _sync_client
+    with _clients_lock:
+        clients = list(_async_clients.items())
+        _async_clients.clear()
+        sync_client, _sync_client = _sync_client, None
+    running = asyncio.get_running_loop()
+    for loop, client in clients:
+        # Connections of other (finished) loops can't be closed from here
+        if loop is running:
+            await client.aclose()
+    if sync_client is not None:
+        sync_client.close()
+
+
+def reset_stats():
+    with _counts_lock:
+        _counts.clear()
@@ -0,0 +1,43 @@
+"""
+Smoke test for the benchmark harness so it keeps working as the pipeline changes.
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from benchmarks import bench_predict
+
+
+def test_benchmark_writes_comparable_results(tmp_path):
+    output = tmp_path / "run.json"
+
+    bench_predict.main(
+        [
+            "--endpoints",
+            "predict",
+            "--concurrency",
+            "2",
+            "--requests",
+            "4",
+            "--warmup",
+            "0",
+            "--gemini-latency",
+            "0",
+            "--roboflow-latency",
+            "0",
+            "--output",
+            str(output),
+        ]
+    )
+
+    report = json.loads(output.read_text())
+    (scenario,) = report["scenarios"]
+    assert scenario["errors"] == 0
+    assert scenario["requests"] == 4
+    assert scenario["roboflow_calls"] > 0
+    assert set(scenario["latency_ms"]) == {"mean", "p50", "p95", "p99", "max"}
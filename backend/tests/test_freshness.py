@@ -0,0 +1,88 @@
+"""
+Tests for the local shelf-life estimate from the freshness lookup table.
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from models.freshness_model import SECONDS_PER_DAY, estimate_freshness
+
+NOW = 1_800_000_000.0
+
+
+def test_riper_fruit_and_room_storage_have_less_time_left():
+    unripe = estimate_freshness("banana", "unripe", now=NOW)
+    ripe = estimate_freshness("banana", "ripe", now=NOW)
+    overripe = estimate_freshness("banana", "overripe", now=NOW)
+    fridge = estimate_freshness("banana", "ripe", storage="fridge", now=NOW)
+
+    assert unripe["days_remaining"] > ripe["days_remaining"]
+    assert ripe["days_remaining"] > overripe["days_remaining"]
+    assert fridge["days_remaining"] > ripe["days_remaining"]
+
+
+def test_low_confidence_interpolates_towards_the_riper_stage():
+    sure = estimate_freshness("apple", "ripe", confidence=100, now=NOW)
+    unsure = estimate_freshness("apple", "ripe", confidence=50, now=NOW)
+    overripe = estimate_freshness("apple", "overripe", now=NOW)
+
+    assert overripe["days_remaining"] < unsure["days_remaining"]
+    assert unsure["days_remaining"] < sure["days_remaining"]
+
+
+def test_time_since_the_scan_is_used_up():
+    fresh = estimate_freshness("apple", "ripe", now=NOW)
+    later = estimate_freshness(
+        "apple", "ripe", scanned_at=NOW - 2 * SECONDS_PER_DAY, now=NOW
+    )
+
+    assert later["days_remaining"] == pytest.approx(fresh["days_remaining"] - 2)
+    # Both discard on the same calendar day
+    assert (
+        later["discard_date"]
+        == estimate_freshness("apple", "ripe", now=NOW - 2 * SECONDS_PER_DAY)[
+            "discard_date"
+        ]
+    )
+
+
+def test_decay_curve_runs_daily_down_to_zero():
+    estimate = estimate_freshness("Bananas", "ripe", now=NOW)
+
+    curve = estimate["decay_curve"]
+    assert [point["day"] for point in curve] == list(range(len(curve)))
+    assert curve[0]["freshness"] == estimate["freshness"]
+    assert all(a["freshness"] >= b["freshness"] for a, b in zip(curve, curve[1:]))
+    assert curve[-1]["freshness"] == 0.0
+
+
+def test_unknown_fruit_uses_the_default_row():
+    estimate = estimate_freshness("durian", "ripe", now=NOW)
+
+    assert estimate["days_remaining"] > 0
+    with pytest.raises(ValueError):
+        estimate_freshness("durian", "ripe", storage="freezer", now=NOW)
+
+
+def test_plural_names_use_the_singular_row():
+    for plural, singular in (("strawberries", "strawberry"), ("bananas", "banana")):
+        assert estimate_freshness(plural, "ripe", now=NOW) == estimate_freshness(
+            singular, "ripe", now=NOW
+        )
+    # Not the default row
+    assert estimate_freshness("strawberries", "ripe", now=NOW) != estimate_freshness(
+        "durian", "ripe", now=NOW
+    )
+
+
+def test_zero_confidence_is_the_least_certain_call():
+    sure = estimate_freshness("apple", "ripe", confidence=100, now=NOW)
+    unsure = estimate_freshness("apple", "ripe", confidence=0, now=NOW)
+
+    assert unsure["days_remaining"] < sure["days_remaining"]
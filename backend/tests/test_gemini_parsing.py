@@ -0,0 +1,114 @@
+"""
+Tests for parsing and validating Gemini responses (no network access).
+"""
+
+import json
+import sys
+from pathlib import Path
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from models.prediction_model import DEFAULT_CONFIDENCE, RecipeSet, SafetyAnalysis
+from services import gemini_service
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+def test_json_is_extracted_from_fences_and_prose():
+    text = (
+        'Here you go:\n```json\n{"fruit_name": "Mango", "ripeness": "ripe",'
+        ' "confidence": 91}\n```\nLet me know if you need more.'
+    )
+
+    result = gemini_service._parse_analysis_response(FakeResponse(text))
+
+    assert result == {
+        "fruit_name": "mango",
+        "ripeness": "ripe",
+        "confidence": 91.0,
+        "source": "gemini",
+    }
+
+
+def test_analysis_fields_are_coerced_and_clamped():
+    data = {
+        "fruit_name": " Banana ",
+        "ripeness": "Overripe (brown spots)",
+        "confidence": "85%",
+        "is_safe_to_eat": "no",
+        "days_until_discard": "30",
+        "storage_tips": ["Freeze it.", "Or bake."],
+    }
+
+    result = gemini_service._parse_analysis_response(
+        FakeResponse(json.dumps(data)), include_safety=True
+    )
+
+    assert result["fruit_name"] == "banana"
+    assert result["ripeness"] == "overripe"
+    assert result["confidence"] == 85.0
+    assert result["is_safe_to_eat"] is False
+    assert result["days_until_discard"] == 14
+    assert result["storage_tips"] == "Freeze it. Or bake."
+
+
+def test_no_fruit_keeps_unknown_ripeness():
+    data = {"fruit_name": "unknown", "ripeness": "unknown", "confidence": "n/a"}
+
+    result = gemini_service._parse_analysis_response(FakeResponse(json.dumps(data)))
+
+    # A photo without fruit is not called ripe
+    assert result["ripeness"] == "unknown"
+    assert result["confidence"] == DEFAULT_CONFIDENCE
+
+
+def test_truncated_json_is_salvaged():
+    text = '{"fruit_name": "kiwi", "ripeness": "unripe", "confid'
+
+    result = gemini_service._parse_analysis_response(FakeResponse(text))
+
+    assert result["fruit_name"] == "kiwi"
+    assert result["ripeness"] == "unripe"
+    assert result["source"] == "gemini"
+
+
+def test_malformed_recipes_are_dropped_not_fatal():
+    text = json.dumps(
+        {
+            "storage_tips": "Keep cool",
+            "recipes": [
+                {"name": "Smoothie", "instructions": ["1. Blend.", "2. Serve."]},
+                {"ingredients": ["no name"]},
+                "not a recipe",
+            ],
+        }
+    )
+
+    result = gemini_service._parse_recipes_text(text, RecipeSet)
+
+    assert result == {
+        "storage_tips": "Keep cool",
+        "recipes": [{"name": "Smoothie", "instructions": "1. Blend. 2. Serve."}],
+    }
+
+
+def test_response_schema_requires_every_field():
+    schema = gemini_service._response_schema(SafetyAnalysis)
+
+    assert schema["type"] == "object"
+    assert set(schema["required"]) == set(SafetyAnalysis.model_fields)
+    assert schema["properties"]["ripeness"]["enum"] == [
+        "unripe",
+        "ripe",
+        "overripe",
+        "unknown",
+    ]
+    assert schema["properties"]["days_until_discard"] == {
+        "type": "integer",
+        "nullable": True,
+    }
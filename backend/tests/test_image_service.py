@@ -0,0 +1,83 @@
+"""
+Tests for the shared decoded-image preprocessing.
+"""
+
+import asyncio
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+from PIL import Image
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from services.image_pool import ImagePool
+from services.image_service import DecodedImage
+
+
+def _jpeg_with_exif(size=(1200, 600), orientation=1):
+    image = Image.new("RGB", size, (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = orientation  # Orientation
+    exif[0x010F] = "PhoneMaker"  # Make
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", exif=exif.tobytes())
+    return buffer.getvalue()
+
+
+def test_roboflow_input_is_letterboxed():
+    image = DecodedImage.from_bytes(_jpeg_with_exif((1200, 600)))
+
+    letterboxed, scale, pad_x, pad_y = image.roboflow_letterbox
+
+    assert letterboxed.size == (640, 640)
+    assert (pad_x, pad_y) == (0, 160)
+    assert scale == 640 / 1200
+    assert letterboxed.getpixel((320, 10)) == (114, 114, 114)
+
+
+def test_gemini_payload_is_compact_and_strips_exif():
+    raw = _jpeg_with_exif((3000, 1500), orientation=6)
+    image = DecodedImage.from_bytes(raw)
+
+    payload = image.gemini_payload
+    encoded = Image.open(BytesIO(payload["data"]))
+
+    assert payload["mime_type"] == "image/jpeg"
+    assert not encoded.getexif()
+    # Orientation 6 (rotated 90 degrees) is applied before downscaling
+    assert encoded.size == (512, 1024)
+
+
+def test_process_pool_decode_matches_in_process_decode():
+    raw = _jpeg_with_exif((800, 400), orientation=6)
+    pool = ImagePool(mode="process", workers=1)
+    try:
+        image = asyncio.run(pool.decode(raw))
+    finally:
+        pool.shutdown()
+
+    expected = DecodedImage.from_bytes(raw).rgb
+    assert image.rgb.size == expected.size == (400, 800)
+    assert image.rgb.tobytes() == expected.tobytes()
+    assert pool.stats()["pending"] == 0
+
+
+def test_explanation_maps_are_fast_and_track_ripeness():
+    from services import explainability_service
+
+    def explain(name):
+        image = DecodedImage.from_bytes((backend_path / "images" / name).read_bytes())
+        image.gemini_input
+        start = time.perf_counter()
+        result = explainability_service.explain(image)
+        return result, time.perf_counter() - start
+
+    ripe, ripe_seconds = explain("ripe_banana.jpg")
+    unripe, unripe_seconds = explain("unripe_banana.jpg")
+
+    assert unripe["ripeness_score"] < ripe["ripeness_score"]
+    assert max(ripe_seconds, unripe_seconds) < 0.05
@@ -0,0 +1,115 @@
+"""
+Tests for the pantry CRUD routes and the expiring-soon query.
+"""
+
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from fastapi.testclient import TestClient
+
+from app import app
+from db import db_utils
+from routes import pantry
+from services.cache_service import analysis_cache
+
+DAY = db_utils.SECONDS_PER_DAY
+
+
+@pytest.fixture(autouse=True)
+def temp_db(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "DB_PATH", str(tmp_path / "pantry.sqlite"))
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _add(client, user_id="alice", **fields):
+    body = {"fruit_name": "banana", "ripeness": "ripe", **fields}
+    response = client.post(f"/pantry?user_id={user_id}", json=body)
+    assert response.status_code == 201
+    return response.json()
+
+
+def test_pantry_crud(client):
+    item = _add(client, days_until_discard=3, image_hash="abc")
+    assert item["expires_at"] == pytest.approx(item["scanned_at"] + 3 * DAY)
+    assert item["days_remaining"] == pytest.approx(3, abs=0.01)
+
+    response = client.patch(
+        f"/pantry/{item['id']}?user_id=alice",
+        json={"ripeness": "overripe", "days_until_discard": 1},
+    )
+    assert response.status_code == 200
+    updated = response.json()
+    assert updated["ripeness"] == "overripe"
+    assert updated["expires_at"] == pytest.approx(item["scanned_at"] + DAY)
+    assert updated["image_hash"] == "abc"
+
+    # Other users cannot see or delete it
+    assert client.get(f"/pantry/{item['id']}?user_id=bob").status_code == 404
+    assert client.delete(f"/pantry/{item['id']}?user_id=bob").status_code == 404
+
+    assert client.get("/pantry?user_id=alice").json()["count"] == 1
+    assert client.delete(f"/pantry/{item['id']}?user_id=alice").status_code == 204
+    assert client.get(f"/pantry/{item['id']}?user_id=alice").status_code == 404
+
+
+def test_expiring_soon_is_ordered_by_expiry(client):
+    now = time.time()
+    _add(client, fruit_name="apple", days_until_discard=10, scanned_at=now)
+    _add(client, fruit_name="mango", days_until_discard=1, scanned_at=now)
+    _add(client, fruit_name="pear", days_until_discard=2, scanned_at=now - 3 * DAY)
+    _add(client, fruit_name="plum")  # no estimate, never expires
+    _add(client, user_id="bob", fruit_name="kiwi", days_until_discard=0)
+
+    body = client.get("/pantry/expiring?user_id=alice&within_days=2").json()
+
+    assert [item["fruit_name"] for item in body["items"]] == ["pear", "mango"]
+    assert body["items"][0]["days_remaining"] < 0
+
+
+def test_scan_without_a_shelf_life_uses_the_freshness_estimate(client, monkeypatch):
+    async def analysis_without_days(image, include_safety=False):
+        return {"fruit_name": "banana", "ripeness": "ripe", "confidence": 90.0}
+
+    analysis_cache.clear()
+    monkeypatch.setattr(pantry, "analyze_image_async", analysis_without_days)
+    image_bytes = (backend_path / "images" / "ripe_banana.jpg").read_bytes()
+
+    response = client.post(
+        "/pantry/scan?user_id=alice",
+        files={"file": ("banana.jpg", image_bytes, "image/jpeg")},
+    )
+    analysis_cache.clear()
+
+    assert response.status_code == 201
+    item = response.json()
+    assert item["days_until_discard"] is not None
+    assert item["expires_at"] is not None
+    body = client.get("/pantry/expiring?user_id=alice&within_days=30").json()
+    assert [expiring["id"] for expiring in body["items"]] == [item["id"]]
+
+
+def test_expiring_query_uses_index():
+    plan = (
+        db_utils.get_connection()
+        .execute(
+            "EXPLAIN QUERY PLAN SELECT id FROM pantry_items"
+            " WHERE user_id = ? AND expires_at <= ? ORDER BY expires_at LIMIT ?",
+            ("alice", time.time(), 50),
+        )
+        .fetchall()
+    )
+    details = " ".join(row["detail"] for row in plan)
+
+    assert "idx_pantry_user_expires" in details
+    assert "TEMP B-TREE" not in details
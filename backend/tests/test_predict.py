@@ -0,0 +1,963 @@
+"""
+Tests for the /predict and /recipes routes.
+Gemini and Roboflow are replaced by in-process stand-ins, so no API keys
+or network access are needed.
+"""
+
+import asyncio
+import base64
+import json
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+from app import app
+from db import db_utils
+from models.freshness_model import estimate_freshness
+from routes import predict
+from services.image_pool import image_pool
+from services import (
+    circuit_breaker,
+    cv_service,
+    explainability_service,
+    gemini_service,
+    image_service,
+    latency_service,
+    nutrition_service,
+    rate_limiter,
+    recipe_service,
+    stage_classifier,
+    upload_service,
+)
+from services.cache_service import analysis_cache
+
+GEMINI_DELAY = 0.3
+
+
+class FakeResponse:
+    def __init__(self, text):
+        self.text = text
+
+
+class FakeGeminiModel:
+    """Answers each prompt type with a canned response after a fixed delay."""
+
+    def __init__(self, delay=GEMINI_DELAY):
+        self.delay = delay
+        self.calls = []
+
+    def _answer(self, contents):
+        prompt = contents[0] if isinstance(contents, list) else contents
+        self.calls.append(prompt[:40])
+        if prompt.startswith("You are given"):
+            count = len(contents) - 1
+            if "Identify the fruit in each image" in prompt:
+                return FakeResponse(json.dumps(["banana"] * count))
+            item = {"fruit_name": "banana", "ripeness": "ripe", "confidence": 80.0}
+            return FakeResponse(json.dumps([item] * count))
+        if prompt.startswith("Analyze this fruit image and identify"):
+            result = {"fruit_name": "banana", "ripeness": "ripe", "confidence": 88.0}
+            if "is_safe_to_eat" in prompt:
+                result.update(
+                    {
+                        "is_safe_to_eat": True,
+                        "days_until_discard": 4,
+                        "storage_tips": "Cool",
+                    }
+                )
+            return FakeResponse(json.dumps(result))
+        if prompt.startswith("Identify the fruit"):
+            return FakeResponse("banana")
+        if prompt.startswith("Analyze this fruit image and determine"):
+            return FakeResponse(
+                '{"fruit_name": "banana", "ripeness": "ripe", "confidence": 88.0}'
+            )
+        if prompt.startswith("Provide nutritional information"):
+            return FakeResponse(
+                json.dumps(
+                    {
+                        "fruit_name": "banana",
+                        "nutrition": {"calories": 105},
+                        "health_benefits": ["Potassium"],
+                        "environmental_impact": {"carbon_footprint_kg": 0.7},
+                        "waste_reduction_tip": "Freeze it",
+                    }
+                )
+            )
+        return FakeResponse(
+            json.dumps(
+                {
+                    "fruit_name": "banana",
+                    "ripeness": "ripe",
+                    "is_safe_to_eat": True,
+                    "days_until_discard": 3,
+                    "storage_tips": "Keep at room temperature",
+                    "recipes": [{"name": "Banana Bread"}],
+                }
+            )
+        )
+
+    def generate_content(self, contents, **kwargs):
+        time.sleep(self.delay)
+        return self._answer(contents)
+
+    async def generate_content_async(self, contents, **kwargs):
+        await asyncio.sleep(self.delay)
+        return self._answer(contents)
+
+
+@pytest.fixture
+def fake_model(monkeypatch):
+    fake = FakeGeminiModel()
+    monkeypatch.setattr(gemini_service, "model", fake)
+    monkeypatch.setattr(cv_service, "CLIENT", None)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path, monkeypatch):
+    analysis_cache.clear()
+    nutrition_service.clear_memory()
+    recipe_service.clear_memory()
+    latency_service.reset_trackers()
+    circuit_breaker.reset_breakers()
+    rate_limiter.reset_limiters()
+    monkeypatch.setattr(db_utils, "DB_PATH", str(tmp_path / "freshcam.sqlite"))
+    monkeypatch.setattr(
+        nutrition_service, "NUTRITION_SEED_PATH", str(tmp_path / "no_seed.json")
+    )
+    monkeypatch.setattr(
+        recipe_service, "RECIPE_SEED_PATH", str(tmp_path / "no_seed.json")
+    )
+    yield
+    analysis_cache.clear()
+    nutrition_service.clear_memory()
+    recipe_service.clear_memory()
+
+
+@pytest.fixture
+def client():
+    return TestClient(app)
+
+
+def _image_bytes(name="ripe_banana.jpg"):
+    return (backend_path / "images" / name).read_bytes()
+
+
+def test_predict_returns_analysis_and_nutrition(fake_model, client):
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["fruit_name"] == "banana"
+    assert body["ripeness"] == "ripe"
+    assert body["source"] == "gemini_primary"
+    assert body["nutrition"] == {"calories": 105}
+
+
+def test_predict_fans_out_remote_calls_concurrently(fake_model, client):
+    start = time.perf_counter()
+    response = client.post(
+        "/predict?include_recipes=true",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+    elapsed = time.perf_counter() - start
+
+    assert response.status_code == 200
+    assert response.json()["recipes"] == [{"name": "Banana Bread"}]
+    # One combined name + ripeness call, then nutrition + recipes concurrently
+    assert len(fake_model.calls) == 3
+    assert elapsed < GEMINI_DELAY * 3
+
+
+def test_recipes_route(fake_model, client):
+    response = client.post(
+        "/recipes", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.status_code == 200
+    # Safety is judged from the photo by the analysis prompt
+    assert response.json()["days_until_discard"] == 4
+    assert response.json()["recipes"] == [{"name": "Banana Bread"}]
+
+
+def test_predict_decodes_upload_once(fake_model, client, monkeypatch):
+    from services import image_service
+
+    decoded = []
+    real_decode = image_service.decode_rgb
+
+    def counting_decode(image_bytes):
+        decoded.append(image_bytes)
+        return real_decode(image_bytes)
+
+    # The upload limits only peek at the header; pixels are decoded once
+    monkeypatch.setattr(image_service, "decode_rgb", counting_decode)
+
+    response = client.post(
+        "/predict?include_recipes=true",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    assert len(decoded) == 1
+
+
+def test_repeat_scan_is_served_from_cache(fake_model, client):
+    from io import BytesIO
+
+    from PIL import Image
+
+    original = _image_bytes()
+    client.post("/predict", files={"file": ("banana.jpg", original, "image/jpeg")})
+    calls_after_first = len(fake_model.calls)
+
+    # Same photo re-encoded at a different quality: different bytes, same fruit
+    buffer = BytesIO()
+    Image.open(BytesIO(original)).save(buffer, format="JPEG", quality=60)
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", buffer.getvalue(), "image/jpeg")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["ripeness"] == "ripe"
+    # Analysis comes from the image cache, nutrition from the nutrition store
+    assert len(fake_model.calls) == calls_after_first
+    stats = client.get("/cache/stats").json()
+    # One hit for the analysis, one for the explanation cached beside it
+    assert stats["perceptual_hits"] == 2
+
+
+def test_recolored_scan_misses_the_cache():
+    from io import BytesIO
+
+    import numpy as np
+    from PIL import Image, ImageEnhance
+
+    original = image_service.DecodedImage(_image_bytes())
+    analysis_cache.set(original, {"ripeness": "ripe"})
+
+    def jpeg(image):
+        buffer = BytesIO()
+        image.save(buffer, format="JPEG", quality=90)
+        return image_service.DecodedImage(buffer.getvalue())
+
+    pixels = Image.open(BytesIO(_image_bytes())).convert("RGB")
+    hsv = np.asarray(pixels.convert("HSV")).copy()
+    # Hue +30 degrees: the same banana, still green
+    hsv[..., 0] = (hsv[..., 0].astype(int) + 21) % 256
+    greener = jpeg(Image.fromarray(hsv, "HSV").convert("RGB"))
+    browner = jpeg(ImageEnhance.Brightness(pixels).enhance(0.45))
+    reencoded = jpeg(pixels)
+
+    for recolored in (greener, browner):
+        # The grayscale hash alone would call these the same photo
+        distance = (recolored.dhash ^ original.dhash).bit_count()
+        assert distance <= analysis_cache.phash_distance
+        assert analysis_cache.get(recolored) is None
+    assert analysis_cache.get(reencoded) == {"ripeness": "ripe"}
+
+
+def test_nutrition_is_served_from_store_without_gemini(fake_model, client, monkeypatch):
+    monkeypatch.setattr(
+        nutrition_service,
+        "NUTRITION_SEED_PATH",
+        str(backend_path / "db" / "nutrition_seed.json"),
+    )
+
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.status_code == 200
+    assert response.json()["nutrition"]["potassium_mg"] == 422
+    assert not any(c.startswith("Provide nutritional") for c in fake_model.calls)
+
+
+def test_confident_local_classifier_skips_remote_ripeness(
+    fake_model, client, monkeypatch
+):
+    monkeypatch.setattr(stage_classifier, "STAGE_CLASSIFIER_ENABLED", True)
+
+    response = client.post(
+        "/predict",
+        files={"file": ("banana.jpg", _image_bytes("unripe_banana.jpg"), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["ripeness"] == "unripe"
+    assert body["source"] == "local_classifier"
+    assert fake_model.calls[0].startswith("Identify the fruit")
+    assert not any(c.startswith("Analyze this fruit") for c in fake_model.calls)
+
+
+def test_predict_batch_dedupes_and_streams_ndjson(fake_model, client, monkeypatch):
+    monkeypatch.setattr(stage_classifier, "STAGE_CLASSIFIER_ENABLED", True)
+    banana = _image_bytes()
+    files = [
+        ("files", ("a.jpg", banana, "image/jpeg")),
+        ("files", ("b.jpg", banana, "image/jpeg")),
+        ("files", ("c.jpg", _image_bytes("ripe_mango.jpg"), "image/jpeg")),
+        ("files", ("d.jpg", _image_bytes("unripe_banana.jpg"), "image/jpeg")),
+        ("files", ("e.jpg", _image_bytes("ripe_apple.jpg"), "image/jpeg")),
+        ("files", ("f.jpg", b"not an image", "image/jpeg")),
+    ]
+
+    response = client.post("/predict/batch?include_nutrition=false", files=files)
+
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    by_index = {line["index"]: line for line in lines}
+    assert sorted(by_index) == [0, 1, 2, 3, 4, 5]
+    assert by_index[5]["error"] == "Could not decode image"
+    assert by_index[0] == {**by_index[1], "index": 0, "filename": "a.jpg"}
+    # The three images the local classifier is sure about share one name
+    # prompt; the duplicated banana is analyzed once
+    assert len(fake_model.calls) == 2
+    assert sum(c.startswith("You are given") for c in fake_model.calls) == 1
+
+
+def test_predict_stream_emits_stages_in_order(fake_model, client):
+    response = client.post(
+        "/predict/stream?include_recipes=true",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    events = [json.loads(line) for line in response.text.splitlines()]
+    names = [event["event"] for event in events]
+    assert names[0] == "analysis"
+    assert events[0]["data"]["fruit_name"] == "banana"
+    assert names[-1] == "done"
+    assert "nutrition" in names
+    recipes = events[names.index("recipes")]["data"]
+    assert recipes["recipes"] == [{"name": "Banana Bread"}]
+    assert recipes["days_until_discard"] == 4
+
+
+def test_predict_stream_reports_a_failing_stage(fake_model, client, monkeypatch):
+    async def broken_nutrition(fruit_name, ripeness="ripe"):
+        raise RuntimeError("nutrition store unavailable")
+
+    monkeypatch.setattr(predict, "get_nutrition_async", broken_nutrition)
+
+    response = client.post(
+        "/predict/stream?include_recipes=true",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    events = [json.loads(line) for line in response.text.splitlines()]
+    names = [event["event"] for event in events]
+    assert {
+        "event": "error",
+        "stage": "nutrition",
+        "error": "nutrition store unavailable",
+    } in events
+    # The other stage still arrives and the stream ends normally
+    assert "recipes" in names
+    assert names[-1] == "done"
+
+
+def test_recipes_route_identifies_fruit_with_one_call(fake_model, client):
+    client.post(
+        "/recipes", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert len(fake_model.calls) == 2
+
+
+def test_recipes_are_served_from_library_without_gemini(
+    fake_model, client, monkeypatch
+):
+    monkeypatch.setattr(
+        recipe_service,
+        "RECIPE_SEED_PATH",
+        str(backend_path / "db" / "recipe_seed.json"),
+    )
+
+    response = client.post(
+        "/predict?include_recipes=true&include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["recipes"][0]["name"] == "Peanut Butter Banana Toast"
+    assert body["days_until_discard"] == 4
+    # Only the short analysis prompt, which also carries the safety fields
+    assert len(fake_model.calls) == 1
+
+
+def test_unknown_ripeness_is_never_stored_in_the_libraries(fake_model):
+    recipes = asyncio.run(recipe_service.get_recipes_async("banana", "unknown"))
+    nutrition = asyncio.run(nutrition_service.get_nutrition_async("banana", "unknown"))
+
+    assert "error" in recipes
+    assert "error" in nutrition
+    assert fake_model.calls == []
+    assert db_utils.get_library_entry("recipe_library", "banana", "unknown") is None
+    assert db_utils.get_library_entry("nutrition_cache", "banana", "unknown") is None
+
+
+def test_generated_recipes_are_written_back_to_library(fake_model, client):
+    client.post(
+        "/recipes", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+    assert sum(c.startswith("Suggest storage tips") for c in fake_model.calls) == 1
+    assert db_utils.get_library_entry("recipe_library", "banana", "ripe")[0][
+        "recipes"
+    ] == [{"name": "Banana Bread"}]
+
+    # A different photo of the same fruit and ripeness reuses the entry
+    recipe_service.clear_memory()
+    response = client.post(
+        "/recipes",
+        files={"file": ("mango.jpg", _image_bytes("ripe_mango.jpg"), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    assert sum(c.startswith("Suggest storage tips") for c in fake_model.calls) == 1
+
+
+def test_predict_safety_comes_from_analysis_call(fake_model, client):
+    response = client.post(
+        "/predict?include_safety=true&include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    body = response.json()
+    assert body["days_until_discard"] == 4
+    assert body["is_safe_to_eat"] is True
+    assert len(fake_model.calls) == 1
+
+
+def test_metrics_endpoint_reports_stages_and_sources(fake_model, client):
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+    assert response.status_code == 200
+    assert "gemini_analysis;dur=" in response.headers["Server-Timing"]
+
+    metrics = client.get("/metrics")
+
+    assert metrics.status_code == 200
+    assert metrics.headers["content-type"].startswith("text/plain")
+    body = metrics.text
+    assert "# TYPE freshcam_stage_duration_seconds histogram" in body
+    assert 'freshcam_stage_duration_seconds_count{stage="image_decode"}' in body
+    assert 'freshcam_stage_duration_seconds_count{stage="parse_analysis"}' in body
+    assert 'freshcam_predictions_total{source="gemini_primary"}' in body
+    assert 'freshcam_cache_lookups_total{namespace="analysis",result="miss"}' in body
+    assert 'route="/predict",status="200"' in body
+
+
+class SlowRoboflowClient:
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = False
+
+    async def infer_async(self, image, model_id=None):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return {"predictions": [{"class": "banana ripe", "confidence": 0.9}]}
+
+
+def _prime_latency(stage, seconds):
+    tracker = latency_service.latency_tracker(stage)
+    for _ in range(latency_service.LATENCY_MIN_SAMPLES):
+        tracker.record(seconds)
+
+
+def test_slow_roboflow_is_hedged_with_gemini(fake_model, client, monkeypatch):
+    roboflow = SlowRoboflowClient(delay=3)
+    monkeypatch.setattr(cv_service, "CLIENT", roboflow)
+    monkeypatch.setattr(cv_service, "_classify_locally", lambda image: None)
+    _prime_latency("roboflow_infer", 0.05)
+
+    start = time.perf_counter()
+    response = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+    elapsed = time.perf_counter() - start
+
+    assert response.json()["source"] == "gemini_fallback"
+    assert roboflow.cancelled
+    assert elapsed < 1.5
+
+
+def test_fast_roboflow_is_not_hedged(fake_model, client, monkeypatch):
+    monkeypatch.setattr(cv_service, "CLIENT", SlowRoboflowClient(delay=0.4))
+    monkeypatch.setattr(cv_service, "_classify_locally", lambda image: None)
+    _prime_latency("roboflow_infer", 0.5)
+
+    response = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.json()["source"] == "cv_model"
+
+
+def test_failed_hedge_is_not_counted_as_a_roboflow_win(fake_model, client, monkeypatch):
+    from services.metrics_service import HEDGES
+
+    async def failing_gemini(image, include_safety=False):
+        await asyncio.sleep(0.05)
+        return {"error": "Gemini unavailable"}
+
+    monkeypatch.setattr(cv_service, "CLIENT", SlowRoboflowClient(delay=0.4))
+    monkeypatch.setattr(cv_service, "analyze_fruit_with_gemini_async", failing_gemini)
+    monkeypatch.setattr(cv_service, "_classify_locally", lambda image: None)
+    _prime_latency("roboflow_infer", 0.01)
+    roboflow_wins = HEDGES.value(winner="roboflow")
+    failed = HEDGES.value(winner="hedge_failed")
+
+    response = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.json()["source"] == "cv_model"
+    assert HEDGES.value(winner="roboflow") == roboflow_wins
+    assert HEDGES.value(winner="hedge_failed") == failed + 1
+
+
+def test_gemini_call_times_out_adaptively(fake_model, client, monkeypatch):
+    # Recent Gemini calls took ~20ms, so a 300ms call is abandoned at the
+    # backend minimum timeout
+    monkeypatch.setitem(latency_service.BACKEND_TIMEOUTS, "gemini", (30, 0.1, 60))
+    _prime_latency("gemini_analysis", 0.02)
+
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.json() == {"error": "Gemini analysis failed"}
+    tracker = latency_service.latency_tracker("gemini_analysis")
+    assert tracker.percentile(99) == pytest.approx(0.1)
+
+
+class FailingRoboflowClient:
+    def __init__(self):
+        self.calls = 0
+
+    async def infer_async(self, image, model_id=None):
+        self.calls += 1
+        raise ConnectionError("Roboflow is down")
+
+
+def test_roboflow_circuit_opens_and_skips_to_fallback(fake_model, client, monkeypatch):
+    roboflow = FailingRoboflowClient()
+    monkeypatch.setattr(cv_service, "CLIENT", roboflow)
+    monkeypatch.setattr(cv_service, "_classify_locally", lambda image: None)
+    monkeypatch.setattr(analysis_cache, "max_entries", 0)
+
+    for _ in range(circuit_breaker.CIRCUIT_MIN_CALLS + 2):
+        response = client.post(
+            "/predict?include_nutrition=false",
+            files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+        )
+        assert response.json()["source"] == "gemini_fallback"
+
+    # Once open, requests stop reaching Roboflow at all
+    assert roboflow.calls == circuit_breaker.CIRCUIT_MIN_CALLS
+    health = client.get("/health").json()
+    assert health["status"] == "degraded"
+    assert health["breakers"]["roboflow"]["state"] == "open"
+
+
+def test_circuit_breaker_half_open_probe():
+    breaker = circuit_breaker.CircuitBreaker(
+        "test", min_calls=2, failure_rate=0.5, open_seconds=0.05
+    )
+    breaker.acquire()
+    breaker.record_failure()
+    breaker.acquire()
+    breaker.record_failure()
+    assert breaker.state == "open"
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        breaker.acquire()
+
+    time.sleep(0.06)
+    breaker.acquire()  # the single half-open probe
+    with pytest.raises(circuit_breaker.CircuitOpenError):
+        breaker.acquire()
+    breaker.record_success()
+
+    assert breaker.state == "closed"
+    breaker.acquire()
+
+
+def test_identical_concurrent_requests_share_one_pipeline(fake_model):
+    import httpx
+
+    async def send_all():
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://test"
+        ) as async_client:
+            return await asyncio.gather(
+                *(
+                    async_client.post(
+                        "/predict?include_recipes=true",
+                        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+                    )
+                    for _ in range(5)
+                )
+            )
+
+    responses = asyncio.run(send_all())
+
+    assert all(response.status_code == 200 for response in responses)
+    assert all(response.json()["recipes"] for response in responses)
+    # One analysis, one nutrition and one recipe call for all five requests
+    assert len(fake_model.calls) == 3
+
+
+def test_full_image_pool_answers_503_with_retry_after(fake_model, client, monkeypatch):
+    monkeypatch.setattr(image_pool, "max_pending", 0)
+
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.status_code == 503
+    assert response.headers["Retry-After"] == "1"
+    assert fake_model.calls == []
+
+
+def test_oversized_upload_is_refused_before_analysis(fake_model, client, monkeypatch):
+    monkeypatch.setattr(upload_service, "MAX_UPLOAD_BYTES", 1024)
+
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    # Content-Length is over the limit, so the body is never parsed
+    assert response.status_code == 413
+    assert fake_model.calls == []
+
+
+def test_chunked_upload_is_cut_off_at_the_limit(fake_model, client, monkeypatch):
+    monkeypatch.setattr(upload_service, "MAX_UPLOAD_BYTES", 1024)
+
+    def body():
+        yield b'--b\r\nContent-Disposition: form-data; name="file"; filename="a.jpg"'
+        yield b"\r\nContent-Type: image/jpeg\r\n\r\n"
+        for _ in range(1000):
+            yield b"\xff" * 1024
+
+    response = client.post(
+        "/predict",
+        content=body(),
+        headers={"Content-Type": "multipart/form-data; boundary=b"},
+    )
+
+    assert response.status_code == 413
+    assert fake_model.calls == []
+
+
+def test_decompression_bomb_is_refused_from_the_header(fake_model, client, monkeypatch):
+    monkeypatch.setattr(image_service, "MAX_IMAGE_PIXELS", 1000)
+    decoded = []
+    monkeypatch.setattr(
+        image_service, "decode_rgb", lambda image_bytes: decoded.append(1)
+    )
+
+    response = client.post(
+        "/recipes", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    assert response.status_code == 413
+    assert "pixels" in response.json()["detail"]
+    assert decoded == []
+    assert fake_model.calls == []
+
+
+def test_upload_limit_stops_reading_the_body_at_the_limit(monkeypatch):
+    monkeypatch.setattr(upload_service, "MAX_UPLOAD_BYTES", 1024)
+    chunks = [b"x" * 32 * 1024] * 10
+    received = []
+
+    async def receive():
+        received.append(1)
+        return {"type": "http.request", "body": chunks.pop(), "more_body": True}
+
+    async def app(scope, receive, send):
+        while True:
+            await receive()
+
+    middleware = upload_service.UploadLimitMiddleware(app)
+    scope = {"type": "http", "path": "/predict", "headers": []}
+
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(middleware(scope, receive, None))
+
+    assert error.value.status_code == 413
+    assert len(received) == 3
+
+
+class FruitBowlRoboflowClient:
+    """Three detections in letterboxed 640x640 coordinates."""
+
+    async def infer_async(self, image, model_id=None):
+        return {
+            "predictions": [
+                {
+                    "class": "banana ripe",
+                    "confidence": 0.7,
+                    "x": 160,
+                    "y": 320,
+                    "width": 200,
+                    "height": 120,
+                },
+                {
+                    "class": "banana overripe",
+                    "confidence": 0.9,
+                    "x": 480,
+                    "y": 320,
+                    "width": 200,
+                    "height": 120,
+                },
+                {
+                    "class": "banana unripe",
+                    "confidence": 0.1,
+                    "x": 320,
+                    "y": 320,
+                    "width": 50,
+                    "height": 50,
+                },
+            ]
+        }
+
+
+def test_multi_mode_returns_every_detection_named_in_one_call(
+    fake_model, client, monkeypatch
+):
+    monkeypatch.setattr(cv_service, "CLIENT", FruitBowlRoboflowClient())
+
+    response = client.post(
+        "/predict?multi=true&include_nutrition=false",
+        files={"file": ("bowl.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    # The low-confidence detection is dropped; the best one leads
+    assert [d["ripeness"] for d in body["detections"]] == ["overripe", "ripe"]
+    assert body["ripeness"] == "overripe"
+    assert body["source"] == "cv_model"
+    assert all(d["fruit_name"] == "banana" for d in body["detections"])
+    right, left = (d["box"] for d in body["detections"])
+    assert left["x_min"] < left["x_max"] < right["x_min"] < right["x_max"]
+    assert 0.0 <= left["x_min"] and right["x_max"] <= 1.0
+    # Both crops are named by a single multi-image prompt
+    assert fake_model.calls == [fake_model.calls[0]]
+    assert fake_model.calls[0].startswith("You are given 2 images")
+
+
+def test_multi_mode_without_detections_covers_the_whole_image(fake_model, client):
+    response = client.post(
+        "/predict?multi=true&include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+
+    assert response.status_code == 200
+    body = response.json()
+    assert body["detections"] == [
+        {
+            "fruit_name": "banana",
+            "ripeness": body["ripeness"],
+            "confidence": body["confidence"],
+            "box": {"x_min": 0.0, "y_min": 0.0, "x_max": 1.0, "y_max": 1.0},
+        }
+    ]
+
+
+def test_explanation_is_included_and_heatmap_is_optional(fake_model, client):
+    from io import BytesIO
+
+    from PIL import Image
+
+    plain = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    ).json()
+    with_heatmap = client.post(
+        "/predict?include_nutrition=false&include_heatmap=true",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    ).json()
+
+    explanation = plain["explanation"]
+    assert 0.0 <= explanation["ripeness_score"] <= 1.0
+    assert 0.0 < explanation["fruit_coverage"] <= 1.0
+    assert "overlay_png" not in explanation
+
+    overlay = Image.open(
+        BytesIO(base64.b64decode(with_heatmap["explanation"]["overlay_png"]))
+    )
+    assert overlay.format == "PNG"
+    assert max(overlay.size) == explainability_service.EXPLAIN_MAX_SIDE
+    # The second request reuses the cached analysis and explanation
+    assert len(fake_model.calls) == 1
+
+
+def test_optional_sections_degrade_when_gemini_budget_is_low(
+    fake_model, client, monkeypatch
+):
+    limiter = rate_limiter.RateLimiter("gemini", rpm=1, burst=1, optional_reserve=0)
+    monkeypatch.setattr(gemini_service, "get_limiter", lambda name: limiter)
+
+    response = client.post(
+        "/predict", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    # The one token went to the analysis; nutrition is skipped, not fatal
+    assert response.status_code == 200
+    body = response.json()
+    assert body["fruit_name"] == "banana"
+    assert "nutrition" not in body
+    assert body["degraded"] == ["nutrition"]
+    assert len(fake_model.calls) == 1
+
+
+def test_recipes_route_is_served_when_only_core_budget_is_left(
+    fake_model, client, monkeypatch
+):
+    # The whole bucket is reserved for core calls
+    limiter = rate_limiter.RateLimiter(
+        "gemini", rpm=1, burst=2, optional_reserve=1, max_wait=0
+    )
+    monkeypatch.setattr(gemini_service, "get_limiter", lambda name: limiter)
+
+    response = client.post(
+        "/recipes", files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")}
+    )
+
+    # On /recipes the library lookup is the answer, not an optional section
+    assert response.status_code == 200
+    assert response.json()["recipes"] == [{"name": "Banana Bread"}]
+
+
+def test_open_circuit_does_not_spend_rate_limit_budget(fake_model, monkeypatch):
+    from services.circuit_breaker import CircuitOpenError
+
+    limiter = rate_limiter.RateLimiter("gemini", rpm=1, burst=1, max_wait=0)
+    monkeypatch.setattr(gemini_service, "get_limiter", lambda name: limiter)
+    breaker = circuit_breaker.get_breaker("gemini_analysis")
+    for _ in range(breaker.min_calls):
+        breaker.record_failure()
+
+    with pytest.raises(CircuitOpenError):
+        asyncio.run(gemini_service._generate_async("gemini_analysis", "prompt"))
+    with pytest.raises(CircuitOpenError):
+        gemini_service._generate("gemini_analysis", "prompt")
+
+    assert limiter.bucket.tokens() == pytest.approx(1.0)
+    assert fake_model.calls == []
+
+
+def test_predict_estimates_freshness_without_a_model_call(fake_model, client):
+    room = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    ).json()
+    fridge = client.post(
+        "/predict?include_nutrition=false&storage=fridge",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    ).json()
+
+    assert room["freshness"]["storage"] == "room"
+    assert fridge["freshness"]["days_remaining"] > room["freshness"]["days_remaining"]
+    assert room["freshness"]["decay_curve"][-1]["freshness"] == 0.0
+    # The second request is answered from the cached analysis
+    assert len(fake_model.calls) == 1
+
+    invalid = client.post(
+        "/predict?storage=freezer",
+        files={"file": ("banana.jpg", _image_bytes(), "image/jpeg")},
+    )
+    assert invalid.status_code == 422
+
+
+def test_local_classifier_stages_plain_colors():
+    from PIL import Image
+
+    colors = {
+        "unripe": (90, 160, 40),
+        "ripe": (230, 200, 40),
+        # Brown, as a banana past its prime
+        "overripe": (120, 70, 20),
+    }
+
+    for stage, color in colors.items():
+        result = stage_classifier.classify(Image.new("RGB", (64, 64), color))
+        assert result["ripeness"] == stage
+
+
+def test_zero_confidence_shortens_the_freshness_estimate(
+    fake_model, client, monkeypatch
+):
+    async def uncertain_analysis(image, include_safety=False):
+        return {
+            "fruit_name": "apple",
+            "ripeness": "ripe",
+            "confidence": 0.0,
+            "source": "gemini_primary",
+        }
+
+    monkeypatch.setattr(predict, "analyze_image_async", uncertain_analysis)
+    response = client.post(
+        "/predict?include_nutrition=false",
+        files={"file": ("apple.jpg", _image_bytes("ripe_apple.jpg"), "image/jpeg")},
+    )
+
+    expected = estimate_freshness("apple", "ripe", 0.0)
+    assert response.json()["freshness"]["days_remaining"] == expected["days_remaining"]
+
+
+def test_upload_spool_size_is_scoped_to_upload_routes():
+    import os
+    import subprocess
+
+    # A fresh interpreter with a non-default spool size: importing the app
+    # must leave Starlette's own parser alone
+    output = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import app; from starlette.formparsers import MultiPartParser;"
+            " from services.upload_service import SpooledMultiPartParser;"
+            " print(MultiPartParser.max_file_size, SpooledMultiPartParser.max_file_size)",
+        ],
+        cwd=backend_path,
+        env={**os.environ, "UPLOAD_SPOOL_BYTES": "12345"},
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    assert output.split()[-2:] == [str(1024 * 1024), "12345"]
+
+    upload_routes = {
+        route.path
+        for route in app.routes
+        if isinstance(route, upload_service.UploadRoute)
+    }
+    assert {"/predict", "/predict/batch", "/recipes"} <= upload_routes
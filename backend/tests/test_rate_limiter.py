@@ -0,0 +1,76 @@
+"""
+Tests for the client-side Gemini rate limiter.
+"""
+
+import asyncio
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from db import db_utils
+from services.rate_limiter import CORE, OPTIONAL, RateLimited, RateLimiter
+
+
+def test_optional_calls_leave_the_reserve_to_core_calls():
+    limiter = RateLimiter("test", rpm=1, burst=4, optional_reserve=0.5, max_wait=0)
+
+    async def scenario():
+        # Two optional calls fit above the reserve of two tokens
+        await limiter.acquire_async(OPTIONAL)
+        await limiter.acquire_async(OPTIONAL)
+        with pytest.raises(RateLimited):
+            await limiter.acquire_async(OPTIONAL)
+        # The reserve is still there for name/ripeness calls
+        await limiter.acquire_async(CORE)
+        await limiter.acquire_async(CORE)
+        with pytest.raises(RateLimited):
+            await limiter.acquire_async(CORE)
+
+    asyncio.run(scenario())
+    assert limiter.snapshot()["rejected"] == {CORE: 1, OPTIONAL: 1}
+
+
+def test_core_calls_wait_for_a_refill_and_block_optional_ones():
+    limiter = RateLimiter("test", rpm=600, burst=1, optional_reserve=0, max_wait=1)
+
+    async def scenario():
+        await limiter.acquire_async(CORE)
+        start = time.perf_counter()
+        waiting = asyncio.create_task(limiter.acquire_async(CORE))
+        await asyncio.sleep(0.01)
+        # A core call is queued, so optional calls are turned away
+        with pytest.raises(RateLimited):
+            await limiter.acquire_async(OPTIONAL)
+        await waiting
+        return time.perf_counter() - start
+
+    # One token every 0.1s at 600 per minute
+    assert 0.05 < asyncio.run(scenario()) < 0.5
+
+
+def test_upstream_429_drains_the_bucket():
+    limiter = RateLimiter("test", rpm=60, burst=10, max_wait=0)
+
+    limiter.backoff(seconds=5)
+
+    with pytest.raises(RateLimited):
+        limiter.acquire(CORE)
+
+
+def test_shared_bucket_is_one_budget_across_workers(tmp_path, monkeypatch):
+    monkeypatch.setattr(db_utils, "DB_PATH", str(tmp_path / "freshcam.sqlite"))
+    # Two limiters stand in for two worker processes using the same file
+    workers = [
+        RateLimiter("gemini", rpm=1, burst=3, max_wait=0, shared=True) for _ in range(2)
+    ]
+
+    for worker in (workers[0], workers[1], workers[0]):
+        worker.acquire(CORE)
+    with pytest.raises(RateLimited):
+        workers[1].acquire(CORE)
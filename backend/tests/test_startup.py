@@ -0,0 +1,81 @@
+"""
+Tests for cold start: importing the app must not load the upstream SDKs,
+and the clients are built lazily, once.
+"""
+
+import json
+import subprocess
+import sys
+import threading
+from pathlib import Path
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from services import cv_service, gemini_service
+
+# Generous on purpose: the SDKs alone used to add well over a second
+IMPORT_TIME_BUDGET_SECONDS = 2.0
+
+HEAVY_MODULES = ("google.generativeai", "httpx", "numpy")
+
+MEASURE_IMPORT = f"""
+import json, sys, time
+start = time.perf_counter()
+import app
+print(json.dumps({{
+    "seconds": time.perf_counter() - start,
+    "loaded": [name for name in {HEAVY_MODULES!r} if name in sys.modules],
+}}))
+"""
+
+
+def test_importing_the_app_skips_upstream_sdks():
+    # A fresh interpreter, so modules imported by other tests don't count
+    output = subprocess.run(
+        [sys.executable, "-c", MEASURE_IMPORT],
+        cwd=backend_path,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    measured = json.loads(output.strip().splitlines()[-1])
+    print(f"import app: {measured['seconds'] * 1000:.0f} ms")
+
+    assert measured["loaded"] == []
+    assert measured["seconds"] < IMPORT_TIME_BUDGET_SECONDS
+
+
+def test_clients_are_built_once_on_first_use(monkeypatch):
+    builds = []
+    barrier = threading.Barrier(4)
+
+    def build_model():
+        builds.append("gemini")
+        return object()
+
+    def build_client():
+        builds.append("roboflow")
+        return None
+
+    monkeypatch.setattr(gemini_service, "model", None)
+    monkeypatch.setattr(gemini_service, "_build_model", build_model)
+    monkeypatch.setattr(cv_service, "CLIENT", cv_service._UNINITIALIZED)
+    monkeypatch.setattr(cv_service, "_build_client", build_client)
+
+    def first_request():
+        barrier.wait()
+        gemini_service.get_model()
+        cv_service.get_client()
+
+    threads = [threading.Thread(target=first_request) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(builds) == ["gemini", "roboflow"]
+    # An unconfigured Roboflow stays None instead of being retried per call
+    assert cv_service.get_client() is None
+    assert builds.count("roboflow") == 1
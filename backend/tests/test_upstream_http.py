@@ -0,0 +1,109 @@
+"""
+Tests for the shared upstream HTTP pool and the Roboflow client on top of it.
+A local keep-alive server stands in for Roboflow's hosted API.
+"""
+
+import asyncio
+import base64
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# Add backend to path
+backend_path = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_path))
+
+from services import upstream_http
+from services.roboflow_client import RoboflowClient, RoboflowError
+
+
+class FakeRoboflowHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    connections = []
+
+    def setup(self):
+        super().setup()
+        self.connections.append(self.client_address)
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers["Content-Length"]))
+        image = base64.b64decode(body)
+        if image == b"broken":
+            status, payload = 500, {"message": "internal error"}
+        else:
+            status, payload = 200, {
+                "predictions": [{"class": "banana ripe", "confidence": 0.9}],
+                "path": self.path,
+                "size": len(image),
+            }
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def roboflow_server():
+    FakeRoboflowHandler.connections = []
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeRoboflowHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    upstream_http.reset_stats()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_sequential_calls_reuse_one_connection(roboflow_server):
+    client = RoboflowClient(roboflow_server, "secret-key")
+
+    async def scenario():
+        results = []
+        for _ in range(5):
+            results.append(await client.infer_async(b"jpeg", "fruit-ripeness/2"))
+        await upstream_http.aclose()
+        return results
+
+    results = asyncio.run(scenario())
+
+    assert results[0]["predictions"][0]["class"] == "banana ripe"
+    assert results[0]["path"] == "/fruit-ripeness/2?api_key=secret-key"
+    assert results[0]["size"] == len(b"jpeg")
+    assert len(FakeRoboflowHandler.connections) == 1
+    stats = upstream_http.pool_stats()["requests"]["roboflow"]
+    assert (stats["new"], stats["reused"]) == (1, 4)
+
+
+def test_blocking_and_batched_calls_share_the_pool(roboflow_server):
+    client = RoboflowClient(roboflow_server, "secret-key")
+
+    first = client.infer(b"one", "fruit-ripeness/2")
+    second = client.infer([b"two", b"three"], "fruit-ripeness/2")
+
+    assert first["size"] == 3
+    assert [result["size"] for result in second] == [3, 5]
+    assert len(FakeRoboflowHandler.connections) == 1
+    stats = upstream_http.pool_stats()
+    assert stats["connections"]["idle"] == 1
+    assert stats["requests"]["roboflow"]["reuse_ratio"] == pytest.approx(2 / 3, 0.01)
+    asyncio.run(upstream_http.aclose())
+
+
+def test_error_status_does_not_leak_the_api_key(roboflow_server):
+    client = RoboflowClient(roboflow_server, "secret-key")
+
+    with pytest.raises(RoboflowError) as error:
+        client.infer(b"broken", "fruit-ripeness/2")
+
+    assert "500" in str(error.value)
+    assert "secret-key" not in str(error.value)
+    asyncio.run(upstream_http.aclose())